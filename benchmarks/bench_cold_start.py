@@ -0,0 +1,146 @@
+"""Cold-start benchmark for the Django backend's serverless entry point.
+
+Every run is a fresh interpreter, as on a Vercel cold start. It loads
+``spentbackend/wsgi.py`` under one settings profile and sends requests
+straight through the WSGI callable:
+
+1. a profile read with a stored auth token, the usual first request when an
+   app reopens (needs Mongo, not Firebase);
+2. a first login (initializes Firebase);
+3. a second login, as a warm invocation would.
+
+It reports the median and p90 across runs of each step, the whole process
+wall time, and the number of modules imported before the first request.
+
+    python benchmarks/bench_cold_start.py                       # settings vs settings_api, 10 runs each
+    python benchmarks/bench_cold_start.py --runs 30 --output cold_start.json
+    python benchmarks/bench_cold_start.py --mongo-uri mongodb://localhost:27017
+
+Firebase and MongoDB are replaced by the stand-ins from loadtest.py (Auth-emulator
+ID tokens and ``MONGO_URI=memory://``) unless ``--mongo-uri`` points at a server,
+so the numbers measure the app's own start-up, not the network.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+PROFILES = ("spentbackend.settings", "spentbackend.settings_api")
+METRICS = ("process_ms", "app_load_ms", "first_request_ms", "first_login_ms", "warm_login_ms", "modules")
+
+
+def wsgi_request(application, method: str, path: str, body: dict = None, headers: dict = None):
+    """Send one request through a WSGI callable; returns (status, body bytes, milliseconds)."""
+    from wsgiref.util import setup_testing_defaults
+
+    payload = json.dumps(body).encode() if body is not None else b""
+    environ = {}
+    setup_testing_defaults(environ)
+    environ.update({
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)), 'wsgi.input': io.BytesIO(payload),
+    })
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    status = []
+    start = time.perf_counter()
+    response = application(environ, lambda line, response_headers, exc_info=None: status.append(line))
+    try:
+        content = b"".join(response)
+    finally:
+        if hasattr(response, 'close'):
+            response.close()
+    return int(status[0].split()[0]), content, (time.perf_counter() - start) * 1000
+
+
+def child():
+    # One cold start: the parent passes the settings profile, an auth token and two ID tokens in the environment
+    sys.path.insert(0, os.path.join(ROOT_DIR, "spentbackend"))
+    start = time.perf_counter()
+    from spentbackend.wsgi import application
+    app_load_ms = (time.perf_counter() - start) * 1000
+    modules = len(sys.modules)
+
+    headers = {'Authorization': f"Bearer {os.environ['BENCH_AUTH_TOKEN']}"}
+    status, _, first_request_ms = wsgi_request(application, 'GET', '/profile/profile-get/', headers=headers)
+    if status not in (200, 404):
+        raise SystemExit(f"profile read failed: {status}")
+    status, content, first_login_ms = wsgi_request(application, 'POST', '/login/login/', {'id_token': os.environ['BENCH_ID_TOKEN']})
+    if status != 200:
+        raise SystemExit(f"login failed: {status} {content[:200]!r}")
+    _, _, warm_login_ms = wsgi_request(application, 'POST', '/login/login/', {'id_token': os.environ['BENCH_ID_TOKEN_2']})
+
+    print(json.dumps({
+        'app_load_ms': app_load_ms, 'first_request_ms': first_request_ms, 'first_login_ms': first_login_ms,
+        'warm_login_ms': warm_login_ms, 'modules': modules,
+    }))
+
+
+def run_profile(profile: str, runs: int, env: dict):
+    import jwt
+    from loadtest import fake_id_token
+
+    samples = []
+    for run in range(runs):
+        auth_token = jwt.encode({'email': f"cold-{run}@loadtest.local", 'uid': f"cold-{run}"}, env['JWT_SECRET_KEY'], algorithm="HS256")
+        run_env = dict(env, DJANGO_SETTINGS_MODULE=profile, BENCH_AUTH_TOKEN=auth_token,
+                       BENCH_ID_TOKEN=fake_id_token(f"cold-{run}", f"cold-{run}@loadtest.local"),
+                       BENCH_ID_TOKEN_2=fake_id_token(f"warm-{run}", f"warm-{run}@loadtest.local"))
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"], env=run_env,
+                                cwd=os.path.join(ROOT_DIR, "spentbackend"), capture_output=True, text=True)
+        process_ms = (time.perf_counter() - start) * 1000
+        if output.returncode != 0:
+            raise RuntimeError(f"{profile} run {run} failed:\n{output.stderr or output.stdout}")
+        sample = json.loads(output.stdout.strip().splitlines()[-1])
+        sample['process_ms'] = process_ms
+        samples.append(sample)
+    return samples
+
+
+def summarize(samples):
+    summary = {}
+    for metric in METRICS:
+        values = sorted(sample[metric] for sample in samples)
+        p90 = values[min(len(values) - 1, int(round(0.9 * (len(values) - 1))))]
+        summary[metric] = {'median': round(statistics.median(values), 2), 'p90': round(p90, 2)}
+    return summary
+
+
+def main():
+    if "--child" in sys.argv:
+        return child()
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts per settings profile")
+    parser.add_argument("--profile", action="append", help=f"Settings module to measure (repeatable; default: {', '.join(PROFILES)})")
+    parser.add_argument("--mongo-uri", default="memory://", help="memory:// (default) or a MongoDB server")
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    sys.path.insert(0, BENCH_DIR)
+    from loadtest import stand_in_env
+
+    env = dict(os.environ, **stand_in_env(args.mongo_uri))
+    results = {}
+    print(f"{'profile':28} {'metric':18} {'median':>10} {'p90':>10}")
+    for profile in args.profile or PROFILES:
+        results[profile] = summarize(run_profile(profile, args.runs, env))
+        for metric, stats in results[profile].items():
+            unit = "" if metric == "modules" else " ms"
+            print(f"{profile:28} {metric:18} {stats['median']:>8.1f}{unit:3} {stats['p90']:>8.1f}{unit:3}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'runs': args.runs, 'mongo_uri': args.mongo_uri, 'profiles': results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
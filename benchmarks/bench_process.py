@@ -0,0 +1,191 @@
+"""Per-stage benchmark for the /process pipeline.
+
+Runs the pose worker's own code, ``pose_pool._estimate`` (decode, ROI crop and
+downscale, BGR to RGB conversion, pose.process, drawing, JPEG encode, hex
+serialization, motion gate),
+in this process on the checked-in fixtures, for every enabled quality tier
+(``POSE_TIERS``). Each frame is timed on the full frame, on the ROI tracked from
+the previous frame, and through the motion gate's skip path. The per-stage
+timings come from the worker's own timers. The exercise rules are timed on a
+landmark sequence. Reports p50/p95/p99 latency per stage, plus peak Python memory
+per scenario, and compares against a stored baseline.
+
+    python benchmarks/bench_process.py                     # compare against baseline.json
+    python benchmarks/bench_process.py --update-baseline   # record a new baseline
+
+Baselines are machine-specific: record one on the machine (or CI runner) that
+runs the comparison. The script exits with status 1 if any stage's p50 (and
+p95 with --strict) is slower than the baseline by more than --tolerance and
+--min-delta-ms, or if a scenario's peak memory grew by more than
+--memory-tolerance and --min-delta-kib.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+
+import pose_pool  # noqa: E402
+from exercise import Exercise  # noqa: E402
+
+IMAGE_FIXTURES = {"480p": "frame_480p.jpg", "1080p": "frame_1080p.jpg"}
+JPEG_QUALITY = 95
+
+
+def build_scenarios(sequence: np.ndarray):
+    """Return {name: zero-argument callable}; callables returning a worker result report its stage timings."""
+    estimate = pose_pool._estimate
+    scenarios = {}
+    for name, filename in IMAGE_FIXTURES.items():
+        with open(os.path.join(FIXTURES_DIR, filename), "rb") as f:
+            contents = f.read()
+        for tier in pose_pool.ENABLED_TIERS:
+            first = estimate(contents, tier=tier, image_format='none', motion_threshold=pose_pool.MOTION_THRESHOLD or 0.01)
+            if first['landmarks'] is None or first['roi'] is None:
+                raise SystemExit(f"No pose detected in {filename} with tier {tier}; regenerate the fixtures")
+            roi = first['roi']
+
+            scenarios[f"{name}:{tier}:full"] = lambda contents=contents, tier=tier: estimate(
+                contents, tier=tier, image_format='hex', jpeg_quality=JPEG_QUALITY)
+            scenarios[f"{name}:{tier}:roi"] = lambda contents=contents, tier=tier, roi=roi: estimate(
+                contents, tier=tier, image_format='hex', jpeg_quality=JPEG_QUALITY, roi=roi)
+
+        # A static frame: the motion gate skips inference and redraws the previous landmarks
+        scenarios[f"{name}:motion_skip"] = lambda contents=contents, first=first, roi=roi: estimate(
+            contents, image_format='hex', jpeg_quality=JPEG_QUALITY, roi=roi, motion_threshold=pose_pool.MOTION_THRESHOLD or 0.01,
+            motion_reference=first['thumbnail'], previous_landmarks=first['landmarks'])
+        if not scenarios[f"{name}:motion_skip"]()['skipped']:
+            raise SystemExit(f"Motion gate did not skip an identical frame ({filename})")
+
+    exercise = Exercise()
+    frames = iter(())
+
+    def pushups():
+        nonlocal frames
+        frame = next(frames, None)
+        if frame is None:
+            frames = iter(sequence)
+            frame = next(frames)
+        exercise.evaluate(frame, 640, 480, reps=10 ** 9)
+
+    scenarios["landmarks:pushups"] = pushups
+    scenarios["landmarks:pushups_batch"] = lambda: Exercise().evaluate_batch(sequence, 640, 480, reps=10 ** 9)
+    return scenarios
+
+
+def percentiles(samples_ms):
+    p50, p95, p99 = np.percentile(samples_ms, [50, 95, 99])
+    return {'p50_ms': round(p50, 4), 'p95_ms': round(p95, 4), 'p99_ms': round(p99, 4)}
+
+
+def measure(fn, iterations: int, warmup: int):
+    """Return {stage: stats}: 'total' for the whole call plus the worker's own per-stage timings."""
+    for _ in range(warmup):
+        fn()
+    samples = {'total': []}
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        result = fn()
+        samples['total'].append((time.perf_counter_ns() - start) / 1e6)
+        for stage, seconds in (result.get('timings', {}) if isinstance(result, dict) else {}).items():
+            samples.setdefault(stage, []).append(seconds * 1000)
+
+    # Peak Python-visible allocation (NumPy and OpenCV buffers included) for one call
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = {stage: percentiles(values) for stage, values in samples.items()}
+    stats['total']['peak_kib'] = round(peak / 1024, 1)
+    return stats
+
+
+def compare(results, baseline, tolerance: float, min_delta_ms: float, keys=('p50_ms',),
+            memory_tolerance: float = 0.25, min_delta_kib: float = 64):
+    regressions = []
+    for stage, base in baseline.get('stages', {}).items():
+        current = results['stages'].get(stage)
+        if current is None:
+            continue
+        for key in keys:
+            # Sub-`min_delta_ms` differences are timer noise on microsecond stages
+            if current[key] > base[key] * (1 + tolerance) and current[key] - base[key] > min_delta_ms:
+                regressions.append(f"{stage} {key}: {current[key]:.3f} ms vs baseline {base[key]:.3f} ms")
+        if 'peak_kib' in base and 'peak_kib' in current:
+            # Peak memory is recorded once per scenario, on its 'total' entry
+            if (current['peak_kib'] > base['peak_kib'] * (1 + memory_tolerance)
+                    and current['peak_kib'] - base['peak_kib'] > min_delta_kib):
+                regressions.append(f"{stage} peak_kib: {current['peak_kib']:.1f} KiB vs baseline {base['peak_kib']:.1f} KiB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--stage", action="append", help="Only run stages containing this substring (repeatable)")
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown before failing (0.25 = 25%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1, help="Ignore slowdowns smaller than this")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25, help="Allowed peak memory growth (0.25 = 25%%)")
+    parser.add_argument("--min-delta-kib", type=float, default=64, help="Ignore peak memory growth smaller than this")
+    parser.add_argument("--strict", action="store_true", help="Gate on p95 as well as p50")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    sequence = np.load(os.path.join(FIXTURES_DIR, "pushup_landmarks.npy"))
+    # Load and warm each enabled tier's model exactly as a pose worker process does
+    pose_pool._init_worker()
+    scenarios = build_scenarios(sequence)
+    if args.stage:
+        scenarios = {name: fn for name, fn in scenarios.items() if any(s in name for s in args.stage)}
+
+    results = {'machine': platform.platform(), 'python': platform.python_version(),
+               'tiers': pose_pool.ENABLED_TIERS, 'stages': {}}
+    print(f"{'stage':34} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak KiB':>10}")
+    for name, fn in scenarios.items():
+        for stage, stats in measure(fn, args.iterations, args.warmup).items():
+            key = name if stage == 'total' and name.startswith('landmarks:') else f"{name}:{stage}"
+            results['stages'][key] = stats
+            peak = f"{stats['peak_kib']:10.1f}" if 'peak_kib' in stats else ""
+            print(f"{key:34} {stats['p50_ms']:9.3f} {stats['p95_ms']:9.3f} {stats['p99_ms']:9.3f} {peak}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance, args.min_delta_ms,
+                              ('p50_ms', 'p95_ms') if args.strict else ('p50_ms',),
+                              args.memory_tolerance, args.min_delta_kib)
+    if regressions:
+        print("\nREGRESSIONS (slower or larger than baseline beyond tolerance):")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("\nNo regressions against baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
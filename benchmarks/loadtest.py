@@ -0,0 +1,327 @@
+"""Offline load test for the FastAPI service and the Django backend.
+
+Replays a mix of virtual users against both apps and reports throughput,
+p50/p99 latency and error rate per endpoint:
+
+- ``login``: login bursts against Django ``/login/login/`` and FastAPI ``/login``;
+- ``profile``: a Django login, then profile writes, profile reads, stats and
+  leaderboard lookups with think time in between;
+- ``stream``: a FastAPI login, then ``/process`` frames at ``--fps`` in the
+  compact encoding (decoded with ``wire.decode_frame``), then a session reset.
+
+No Firebase project or MongoDB server is needed. The stand-ins are:
+
+- ID tokens: both apps are started with ``FIREBASE_AUTH_EMULATOR_HOST`` set.
+  In that mode ``firebase_admin`` accepts unsigned ID tokens offline, and this
+  script mints them with ``fake_id_token``.
+- MongoDB: ``MONGO_URI=memory://`` gives each app its own in-process store
+  (spentbackend/memory_mongo.py). Pass ``--mongo-uri mongodb://localhost:27017``
+  to share a local server instead.
+
+    python benchmarks/loadtest.py --spawn --users 50 --duration 60
+    python benchmarks/loadtest.py --spawn --mix login=1 --users 200 --ramp 2      # login burst
+    python benchmarks/loadtest.py --print-env        # env for services you start yourself
+    python benchmarks/loadtest.py --fastapi-url http://localhost:10000 --django-url http://localhost:8000
+
+Requires ``httpx`` (and ``cryptography`` to mint the throwaway service-account key).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import httpx
+import jwt
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+FIXTURES_DIR = os.path.join(BENCH_DIR, "fixtures")
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+sys.path.insert(0, os.path.join(ROOT_DIR, "spentbackend"))
+
+import wire  # noqa: E402
+
+FAKE_PROJECT_ID = "pushup-loadtest"
+PROFILE = {'gender': 'female', 'dob': '1995-06-01T00:00:00Z', 'height_feet': 5, 'height_inches': 6,
+           'weight': 60, 'weight_unit': 'kg'}
+
+
+def fake_id_token(uid: str, email: str, project_id: str = FAKE_PROJECT_ID) -> str:
+    """An unsigned Firebase ID token, accepted by verify_id_token in Auth-emulator mode."""
+    now = int(time.time())
+    claims = {
+        'iss': f'https://securetoken.google.com/{project_id}', 'aud': project_id,
+        'sub': uid, 'iat': now, 'auth_time': now, 'exp': now + 3600,
+        'email': email, 'name': uid, 'firebase': {'sign_in_provider': 'password', 'identities': {}},
+    }
+    return jwt.encode(claims, None, algorithm='none')
+
+
+def stand_in_env(mongo_uri: str) -> dict:
+    """Environment that points both apps at the local stand-ins."""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    # Both apps build a service-account credential at startup; with the emulator host set it never signs anything
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()).decode()
+    return {
+        'FIREBASE_AUTH_EMULATOR_HOST': 'localhost:9099',
+        'FIREBASE_PROJECT_ID': FAKE_PROJECT_ID,
+        'FIREBASE_PRIVATE_KEY_ID': 'loadtest',
+        'FIREBASE_PRIVATE_KEY': key.replace('\n', '\\n'),
+        'FIREBASE_CLIENT_EMAIL': f'loadtest@{FAKE_PROJECT_ID}.iam.gserviceaccount.com',
+        'FIREBASE_CLIENT_ID': '0',
+        'MONGO_URI': mongo_uri,
+        'JWT_SECRET_KEY': os.getenv('JWT_SECRET_KEY') or uuid.uuid4().hex * 2,
+        # Only the balanced model ships with MediaPipe; other tiers would be downloaded at warm-up
+        'POSE_TIERS': os.getenv('POSE_TIERS') or 'balanced',
+    }
+
+
+class Results:
+    """Latencies and outcomes per endpoint label."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, label: str, seconds: float, status):
+        self.latencies[label].append(seconds)
+        self.statuses[label][status] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        report = {}
+        for label in sorted(self.latencies):
+            latencies = np.array(self.latencies[label]) * 1000
+            statuses = self.statuses[label]
+            errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+            p50, p99 = np.percentile(latencies, [50, 99])
+            report[label] = {
+                'requests': len(latencies), 'rps': round(len(latencies) / elapsed, 2),
+                'p50_ms': round(p50, 2), 'p99_ms': round(p99, 2),
+                'error_rate': round(errors / len(latencies), 4),
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            }
+        return report
+
+
+async def call(client: httpx.AsyncClient, results: Results, label: str, method: str, url: str, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, url, **kwargs)
+    except httpx.HTTPError as e:
+        results.record(label, time.perf_counter() - start, type(e).__name__)
+        return None
+    results.record(label, time.perf_counter() - start, response.status_code)
+    return response
+
+
+async def django_login(client, results, args, uid):
+    response = await call(client, results, "django POST /login/login/", "POST", f"{args.django_url}/login/login/",
+                          json={'id_token': fake_id_token(uid, f'{uid}@loadtest.local')})
+    if response is None or response.status_code != 200:
+        return None
+    return {'Authorization': f"Bearer {response.json()['auth_token']}"}
+
+
+async def fastapi_login(client, results, args, uid):
+    # The FastAPI service answers with the auth_token cookie, which the client keeps for /process
+    response = await call(client, results, "fastapi POST /login", "POST", f"{args.fastapi_url}/login",
+                          json={'id_token': fake_id_token(uid, f'{uid}@loadtest.local')})
+    return response is not None and response.status_code == 200
+
+
+async def login_user(client, results, args, uid, deadline):
+    if args.django_url:
+        await django_login(client, results, args, uid)
+    if args.fastapi_url:
+        await fastapi_login(client, results, args, uid)
+
+
+async def profile_user(client, results, args, uid, deadline):
+    if not args.django_url:
+        return
+    headers = await django_login(client, results, args, uid)
+    if headers is None:
+        return
+    base = f"{args.django_url}/profile"
+    await call(client, results, "django POST /profile/profile-set/", "POST", f"{base}/profile-set/", json=PROFILE, headers=headers)
+    while time.monotonic() < deadline:
+        await call(client, results, "django GET /profile/profile-get/", "GET", f"{base}/profile-get/", headers=headers)
+        if random.random() < 0.1:
+            await call(client, results, "django POST /profile/profile-set/", "POST", f"{base}/profile-set/",
+                       json=dict(PROFILE, weight=random.randint(50, 90)), headers=headers)
+        if random.random() < 0.2:
+            await call(client, results, "django GET /profile/stats/", "GET", f"{base}/stats/", headers=headers)
+        if random.random() < 0.2:
+            await call(client, results, "django GET /profile/leaderboard/", "GET", f"{base}/leaderboard/", headers=headers)
+        await asyncio.sleep(random.expovariate(1 / args.think_time))
+
+
+async def stream_user(client, results, args, uid, deadline):
+    if not args.fastapi_url:
+        return
+    await fastapi_login(client, results, args, uid)
+    session_id = uuid.uuid4().hex
+    interval = 1 / args.fps
+    url = f"{args.fastapi_url}/process?encoding=compact"
+    next_at = time.monotonic()
+    while time.monotonic() < deadline:
+        response = await call(client, results, "fastapi POST /process", "POST", url,
+                              files={'file': ('frame.jpg', args.frame, 'image/jpeg')},
+                              data={'session_id': session_id, 'response_mode': 'landmarks'})
+        if response is not None and response.status_code == 200:
+            try:
+                wire.decode_frame(response.content)
+            except (ValueError, IndexError):
+                results.record("fastapi POST /process (decode)", 0.0, "undecodable")
+        # A camera keeps its frame rate: wait for the next slot, or send at once if this frame ran late
+        next_at = max(next_at + interval, time.monotonic())
+        await asyncio.sleep(next_at - time.monotonic())
+    await call(client, results, "fastapi DELETE /session", "DELETE", f"{args.fastapi_url}/session/{session_id}")
+
+
+SCENARIOS = {'login': login_user, 'profile': profile_user, 'stream': stream_user}
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def run(args) -> dict:
+    results = Results()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    names, weights = zip(*args.mix.items())
+    start = time.monotonic()
+    deadline = start + args.duration
+
+    async def user(index):
+        await asyncio.sleep(args.ramp * index / max(args.users, 1))
+        scenario = SCENARIOS[random.choices(names, weights)[0]]
+        # One client per user, so the FastAPI auth cookie stays with its user
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            await scenario(client, results, args, f"loadtest-{index}", deadline)
+
+    await asyncio.gather(*(user(i) for i in range(args.users)))
+    return results.summary(time.monotonic() - start)
+
+
+def wait_until_up(url: str, timeout: float, ready=lambda response: response.status_code < 500):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if ready(httpx.get(url, timeout=2)):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def fastapi_ready(response) -> bool:
+    if response.status_code == 503 and response.json().get('error'):
+        # Warm-up failed (e.g. a tier's model could not be downloaded); it will not recover
+        raise RuntimeError(f"FastAPI warm-up failed: {response.json()['error']}")
+    return response.status_code == 200
+
+
+def spawn(args, env):
+    """Start both apps under uvicorn with the stand-ins; returns the processes."""
+    processes = [
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.join(ROOT_DIR, "src"),
+                          "--port", str(args.fastapi_port), "--workers", str(args.workers), "--log-level", "warning"],
+                         env=env, cwd=ROOT_DIR),
+        subprocess.Popen([sys.executable, "-m", "uvicorn", "spentbackend.asgi:application", "--app-dir",
+                          os.path.join(ROOT_DIR, "spentbackend"), "--port", str(args.django_port),
+                          "--workers", str(args.workers), "--log-level", "warning"],
+                         env=env, cwd=os.path.join(ROOT_DIR, "spentbackend")),
+    ]
+    args.fastapi_url = f"http://127.0.0.1:{args.fastapi_port}"
+    args.django_url = f"http://127.0.0.1:{args.django_port}"
+    try:
+        # /readyz waits for the pose workers to warm; Django answers GET on the login route with 405 once up
+        wait_until_up(f"{args.fastapi_url}/readyz", args.startup_timeout, fastapi_ready)
+        wait_until_up(f"{args.django_url}/login/login/", args.startup_timeout)
+    except Exception:
+        for process in processes:
+            process.terminate()
+        raise
+    return processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fastapi-url", help="FastAPI service to load, e.g. http://localhost:10000")
+    parser.add_argument("--django-url", help="Django backend to load, e.g. http://localhost:8000")
+    parser.add_argument("--spawn", action="store_true", help="Start both apps locally with the stand-ins")
+    parser.add_argument("--print-env", action="store_true", help="Print the stand-in environment and exit")
+    parser.add_argument("--mongo-uri", default="memory://", help="memory:// (default) or a local MongoDB")
+    parser.add_argument("--fastapi-port", type=int, default=18000)
+    parser.add_argument("--django-port", type=int, default=18001)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers per spawned app")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--users", type=int, default=20, help="Virtual users")
+    parser.add_argument("--ramp", type=float, default=5, help="Seconds over which users start")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds each user keeps going")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("stream=2,profile=5,login=3"),
+                        help="Scenario weights, e.g. stream=2,profile=5,login=3")
+    parser.add_argument("--fps", type=float, default=15, help="Frame rate of each stream user")
+    parser.add_argument("--frame", default=os.path.join(FIXTURES_DIR, "frame_480p.jpg"), help="JPEG sent as every frame")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean seconds between a profile user's requests")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-error-rate", type=float, help="Exit with status 1 if any endpoint's error rate exceeds this")
+    parser.add_argument("--output", help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    env = dict(os.environ, **stand_in_env(args.mongo_uri))
+    if args.print_env:
+        for name in stand_in_env(args.mongo_uri):
+            print(f"export {name}='{env[name]}'")
+        return 0
+
+    with open(args.frame, "rb") as f:
+        args.frame = f.read()
+    processes = spawn(args, env) if args.spawn else []
+    if not (args.fastapi_url or args.django_url):
+        parser.error("pass --spawn or at least one of --fastapi-url / --django-url")
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    print(f"{'endpoint':36} {'requests':>9} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for label, stats in report.items():
+        print(f"{label:36} {stats['requests']:9d} {stats['rps']:8.1f} {stats['p50_ms']:9.1f} {stats['p99_ms']:9.1f} "
+              f"{stats['error_rate']:8.2%}")
+    for label, stats in report.items():
+        if stats['error_rate']:
+            print(f"  {label}: {stats['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({'args': {'users': args.users, 'duration': args.duration, 'mix': args.mix, 'fps': args.fps,
+                                'mongo_uri': args.mongo_uri}, 'endpoints': report}, f, indent=2)
+
+    if args.max_error_rate is not None and any(stats['error_rate'] > args.max_error_rate for stats in report.values()):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
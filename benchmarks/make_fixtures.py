@@ -0,0 +1,78 @@
+"""Regenerate the checked-in benchmark fixtures.
+
+Everything is seeded and offline, so no network download is needed:
+
+- ``pushup_landmarks.npy``: (N, 33, 4) float32 synthetic landmark sequence of repeated push-ups
+- ``frame_480p.jpg`` / ``frame_1080p.jpg``: a real person that MediaPipe detects (the public-domain
+  Grace Hopper portrait from matplotlib's sample data) on a noisy background, so the pose stage
+  runs the landmark model and not just the person detector. Needs matplotlib.
+"""
+import os
+
+import cv2
+import numpy as np
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Landmark indices (BlazePose) placed by the synthetic pose
+NOSE, L_SHOULDER, R_SHOULDER, L_ELBOW, R_ELBOW, L_WRIST, R_WRIST = 0, 11, 12, 13, 14, 15, 16
+L_PINKY, R_PINKY, L_HIP, R_HIP, L_KNEE, R_KNEE, L_ANKLE, R_ANKLE = 17, 18, 23, 24, 25, 26, 27, 28
+
+
+def pushup_frame(elbow_angle: float, rng: np.random.Generator) -> np.ndarray:
+    # Side-on push-up: shoulders, hips, knees and ankles on one line, forearms rotating about the elbow
+    lm = np.zeros((33, 4), np.float32)
+    lm[:, 3] = 0.9
+    lm[:, :2] = (0.5, 0.5)
+    for index, (x, y) in {
+        NOSE: (0.42, 0.47), L_SHOULDER: (0.5, 0.5), R_SHOULDER: (0.5, 0.5),
+        L_HIP: (0.7, 0.5), R_HIP: (0.7, 0.5), L_KNEE: (0.85, 0.5), R_KNEE: (0.85, 0.5),
+        L_ANKLE: (0.95, 0.5), R_ANKLE: (0.95, 0.5), L_ELBOW: (0.5, 0.6), R_ELBOW: (0.5, 0.6),
+        L_PINKY: (0.62, 0.7), R_PINKY: (0.38, 0.7),
+    }.items():
+        lm[index, :2] = (x, y)
+    radians = np.radians(elbow_angle)
+    lm[[L_WRIST, R_WRIST], :2] = (0.5 + 0.1 * np.sin(radians), 0.6 - 0.1 * np.cos(radians))
+    lm[:, :2] += rng.normal(0, 0.003, (33, 2))
+    return lm
+
+
+def make_landmarks(reps: int = 10, frames_per_rep: int = 30, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    half = frames_per_rep // 2
+    angles = np.concatenate([np.linspace(170, 60, half), np.linspace(60, 170, frames_per_rep - half)] * reps)
+    return np.stack([pushup_frame(angle, rng) for angle in angles])
+
+
+def make_frame(width: int, height: int, person: np.ndarray, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    # Noisy gradient background so JPEG decode/encode costs are realistic
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    img = np.clip(gradient + rng.normal(0, 4, (height, width, 3)), 0, 255).astype(np.uint8)
+    # The person fills the frame's height, centred
+    scale = height / person.shape[0]
+    person = cv2.resize(person, (round(person.shape[1] * scale), height), interpolation=cv2.INTER_AREA)
+    left = (width - person.shape[1]) // 2
+    img[:, left:left + person.shape[1]] = person
+    return img
+
+
+def load_person() -> np.ndarray:
+    from matplotlib import cbook
+
+    return cv2.imread(cbook.get_sample_data("grace_hopper.jpg", asfileobj=False))
+
+
+def main():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    landmarks = make_landmarks()
+    np.save(os.path.join(FIXTURES_DIR, "pushup_landmarks.npy"), landmarks)
+    person = load_person()
+    for name, (width, height) in {"frame_480p.jpg": (640, 480), "frame_1080p.jpg": (1920, 1080)}.items():
+        frame = make_frame(width, height, person)
+        cv2.imwrite(os.path.join(FIXTURES_DIR, name), frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+    print(f"Wrote fixtures to {FIXTURES_DIR}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+# Login/management/commands/ensure_indexes.py
+from django.core.management.base import BaseCommand, CommandError
+from pymongo.errors import PyMongoError
+from mongodb import db
+from indexes import ensure_indexes, explain_query_shapes
+
+
+class Command(BaseCommand):
+    help = "Create the MongoDB indexes for users and profiles (idempotent) and verify query plans"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--explain', action='store_true', help="Fail if a declared query shape does not use an index")
+
+    def handle(self, *args, **options):
+        try:
+            for name in ensure_indexes(db):
+                self.stdout.write(f"ensured {name}")
+
+            if options['explain']:
+                scans = []
+                for collection, query, stages, uses_index in explain_query_shapes(db):
+                    self.stdout.write(f"{collection} {list(query)}: {' <- '.join(stages)}")
+                    if not uses_index:
+                        scans.append(f"{collection} {list(query)}")
+                if scans:
+                    raise CommandError(f"Queries not served by an index: {', '.join(scans)}")
+        except PyMongoError as e:
+            raise CommandError(f"MongoDB error: {e}")
+
+        self.stdout.write(self.style.SUCCESS("Indexes are up to date"))
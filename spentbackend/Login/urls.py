@@ -1,8 +1,9 @@
 # Login/urls.py
 
+from django.conf import settings
 from django.urls import path
-from .views import login
+from .views import login, login_async
 
 urlpatterns = [
-    path('login/', login, name='login'),
+    path('login/', login_async if settings.ASYNC_VIEWS else login, name='login'),
 ]
@@ -1,53 +1,95 @@
 # Login/views.py
+import asyncio
 from django.conf import settings
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from firebase_admin import auth
+from django.http import JsonResponse
 from .models import User
 from django.utils import timezone
 import jwt
-from mongodb import users_collection
+from firebase_app import get_firebase_auth
+from mongodb import get_async_db, get_db
+from token_cache import verify_firebase_token, verify_firebase_token_async
+from .authentication import async_api_view, request_data
 
 JWT_SECRET_KEY = settings.JWT_SECRET_KEY
 
+def user_data_from_token(decoded_token):
+    return {
+        'userid': decoded_token['uid'],
+        'email': decoded_token.get('email', 'No email provided'),
+        'username': decoded_token.get('name', 'No username provided'),
+        'profile_photo': decoded_token.get('picture', 'No profile photo'),
+        'firebase_metadata': {
+            'sign_in_provider': decoded_token.get('firebase', {}).get('sign_in_provider'),
+            'identities': decoded_token.get('firebase', {}).get('identities')
+        },
+        'last_login': timezone.now()
+    }
+
+def login_response(user_data):
+    token_data = {"email": user_data['email'], "uid": user_data['userid']}
+    token = jwt.encode(token_data, JWT_SECRET_KEY, algorithm="HS256")
+    return {
+        "message": "Login successful",
+        "auth_token": token,
+        "userid": user_data['userid'],
+        "email": user_data['email']
+    }
+
+def login_error(error):
+    # (body, status) for a failed login; shared by the sync and async views
+    from firebase_admin import auth
+    if isinstance(error, auth.InvalidIdTokenError):
+        return {"detail": f"Invalid token: {error}"}, status.HTTP_401_UNAUTHORIZED
+    if isinstance(error, ValueError):
+        return {"detail": f"Invalid token error: {error}"}, status.HTTP_401_UNAUTHORIZED
+    return {"detail": f"Unexpected error during login: {str(error)}"}, status.HTTP_500_INTERNAL_SERVER_ERROR
+
 @api_view(['POST'])
 def login(request):
     id_token = request.data.get('id_token')
 
     try:
-        decoded_token = auth.verify_id_token(id_token)
-        user_data = {
-            'userid': decoded_token['uid'],
-            'email': decoded_token.get('email', 'No email provided'),
-            'username': decoded_token.get('name', 'No username provided'),
-            'profile_photo': decoded_token.get('picture', 'No profile photo'),
-            'firebase_metadata': {
-                'sign_in_provider': decoded_token.get('firebase', {}).get('sign_in_provider'),
-                'identities': decoded_token.get('firebase', {}).get('identities')
-            },
-            'last_login': timezone.now()
-        }
-        
-        users_collection.update_one(
+        decoded_token = verify_firebase_token(id_token, get_firebase_auth())
+        user_data = user_data_from_token(decoded_token)
+
+        get_db()['users'].update_one(
             {'userid': user_data['userid']},
             {'$set': user_data},
             upsert=True
         )
 
-        token_data = {"email": user_data['email'], "uid": user_data['userid']}
-        token = jwt.encode(token_data, JWT_SECRET_KEY, algorithm="HS256")
+        return Response(login_response(user_data), status=status.HTTP_200_OK)
+
+    except Exception as e:
+        body, code = login_error(e)
+        return Response(body, status=code)
+
+@async_api_view('POST')
+async def login_async(request):
+    # Under ASGI: Firebase verification runs on a thread and Mongo on the async client,
+    # so the event loop keeps serving other logins meanwhile
+    try:
+        id_token = request_data(request).get('id_token')
+    except ValueError as e:
+        return JsonResponse({"detail": f"JSON parse error - {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        # The first call initializes Firebase (reads the service-account key): keep that off the loop too
+        auth = get_firebase_auth() if get_firebase_auth.cache_info().currsize else await asyncio.to_thread(get_firebase_auth)
+        decoded_token = await verify_firebase_token_async(id_token, auth)
+        user_data = user_data_from_token(decoded_token)
+
+        await get_async_db()['users'].update_one(
+            {'userid': user_data['userid']},
+            {'$set': user_data},
+            upsert=True
+        )
 
-        return Response({
-            "message": "Login successful", 
-            "auth_token": token, 
-            "userid": user_data['userid'], 
-            "email": user_data['email']
-        }, status=status.HTTP_200_OK)
+        return JsonResponse(login_response(user_data), status=status.HTTP_200_OK)
 
-    except auth.InvalidIdTokenError as e:
-        return Response({"detail": f"Invalid token: {e}"}, status=status.HTTP_401_UNAUTHORIZED)
-    except ValueError as ve:
-        return Response({"detail": f"Invalid token error: {ve}"}, status=status.HTTP_401_UNAUTHORIZED)
     except Exception as e:
-        return Response({"detail": f"Unexpected error during login: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        body, code = login_error(e)
+        return JsonResponse(body, status=code)
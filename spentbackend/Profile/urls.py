@@ -1,9 +1,12 @@
 # profile/urls.py
 
+from django.conf import settings
 from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('profile-get/', views.get_user_profile, name='get_user_profile'),
-    path('profile-set/', views.set_user_profile, name='set_user_profile'),
+    path('profile-get/', views.get_user_profile_async if settings.ASYNC_VIEWS else views.get_user_profile, name='get_user_profile'),
+    path('profile-set/', views.set_user_profile_async if settings.ASYNC_VIEWS else views.set_user_profile, name='set_user_profile'),
+    path('stats/', views.get_user_stats, name='get_user_stats'),
+    path('leaderboard/', views.get_leaderboard, name='get_leaderboard'),
 ]
@@ -1,81 +1,247 @@
 
 # Profile/views.py
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.utils.encoders import JSONEncoder
 from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
 from django.utils import timezone
-import jwt
-from mongodb import users_collection, profiles_collection
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+import time
+from mongodb import get_async_db, get_db
+from Login.authentication import JWTAuthentication, async_api_view, request_data
+from leaderboard import DEFAULT_EXERCISE, EXERCISES, PERIODS, board_name, create_leaderboard, period_key
 
-JWT_SECRET_KEY = settings.JWT_SECRET_KEY
+@lru_cache(maxsize=None)
+def leaderboards():
+    # Rep counters are written incrementally by the FastAPI workout recorder; boards are only read here
+    return create_leaderboard()
 
-@api_view(['GET'])
-def get_user_profile(request):
-    auth_token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not auth_token:
-        return Response({"message": "Authentication token is missing"}, status=status.HTTP_401_UNAUTHORIZED)
+def profile_cache_key(uid):
+    return f'profile:{uid}'
 
-    try:
-        token_data = jwt.decode(auth_token, JWT_SECRET_KEY, algorithms=["HS256"])
-        email = token_data.get('email')
-        uid = token_data.get('uid')
-        if not email or not uid:
-            return Response({"message": "Invalid token data"}, status=status.HTTP_400_BAD_REQUEST)
-    except jwt.ExpiredSignatureError:
-        return Response({"message": "Token has expired"}, status=status.HTTP_401_UNAUTHORIZED)
-    except jwt.InvalidTokenError:
-        return Response({"message": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED)
-
-    user = users_collection.find_one({'userid': uid})
-    if not user:
-        return Response({"message": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-
-    profile = profiles_collection.find_one({'user_id': uid})
-    if not profile:
-        return Response({"message": "User profile not found"}, status=status.HTTP_404_NOT_FOUND)
+def profile_pipeline(uid):
+    # One round-trip: the user and their profile joined server-side
+    return [
+        {'$match': {'userid': uid}},
+        {'$limit': 1},
+        {'$lookup': {'from': 'profiles', 'localField': 'userid', 'foreignField': 'user_id', 'as': 'profile'}},
+        {'$project': {'_id': 0, 'profile': {'$arrayElemAt': ['$profile', 0]}}},
+    ]
 
+def profile_from_matches(matches):
+    # (profile, None) or (None, (body, status)) for the aggregation result
+    if not matches:
+        return None, ({"message": "User not found"}, status.HTTP_404_NOT_FOUND)
+    profile = matches[0].get('profile')
+    if not profile:
+        return None, ({"message": "User profile not found"}, status.HTTP_404_NOT_FOUND)
     # Remove MongoDB's _id field
     profile.pop('_id', None)
-    return Response(profile)
-
-@api_view(['POST'])
-def set_user_profile(request):
-    auth_token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not auth_token:
-        return Response({"message": "Authentication token is missing"}, status=status.HTTP_401_UNAUTHORIZED)
-
-    try:
-        token_data = jwt.decode(auth_token, JWT_SECRET_KEY, algorithms=["HS256"])
-        email = token_data.get('email')
-        uid = token_data.get('uid')
-        if not email or not uid:
-            return Response({"message": "Invalid token data"}, status=status.HTTP_400_BAD_REQUEST)
-    except jwt.ExpiredSignatureError:
-        return Response({"message": "Token has expired"}, status=status.HTTP_401_UNAUTHORIZED)
-    except jwt.InvalidTokenError:
-        return Response({"message": "Invalid token"}, status=status.HTTP_401_UNAUTHORIZED)
+    return profile, None
 
-    profile_data = request.data
+def prepare_profile(profile_data, uid, email):
+    # Normalizes the submitted profile in place; returns an error message or None
     if 'dob' in profile_data:
         profile_data['dob'] = profile_data['dob'].split('T')[0]
 
     required_fields = ['gender', 'dob', 'height_feet', 'height_inches', 'weight', 'weight_unit']
     for field in required_fields:
         if field not in profile_data:
-            return Response({"message": f"Missing required field: {field}"}, status=status.HTTP_400_BAD_REQUEST)
+            return f"Missing required field: {field}"
 
     profile_data['user_id'] = uid
     profile_data['email'] = email
     profile_data['updated_at'] = timezone.now()
+    return None
+
+def profile_saved(result):
+    if result.matched_count:
+        return {"message": "Profile updated successfully"}, status.HTTP_200_OK
+    return {"message": "Profile set successfully"}, status.HTTP_201_CREATED
 
-    result = profiles_collection.update_one(
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_user_profile(request):
+    uid = request.user.uid
+
+    profile = cache.get(profile_cache_key(uid))
+    if profile is not None:
+        return Response(profile)
+
+    profile, error = profile_from_matches(list(get_db()['users'].aggregate(profile_pipeline(uid))))
+    if error:
+        return Response(error[0], status=error[1])
+
+    cache.set(profile_cache_key(uid), profile, settings.PROFILE_CACHE_TTL)
+    return Response(profile)
+
+@api_view(['POST'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def set_user_profile(request):
+    uid = request.user.uid
+
+    profile_data = request.data
+    message = prepare_profile(profile_data, uid, request.user.email)
+    if message:
+        return Response({"message": message}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = get_db()['profiles'].update_one(
         {'user_id': uid},
         {'$set': profile_data},
         upsert=True
     )
 
-    if result.matched_count:
-        return Response({"message": "Profile updated successfully"}, status=status.HTTP_200_OK)
+    cache.delete(profile_cache_key(uid))
+    body, code = profile_saved(result)
+    return Response(body, status=code)
+
+# Async variants, routed instead of the two views above when running under ASGI
+
+@async_api_view('GET', authenticated=True)
+async def get_user_profile_async(request):
+    uid = request.user.uid
+
+    profile = await cache.aget(profile_cache_key(uid))
+    if profile is not None:
+        return JsonResponse(profile, encoder=JSONEncoder)
+
+    cursor = await get_async_db()['users'].aggregate(profile_pipeline(uid))
+    profile, error = profile_from_matches(await cursor.to_list(length=1))
+    if error:
+        return JsonResponse(error[0], status=error[1])
+
+    await cache.aset(profile_cache_key(uid), profile, settings.PROFILE_CACHE_TTL)
+    return JsonResponse(profile, encoder=JSONEncoder)
+
+@async_api_view('POST', authenticated=True)
+async def set_user_profile_async(request):
+    uid = request.user.uid
+
+    try:
+        profile_data = request_data(request)
+    except ValueError as e:
+        return JsonResponse({"detail": f"JSON parse error - {e}"}, status=status.HTTP_400_BAD_REQUEST)
+    message = prepare_profile(profile_data, uid, request.user.email)
+    if message:
+        return JsonResponse({"message": message}, status=status.HTTP_400_BAD_REQUEST)
+
+    result = await get_async_db()['profiles'].update_one(
+        {'user_id': uid},
+        {'$set': profile_data},
+        upsert=True
+    )
+
+    await cache.adelete(profile_cache_key(uid))
+    body, code = profile_saved(result)
+    return JsonResponse(body, status=code)
+
+def parse_day(request):
+    # Optional ?date=YYYY-MM-DD picks an earlier day/week; defaults to now (UTC)
+    value = request.query_params.get('date')
+    if not value:
+        return timezone.now()
+    return datetime.strptime(value, '%Y-%m-%d').replace(tzinfo=dt_timezone.utc)
+
+def parse_exercise(request):
+    # Optional ?exercise= picks whose counters to read; each exercise is counted and ranked on its own
+    exercise = request.query_params.get('exercise', DEFAULT_EXERCISE)
+    if exercise not in EXERCISES:
+        raise ValueError(f"exercise must be one of: {', '.join(EXERCISES)}")
+    return exercise
+
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_user_stats(request):
+    try:
+        exercise = parse_exercise(request)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        days = min(int(request.query_params.get('days', 7)), 366)
+        weeks = min(int(request.query_params.get('weeks', 4)), 53)
+        until = parse_day(request)
+    except ValueError:
+        return Response({"message": "Invalid days, weeks or date"}, status=status.HTTP_400_BAD_REQUEST)
+
+    day_keys = [period_key('day', until - timedelta(days=i)) for i in range(days)]
+    week_keys = [period_key('week', until - timedelta(weeks=i)) for i in range(weeks)]
+    # Pre-aggregated counters: one indexed read, no aggregation over rep history
+    counters = {
+        (doc['period'], doc['key']): doc['reps']
+        for doc in get_db()['user_stats'].find(
+            {'user_id': request.user.uid, 'exercise': exercise, 'period': {'$in': list(PERIODS)},
+             'key': {'$in': day_keys + week_keys + ['all']}},
+            {'_id': 0, 'period': 1, 'key': 1, 'reps': 1},
+        )
+    }
+    return Response({
+        'exercise': exercise,
+        'days': [{'date': key, 'reps': counters.get(('day', key), 0)} for key in day_keys],
+        'weeks': [{'week': key, 'reps': counters.get(('week', key), 0)} for key in week_keys],
+        'total': counters.get(('all', 'all'), 0),
+    })
+
+# Counters written by a flush that started before the last sync can carry a slightly older updated_at;
+# re-reading this window is harmless because synced scores are absolute, not deltas
+SYNC_OVERLAP = timedelta(seconds=30)
+
+def refresh_board(exercise, period, key):
+    # An in-memory board is built from user_stats once, then every LEADERBOARD_REFRESH_SECONDS only the
+    # counters updated since the last sync are applied (O(log n) each); rank and top-K lookups are O(log n)
+    board = board_name(exercise, period, key)
+    loaded_at = leaderboards().loaded_at(board)
+    if loaded_at is not None and time.monotonic() - loaded_at <= settings.LEADERBOARD_REFRESH_SECONDS:
+        return board
+    query = {'exercise': exercise, 'period': period, 'key': key}
+    synced_to = leaderboards().synced_to(board)
+    if loaded_at is not None and synced_to is not None:
+        query['updated_at'] = {'$gte': synced_to - SYNC_OVERLAP}
+    docs = list(get_db()['user_stats'].find(query, {'_id': 0, 'user_id': 1, 'reps': 1, 'updated_at': 1}))
+    scores = [(doc['user_id'], doc['reps']) for doc in docs]
+    latest = max((doc['updated_at'] for doc in docs if doc.get('updated_at')), default=synced_to)
+    if 'updated_at' in query:
+        leaderboards().sync(board, scores, latest)
     else:
-        return Response({"message": "Profile set successfully"}, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        leaderboards().load(board, scores, latest)
+    return board
+
+@api_view(['GET'])
+@authentication_classes([JWTAuthentication])
+@permission_classes([IsAuthenticated])
+def get_leaderboard(request):
+    period = request.query_params.get('period', 'week')
+    if period not in PERIODS:
+        return Response({"message": f"period must be one of: {', '.join(PERIODS)}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        exercise = parse_exercise(request)
+    except ValueError as e:
+        return Response({"message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        key = period_key(period, parse_day(request))
+    except ValueError:
+        return Response({"message": "Invalid limit or date"}, status=status.HTTP_400_BAD_REQUEST)
+
+    board = refresh_board(exercise, period, key)
+    top = leaderboards().top(board, limit)
+    names = {
+        user['userid']: user.get('username')
+        for user in get_db()['users'].find({'userid': {'$in': [uid for uid, _ in top]}}, {'_id': 0, 'userid': 1, 'username': 1})
+    }
+    rank = leaderboards().rank(board, request.user.uid)
+    return Response({
+        'exercise': exercise,
+        'period': period,
+        'key': key,
+        'top': [{'rank': i + 1, 'user_id': uid, 'username': names.get(uid), 'reps': reps} for i, (uid, reps) in enumerate(top)],
+        'me': {'rank': None if rank is None else rank + 1, 'reps': leaderboards().score(board, request.user.uid) or 0},
+        'users': leaderboards().size(board),
+    })
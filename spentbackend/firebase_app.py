@@ -0,0 +1,40 @@
+# firebase_app.py
+import os
+import threading
+from functools import lru_cache
+
+_init_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_firebase_auth():
+    """Return ``firebase_admin.auth``, initializing the Firebase app on first use.
+
+    Not done at settings import: a cold start that never verifies an ID token
+    skips building the credentials, and warm invocations reuse the app.
+    """
+    import firebase_admin
+    from firebase_admin import auth, credentials
+
+    with _init_lock:
+        try:
+            # Concurrent first calls all miss the cache; only one may initialize the app
+            firebase_admin.get_app()
+        except ValueError:
+            firebase_admin.initialize_app(_credentials(credentials))
+    return auth
+
+
+def _credentials(credentials):
+    return credentials.Certificate({
+        "type": "service_account",
+        "project_id": os.getenv("FIREBASE_PROJECT_ID"),
+        "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
+        "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
+        "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
+        "client_id": os.getenv("FIREBASE_CLIENT_ID"),
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL")
+    })
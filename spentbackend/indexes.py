@@ -0,0 +1,87 @@
+# indexes.py
+# Index declarations for the users, profiles, workout and stats collections, shared by the Django
+# `ensure_indexes` command and the FastAPI startup hook: no Django imports here.
+from datetime import datetime, timezone
+
+# collection -> list of (keys, options). create_index is idempotent for an
+# identical spec, so applying these repeatedly is safe.
+REQUIRED_INDEXES = {
+    'users': [
+        ([('userid', 1)], {'name': 'userid_unique', 'unique': True}),
+    ],
+    'profiles': [
+        # Django keys profiles by user_id; FastAPI-written profiles only carry email
+        ([('user_id', 1)], {'name': 'user_id_unique', 'unique': True,
+                            'partialFilterExpression': {'user_id': {'$exists': True}}}),
+        ([('email', 1)], {'name': 'email'}),
+    ],
+    # Workout history written by the FastAPI service (src/workouts.py)
+    'workouts': [
+        ([('workout_id', 1)], {'name': 'workout_id_unique', 'unique': True}),
+        ([('user_id', 1), ('started_at', -1)], {'name': 'user_id_started_at'}),
+    ],
+    'workout_events': [
+        ([('workout_id', 1), ('at', 1)], {'name': 'workout_id_at'}),
+    ],
+    # Per-user, per-exercise rep counters (spentbackend/leaderboard.py); the second index rebuilds a
+    # leaderboard, the third finds the counters changed since an in-memory board was last synced
+    'user_stats': [
+        ([('user_id', 1), ('exercise', 1), ('period', 1), ('key', 1)], {'name': 'user_exercise_period_key_unique', 'unique': True}),
+        ([('exercise', 1), ('period', 1), ('key', 1), ('reps', -1)], {'name': 'exercise_period_key_reps'}),
+        ([('exercise', 1), ('period', 1), ('key', 1), ('updated_at', 1)], {'name': 'exercise_period_key_updated_at'}),
+    ],
+}
+
+# Query shapes the services run, checked with explain() to make sure they hit an index
+QUERY_SHAPES = [
+    ('users', {'userid': 'explain-probe'}),
+    ('profiles', {'user_id': 'explain-probe'}),
+    ('profiles', {'email': 'explain-probe'}),
+    ('workouts', {'workout_id': 'explain-probe'}),
+    ('workouts', {'user_id': 'explain-probe'}),
+    ('workout_events', {'workout_id': 'explain-probe'}),
+    ('user_stats', {'user_id': 'explain-probe', 'exercise': 'pushups', 'period': 'day'}),
+    ('user_stats', {'exercise': 'pushups', 'period': 'day', 'key': 'explain-probe'}),
+    ('user_stats', {'exercise': 'pushups', 'period': 'day', 'key': 'explain-probe',
+                    'updated_at': {'$gte': datetime(2000, 1, 1, tzinfo=timezone.utc)}}),
+]
+
+
+def ensure_indexes(db):
+    """Create every declared index on a synchronous PyMongo database; returns the index names."""
+    created = []
+    for collection, indexes in REQUIRED_INDEXES.items():
+        for keys, options in indexes:
+            created.append(f"{collection}.{db[collection].create_index(keys, **options)}")
+    return created
+
+
+async def ensure_indexes_async(db):
+    """Same as ensure_indexes for an async database (PyMongo AsyncMongoClient)."""
+    created = []
+    for collection, indexes in REQUIRED_INDEXES.items():
+        for keys, options in indexes:
+            created.append(f"{collection}.{await db[collection].create_index(keys, **options)}")
+    return created
+
+
+def _plan_stages(plan):
+    yield plan.get('stage')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+    for shard in plan.get('shards', []):
+        yield from _plan_stages(shard.get('winningPlan', {}))
+
+
+def explain_query_shapes(db):
+    """Return (collection, filter, winning stages, uses_index) for every declared query shape."""
+    report = []
+    for collection, query in QUERY_SHAPES:
+        explanation = db[collection].find(query).explain()
+        stages = [stage for stage in _plan_stages(explanation['queryPlanner']['winningPlan']) if stage]
+        uses_index = 'COLLSCAN' not in stages and any(stage in ('IXSCAN', 'EXPRESS_IXSCAN', 'IDHACK') for stage in stages)
+        report.append((collection, query, stages, uses_index))
+    return report
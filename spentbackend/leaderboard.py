@@ -0,0 +1,297 @@
+# leaderboard.py
+# Rep counters and leaderboards shared by the FastAPI service (writer, src/workouts.py)
+# and the Django Profile app (reader): no Django imports here.
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+# Counters are kept per UTC day, per ISO week and for all time
+PERIODS = ('day', 'week', 'all')
+
+# Exercises counted in reps (the 'reps' unit in src/rules.py); each has its own counters and boards
+EXERCISES = ('pushups', 'squats', 'situps')
+DEFAULT_EXERCISE = 'pushups'
+
+
+def period_key(period: str, at: datetime = None) -> str:
+    at = (at or datetime.now(timezone.utc)).astimezone(timezone.utc)
+    if period == 'day':
+        return at.strftime('%Y-%m-%d')
+    if period == 'week':
+        year, week, _ = at.isocalendar()
+        return f'{year}-W{week:02d}'
+    if period == 'all':
+        return 'all'
+    raise ValueError(f"Unknown period: {period}")
+
+
+def board_name(exercise: str, period: str, key: str) -> str:
+    return f'reps:{exercise}:{period}:{key}'
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'span')
+
+    def __init__(self, key, level):
+        self.key = key
+        self.next = [None] * level
+        self.span = [0] * level  # level-0 steps to next[i]
+
+
+class _RankedSkipList:
+    """Skip list with per-link spans (the structure behind Redis sorted sets).
+
+    Insert, remove, rank-of-key and lookup-by-rank are all O(log n) expected.
+    """
+
+    MAX_LEVEL = 32
+
+    def __init__(self):
+        self.head = _Node(None, self.MAX_LEVEL)
+        self.level = 1
+        self.size = 0
+
+    @classmethod
+    def _random_level(cls):
+        level = 1
+        while level < cls.MAX_LEVEL and random.random() < 0.25:
+            level += 1
+        return level
+
+    def insert(self, key):
+        update = [self.head] * self.MAX_LEVEL
+        rank = [0] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            rank[i] = rank[i + 1] if i + 1 < self.level else 0
+            while node.next[i] is not None and node.next[i].key < key:
+                rank[i] += node.span[i]
+                node = node.next[i]
+            update[i] = node
+        level = self._random_level()
+        if level > self.level:
+            for i in range(self.level, level):
+                self.head.span[i] = self.size
+            self.level = level
+        new = _Node(key, level)
+        for i in range(level):
+            new.next[i] = update[i].next[i]
+            update[i].next[i] = new
+            new.span[i] = update[i].span[i] - (rank[0] - rank[i])
+            update[i].span[i] = rank[0] - rank[i] + 1
+        for i in range(level, self.level):
+            update[i].span[i] += 1
+        self.size += 1
+
+    def remove(self, key):
+        update = [None] * self.MAX_LEVEL
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key < key:
+                node = node.next[i]
+            update[i] = node
+        target = node.next[0]
+        if target is None or target.key != key:
+            raise KeyError(key)
+        for i in range(self.level):
+            if update[i].next[i] is target:
+                update[i].span[i] += target.span[i] - 1
+                update[i].next[i] = target.next[i]
+            else:
+                update[i].span[i] -= 1
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+
+    def rank(self, key) -> int:
+        """0-based position of ``key``."""
+        position = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and node.next[i].key <= key:
+                position += node.span[i]
+                node = node.next[i]
+            if node.key == key:
+                return position - 1
+        raise KeyError(key)
+
+    def slice(self, start: int, count: int):
+        """Keys at positions ``start`` .. ``start + count - 1``."""
+        if start >= self.size or count <= 0:
+            return []
+        traversed = 0
+        node = self.head
+        for i in reversed(range(self.level)):
+            while node.next[i] is not None and traversed + node.span[i] <= start + 1:
+                traversed += node.span[i]
+                node = node.next[i]
+        keys = []
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class InMemoryLeaderboard:
+    """Per-process leaderboards; ties rank alphabetically by member.
+
+    A board is built once from the durable ``user_stats`` counters with
+    ``load`` and then kept current with ``sync``, which applies only the
+    counters changed since (O(log n) per changed member). ``loaded_at`` and
+    ``synced_to`` tell the caller when, and up to which ``updated_at``, that
+    last happened. At most ``max_boards`` boards are kept; the least recently
+    used one (typically a past day or week) is dropped and rebuilt if asked for
+    again.
+    """
+
+    def __init__(self, max_boards: int = None):
+        self.max_boards = max_boards or int(os.getenv("LEADERBOARD_MAX_BOARDS", "64"))
+        self._boards = OrderedDict()  # name -> (skip list of (-score, member), {member: score})
+        self._loaded_at = {}
+        self._synced_to = {}
+        self._lock = threading.Lock()
+
+    def _board(self, board):
+        if board not in self._boards:
+            self._boards[board] = (_RankedSkipList(), {})
+        self._boards.move_to_end(board)
+        while len(self._boards) > self.max_boards:
+            evicted, _ = self._boards.popitem(last=False)
+            self._loaded_at.pop(evicted, None)
+            self._synced_to.pop(evicted, None)
+        return self._boards[board]
+
+    @staticmethod
+    def _set(ranking, scores, member, score):
+        previous = scores.get(member)
+        if previous == score:
+            return
+        if previous is not None:
+            ranking.remove((-previous, member))
+        ranking.insert((-score, member))
+        scores[member] = score
+
+    def incr(self, board: str, member: str, amount: int) -> int:
+        with self._lock:
+            ranking, scores = self._board(board)
+            score = (scores.get(member) or 0) + amount
+            self._set(ranking, scores, member, score)
+            return score
+
+    def incr_many(self, increments):
+        # increments: iterable of (board, member, amount)
+        for board, member, amount in increments:
+            self.incr(board, member, amount)
+
+    def load(self, board: str, scores, synced_to=None):
+        # scores: iterable of (member, score); replaces the board
+        ranking, table = _RankedSkipList(), {}
+        for member, score in scores:
+            self._set(ranking, table, member, score)
+        with self._lock:
+            self._boards[board] = (ranking, table)
+            self._board(board)
+            self._loaded_at[board] = time.monotonic()
+            self._synced_to[board] = synced_to
+
+    def sync(self, board: str, scores, synced_to=None):
+        # scores: iterable of (member, current score) for the members whose counters changed
+        with self._lock:
+            ranking, table = self._board(board)
+            for member, score in scores:
+                self._set(ranking, table, member, score)
+            self._loaded_at[board] = time.monotonic()
+            if synced_to is not None:
+                self._synced_to[board] = synced_to
+
+    def loaded_at(self, board: str):
+        return self._loaded_at.get(board)
+
+    def synced_to(self, board: str):
+        return self._synced_to.get(board)
+
+    def score(self, board: str, member: str):
+        with self._lock:
+            return self._board(board)[1].get(member)
+
+    def rank(self, board: str, member: str):
+        """0-based rank of ``member``, highest score first, or None if absent."""
+        with self._lock:
+            ranking, scores = self._board(board)
+            if member not in scores:
+                return None
+            return ranking.rank((-scores[member], member))
+
+    def top(self, board: str, count: int, offset: int = 0):
+        with self._lock:
+            ranking, _ = self._board(board)
+            return [(member, -score) for score, member in ranking.slice(offset, count)]
+
+    def size(self, board: str) -> int:
+        with self._lock:
+            return self._board(board)[0].size
+
+
+class RedisLeaderboard:
+    """Leaderboards as Redis sorted sets, shared by every worker and both services.
+
+    Day and week boards expire ``retention_seconds`` after their last update.
+    """
+
+    def __init__(self, url: str, prefix: str = "pushup:", retention_seconds: int = 35 * 24 * 3600):
+        import redis  # Optional dependency, only needed for the shared backend
+
+        self.prefix = prefix
+        self.retention_seconds = retention_seconds
+        self._client = redis.Redis.from_url(url, decode_responses=True)
+
+    def incr_many(self, increments):
+        pipeline = self._client.pipeline(transaction=False)
+        for board, member, amount in increments:
+            pipeline.zincrby(self.prefix + board, amount, member)
+            if not board.endswith(':all'):
+                pipeline.expire(self.prefix + board, self.retention_seconds)
+        pipeline.execute()
+
+    def incr(self, board: str, member: str, amount: int) -> int:
+        self.incr_many([(board, member, amount)])
+        return self.score(board, member)
+
+    def load(self, board: str, scores):
+        pipeline = self._client.pipeline()
+        pipeline.delete(self.prefix + board)
+        mapping = dict(scores)
+        if mapping:
+            pipeline.zadd(self.prefix + board, mapping)
+        pipeline.execute()
+
+    def loaded_at(self, board: str):
+        # Redis is kept up to date by the writer; it never needs a rebuild from Mongo
+        return float('inf')
+
+    def score(self, board: str, member: str):
+        score = self._client.zscore(self.prefix + board, member)
+        return None if score is None else int(score)
+
+    def rank(self, board: str, member: str):
+        return self._client.zrevrank(self.prefix + board, member)
+
+    def top(self, board: str, count: int, offset: int = 0):
+        entries = self._client.zrevrange(self.prefix + board, offset, offset + count - 1, withscores=True)
+        return [(member, int(score)) for member, score in entries]
+
+    def size(self, board: str) -> int:
+        return self._client.zcard(self.prefix + board)
+
+
+def create_leaderboard():
+    # LEADERBOARD_BACKEND=memory keeps boards in this process; redis shares them across services
+    backend = os.getenv("LEADERBOARD_BACKEND", "memory").lower()
+    if backend == "redis":
+        return RedisLeaderboard(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+    if backend == "memory":
+        return InMemoryLeaderboard()
+    raise ValueError(f"Unknown LEADERBOARD_BACKEND: {backend}")
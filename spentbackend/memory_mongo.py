@@ -0,0 +1,338 @@
+# memory_mongo.py
+# In-process stand-in for the subset of PyMongo both services use, selected with MONGO_URI=memory://
+# for tests and local load runs. Shared by src/database.py and mongodb.py: no Django imports here.
+import copy
+import threading
+import uuid
+from types import SimpleNamespace
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from indexes import REQUIRED_INDEXES
+
+
+def _get_path(document, path):
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def _set_path(document, path, value):
+    *parents, last = path.split(".")
+    for part in parents:
+        document = document.setdefault(part, {})
+    document[last] = value
+
+
+_OPERATORS = {
+    "$lt": lambda value, operand: value is not None and value < operand,
+    "$lte": lambda value, operand: value is not None and value <= operand,
+    "$gt": lambda value, operand: value is not None and value > operand,
+    "$gte": lambda value, operand: value is not None and value >= operand,
+    "$ne": lambda value, operand: value != operand,
+    "$in": lambda value, operand: value in operand,
+    "$exists": lambda value, operand: (value is not None) == operand,
+}
+
+
+def _matches(document, query):
+    for key, condition in query.items():
+        value = _get_path(document, key)
+        if isinstance(condition, dict) and condition and all(op.startswith("$") for op in condition):
+            if not all(_OPERATORS[op](value, operand) for op, operand in condition.items()):
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _hashable(value):
+    try:
+        hash(value)
+    except TypeError:
+        return False
+    return True
+
+
+class InMemoryCursor:
+    def __init__(self, documents):
+        self._documents = documents
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        # Missing values sort first, like MongoDB's null ordering
+        self._documents.sort(key=lambda d: (_get_path(d, key) is not None, _get_path(d, key)), reverse=direction < 0)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def to_list(self, length=None):
+        limit = min(filter(None, (self._limit, length)), default=None)
+        return self._documents[:limit]
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+
+class InMemoryCollection:
+    """Synchronous subset of the PyMongo collection API, backed by a list of dicts.
+
+    Equality lookups on the leading field of each index declared in
+    ``indexes.REQUIRED_INDEXES`` (or created later) use a hash index, so
+    per-user reads and upserts stay O(1) as a load run adds users.
+    """
+
+    def __init__(self, name, database=None):
+        self.name = name
+        self.database = database
+        self.documents = []
+        self._indexes = {}  # field -> {value: [documents]}
+        self._lock = threading.RLock()
+        self._indexes["_id"] = {}  # Unique, as in MongoDB
+        for keys, _ in REQUIRED_INDEXES.get(name, []):
+            self._indexes.setdefault(keys[0][0], {})
+
+    def create_index(self, keys, **options):
+        with self._lock:
+            field = keys[0][0]
+            if field not in self._indexes:
+                self._indexes[field] = {}
+                for document in self.documents:
+                    self._index(document)
+        return options.get("name") or "_".join(f"{key}_{direction}" for key, direction in keys)
+
+    def _index(self, document, remove=False):
+        for field, entries in self._indexes.items():
+            value = _get_path(document, field)
+            if not _hashable(value):
+                continue
+            if remove:
+                entries[value] = [entry for entry in entries.get(value, ()) if entry is not document]
+            else:
+                entries.setdefault(value, []).append(document)
+
+    def _candidates(self, query):
+        for field, entries in self._indexes.items():
+            condition = query.get(field)
+            if condition is not None and not isinstance(condition, dict) and _hashable(condition):
+                return list(entries.get(condition, ()))
+        return list(self.documents)
+
+    def _find(self, query):
+        query = query or {}
+        return [document for document in self._candidates(query) if _matches(document, query)]
+
+    def find_one(self, query=None, projection=None):
+        with self._lock:
+            for document in self._find(query):
+                return self._project(document, projection)
+        return None
+
+    def find(self, query=None, projection=None):
+        with self._lock:
+            return InMemoryCursor([self._project(d, projection) for d in self._find(query)])
+
+    def insert_one(self, document):
+        document = copy.deepcopy(document)
+        document.setdefault("_id", uuid.uuid4().hex)
+        with self._lock:
+            if self._indexes["_id"].get(document["_id"]):
+                raise DuplicateKeyError(f"E11000 duplicate key error collection: {self.name} index: _id_", 11000)
+            self.documents.append(document)
+            self._index(document)
+        return SimpleNamespace(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        ids, errors = [], []
+        for index, document in enumerate(documents):
+            try:
+                ids.append(self.insert_one(document).inserted_id)
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": e.code, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids)
+
+    def update_one(self, query, update, upsert=False):
+        with self._lock:
+            for document in self._find(query)[:1]:
+                self._index(document, remove=True)
+                self._apply(document, update, inserting=False)
+                self._index(document)
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            document = {key: value for key, value in query.items() if not key.startswith("$") and not isinstance(value, dict)}
+            self._apply(document, update, inserting=True)
+            result = self.insert_one(document)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=result.inserted_id)
+
+    def bulk_write(self, requests, ordered=True):
+        # Supports the UpdateOne requests the services issue
+        for request in requests:
+            self.update_one(request._filter, request._doc, upsert=request._upsert)
+        return SimpleNamespace(acknowledged=True)
+
+    def aggregate(self, pipeline):
+        # Supports the $match, $limit, $lookup and $project stages the services issue
+        stages = list(pipeline)
+        with self._lock:
+            # A leading $match can use the hash indexes
+            documents = self._find(stages.pop(0)["$match"]) if stages and "$match" in stages[0] else list(self.documents)
+            documents = copy.deepcopy(documents)
+        for stage in stages:
+            (operator, spec), = stage.items()
+            if operator == "$match":
+                documents = [document for document in documents if _matches(document, spec)]
+            elif operator == "$limit":
+                documents = documents[:spec]
+            elif operator == "$lookup":
+                foreign = self.database[spec["from"]]
+                for document in documents:
+                    document[spec["as"]] = foreign.find({spec["foreignField"]: _get_path(document, spec["localField"])}).to_list()
+            elif operator == "$project":
+                documents = [self._project_stage(document, spec) for document in documents]
+            else:
+                raise NotImplementedError(f"Unsupported aggregation stage: {operator}")
+        return InMemoryCursor(documents)
+
+    @staticmethod
+    def _project_stage(document, spec):
+        projected = {} if any(value not in (0, False) for key, value in spec.items() if key != "_id") else copy.copy(document)
+        for key, value in spec.items():
+            if value in (0, False):
+                projected.pop(key, None)
+            elif isinstance(value, dict) and "$arrayElemAt" in value:
+                array, position = value["$arrayElemAt"]
+                items = _get_path(document, array.lstrip("$")) or []
+                if -len(items) <= position < len(items):
+                    projected[key] = items[position]
+            else:
+                projected[key] = _get_path(document, key)
+        if "_id" not in spec and "_id" in document:
+            projected.setdefault("_id", document["_id"])
+        return projected
+
+    @staticmethod
+    def _apply(document, update, inserting):
+        for path, value in update.get("$set", {}).items():
+            _set_path(document, path, copy.deepcopy(value))
+        for path, value in update.get("$inc", {}).items():
+            _set_path(document, path, (_get_path(document, path) or 0) + value)
+        for path, value in update.get("$max", {}).items():
+            current = _get_path(document, path)
+            if current is None or value > current:
+                _set_path(document, path, value)
+        for path, value in update.get("$min", {}).items():
+            current = _get_path(document, path)
+            if current is None or value < current:
+                _set_path(document, path, value)
+        if inserting:
+            for path, value in update.get("$setOnInsert", {}).items():
+                _set_path(document, path, copy.deepcopy(value))
+
+    @staticmethod
+    def _project(document, projection):
+        document = copy.deepcopy(document)
+        if projection:
+            excluded = {key for key, value in projection.items() if not value}
+            included = {key for key, value in projection.items() if value}
+            if included:
+                document = {key: value for key, value in document.items() if key in included or (key == "_id" and "_id" not in excluded)}
+            for key in excluded:
+                document.pop(key, None)
+        return document
+
+
+class InMemoryDatabase:
+    def __init__(self, name):
+        self.name = name
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name, self)
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class AsyncInMemoryCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, key, direction=1):
+        self._cursor.sort(key, direction)
+        return self
+
+    def limit(self, limit):
+        self._cursor.limit(limit)
+        return self
+
+    async def to_list(self, length=None):
+        return self._cursor.to_list(length)
+
+
+class AsyncInMemoryCollection:
+    """Async view of an InMemoryCollection, shaped like PyMongo's AsyncCollection."""
+
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    @property
+    def documents(self):
+        return self._collection.documents
+
+    async def create_index(self, keys, **options):
+        return self._collection.create_index(keys, **options)
+
+    async def find_one(self, query=None, projection=None):
+        return self._collection.find_one(query, projection)
+
+    def find(self, query=None, projection=None):
+        return AsyncInMemoryCursor(self._collection.find(query, projection))
+
+    async def insert_one(self, document):
+        return self._collection.insert_one(document)
+
+    async def insert_many(self, documents, ordered=True):
+        return self._collection.insert_many(documents, ordered)
+
+    async def update_one(self, query, update, upsert=False):
+        return self._collection.update_one(query, update, upsert)
+
+    async def bulk_write(self, requests, ordered=True):
+        return self._collection.bulk_write(requests, ordered)
+
+    async def aggregate(self, pipeline):
+        return AsyncInMemoryCursor(self._collection.aggregate(pipeline))
+
+
+class AsyncInMemoryDatabase:
+    """Async view of an InMemoryDatabase; pass one in to share its data with synchronous callers."""
+
+    def __init__(self, name, database=None):
+        self.name = name
+        self.sync = database or InMemoryDatabase(name)
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = AsyncInMemoryCollection(self.sync[name])
+        return self._collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
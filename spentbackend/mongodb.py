@@ -1,9 +1,49 @@
 # mongodb.py
-from pymongo import MongoClient
+import threading
+from functools import lru_cache
 from django.conf import settings
 
-client = MongoClient(settings.MONGO_URI)
-db = client['pushup_counter']
+# MONGO_URI=memory:// selects an in-process stand-in for tests and local load runs
+IN_MEMORY = (settings.MONGO_URI or '').startswith('memory://')
 
-users_collection = db['users']
-profiles_collection = db['profiles']
\ No newline at end of file
+# Module attributes kept for callers that import collections directly; resolved on first access
+COLLECTIONS = {
+    'users_collection': 'users',
+    'profiles_collection': 'profiles',
+    'user_stats_collection': 'user_stats',
+}
+
+_db = None
+_db_lock = threading.Lock()
+
+def get_db():
+    # Created on first use rather than at import, then kept for the life of the process,
+    # so warm serverless invocations reuse the client and its connection pool
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                if IN_MEMORY:
+                    from memory_mongo import InMemoryDatabase
+                    _db = InMemoryDatabase('pushup_counter')
+                else:
+                    from pymongo import MongoClient
+                    _db = MongoClient(settings.MONGO_URI)['pushup_counter']
+    return _db
+
+@lru_cache(maxsize=None)
+def get_async_db():
+    # The async views' database: an AsyncMongoClient belongs to the event loop it
+    # first runs on, which under ASGI is the worker's single loop
+    if IN_MEMORY:
+        from memory_mongo import AsyncInMemoryDatabase
+        return AsyncInMemoryDatabase('pushup_counter', get_db())
+    from pymongo import AsyncMongoClient
+    return AsyncMongoClient(settings.MONGO_URI)['pushup_counter']
+
+def __getattr__(name):
+    if name == 'db':
+        return get_db()
+    if name in COLLECTIONS:
+        return get_db()[COLLECTIONS[name]]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,15 +2,23 @@
 ASGI config for spentbackend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serving through this module routes login and profile to their async views
+(``DJANGO_ASYNC_VIEWS``), so one worker overlaps many Firebase and Mongo calls.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.1/howto/deployment/asgi/
 """
 
 import os
+import sys
+
+# Add the project root to the Python path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(project_root)
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spentbackend.settings')
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
@@ -18,8 +18,6 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 import os
 from datetime import timedelta
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials
 
 load_dotenv()
 
@@ -51,11 +49,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
-    'django.middleware.common.CommonMiddleware',
+    # Before CommonMiddleware, which can answer (e.g. redirect) without CORS headers
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -83,6 +77,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'spentbackend.wsgi.application'
+# Route login and profile to their async views; asgi.py turns this on, WSGI keeps the sync views
+ASYNC_VIEWS = os.getenv('DJANGO_ASYNC_VIEWS', 'false').lower() == 'true'
 
 
 # Database
@@ -132,20 +128,28 @@ CORS_ALLOWED_ORIGINS = [
 
 # Allow cookies to be sent with cross-origin requests
 CORS_ALLOW_CREDENTIALS = True
-# Firebase Admin SDK
-firebase_credentials = credentials.Certificate({
-    "type": "service_account",
-    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-    "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
-    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-    "token_uri": "https://oauth2.googleapis.com/token",
-    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL")
-})
-firebase_admin.initialize_app(firebase_credentials)
+# Firebase Admin SDK: initialized on first use from the FIREBASE_* variables (see firebase_app.py)
+
+# Read-through cache for profile reads. Per process by default, which is only coherent
+# with a single worker: a profile-set in one process can't invalidate another's copy.
+# Set PROFILE_CACHE_URL (redis://...) to share it when running several workers.
+if os.getenv('PROFILE_CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('PROFILE_CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': int(os.getenv('PROFILE_CACHE_MAX_ENTRIES', '10000'))},
+        }
+    }
+PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '300'))
+# Seconds between syncs of in-memory leaderboards with the changed user_stats counters (LEADERBOARD_BACKEND=memory)
+LEADERBOARD_REFRESH_SECONDS = int(os.getenv('LEADERBOARD_REFRESH_SECONDS', '60'))
 
 # MongoDB settings
 MONGO_URI = os.getenv("MONGO_URI")
\ No newline at end of file
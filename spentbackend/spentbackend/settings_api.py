@@ -0,0 +1,47 @@
+"""
+API-only settings for serverless deployments (the Vercel entry point, wsgi.py).
+
+Everything in settings.py except what only the admin and browser sessions
+need: no admin, auth, sessions, messages or static files apps, no CSRF or
+session middleware, and no SQL database. Every route is a JSON API
+authenticated with Bearer tokens, so a cold start loads a fraction of the
+modules and opens nothing until a request needs it.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'corsheaders',
+    'rest_framework',
+    'Profile',
+    'Login',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'corsheaders.middleware.CorsMiddleware',
+    'django.middleware.common.CommonMiddleware',
+]
+
+TEMPLATES = []
+
+# Login and Profile keep their data in MongoDB; nothing queries the SQL models
+DATABASES = {}
+
+REST_FRAMEWORK = {
+    # Views that need a user declare JWTAuthentication themselves; without contrib.auth
+    # there is no AnonymousUser, so unauthenticated requests carry None
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': [],
+    'UNAUTHENTICATED_USER': None,
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser', 'rest_framework.parsers.FormParser'],
+}
+
+# Each serverless instance is its own process. Without a shared PROFILE_CACHE_URL a
+# profile-set on one instance can't invalidate another's copy, so keep those copies
+# short-lived unless PROFILE_CACHE_TTL says otherwise.
+if not os.getenv('PROFILE_CACHE_URL'):
+    PROFILE_CACHE_TTL = int(os.getenv('PROFILE_CACHE_TTL', '5'))
@@ -1,10 +1,14 @@
 # spentbackend/urls.py
 
-from django.contrib import admin
+from django.conf import settings
 from django.urls import path, include
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('login/', include('Login.urls')),
     path('profile/', include('Profile.urls')),
 ]
+
+# The API-only profile (settings_api) leaves the admin out
+if 'django.contrib.admin' in settings.INSTALLED_APPS:
+    from django.contrib import admin
+    urlpatterns.insert(0, path('admin/', admin.site.urls))
@@ -7,7 +7,8 @@ sys.path.append(project_root)
 
 from django.core.wsgi import get_wsgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spentbackend.settings')
+# Vercel's entry point: the API-only settings profile keeps cold starts short
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'spentbackend.settings_api')
 
 application = get_wsgi_application()
 app = application
\ No newline at end of file
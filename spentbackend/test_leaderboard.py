@@ -0,0 +1,66 @@
+import random
+import unittest
+
+from leaderboard import InMemoryLeaderboard, _RankedSkipList
+
+
+class RankedSkipListTest(unittest.TestCase):
+    def test_rank_and_slice_match_a_sorted_list(self):
+        rng = random.Random(7)
+        ranking, expected = _RankedSkipList(), []
+        for key in rng.sample(range(10000), 500):
+            ranking.insert(key)
+            expected.append(key)
+        for key in rng.sample(expected, 200):
+            ranking.remove(key)
+            expected.remove(key)
+        expected.sort()
+
+        self.assertEqual(ranking.size, len(expected))
+        self.assertEqual(ranking.slice(0, len(expected)), expected)
+        self.assertEqual(ranking.slice(100, 5), expected[100:105])
+        for position in rng.sample(range(len(expected)), 50):
+            self.assertEqual(ranking.rank(expected[position]), position)
+        with self.assertRaises(KeyError):
+            ranking.remove(-1)
+
+
+class InMemoryLeaderboardTest(unittest.TestCase):
+    def test_sync_moves_only_changed_members(self):
+        boards = InMemoryLeaderboard()
+        boards.load('week', [('a', 5), ('b', 3), ('c', 3)], synced_to=1)
+        self.assertEqual(boards.top('week', 3), [('a', 5), ('b', 3), ('c', 3)])
+
+        boards.sync('week', [('c', 9), ('d', 1)], synced_to=2)
+        self.assertEqual(boards.top('week', 10), [('c', 9), ('a', 5), ('b', 3), ('d', 1)])
+        self.assertEqual(boards.rank('week', 'b'), 2)
+        self.assertEqual(boards.score('week', 'c'), 9)
+        self.assertEqual(boards.size('week'), 4)
+        self.assertEqual(boards.synced_to('week'), 2)
+
+        # Re-applying an overlap window changes nothing
+        boards.sync('week', [('c', 9)])
+        self.assertEqual(boards.size('week'), 4)
+        self.assertEqual(boards.synced_to('week'), 2)
+
+    def test_incr_adds_to_the_current_score(self):
+        boards = InMemoryLeaderboard()
+        boards.incr_many([('day', 'a', 2), ('day', 'b', 1), ('day', 'b', 4)])
+        self.assertEqual(boards.top('day', 2), [('b', 5), ('a', 2)])
+        self.assertIsNone(boards.rank('day', 'missing'))
+
+    def test_keeps_only_the_most_recently_used_boards(self):
+        boards = InMemoryLeaderboard(max_boards=2)
+        boards.load('day:1', [('a', 1)], synced_to=1)
+        boards.load('day:2', [('a', 2)], synced_to=2)
+        boards.top('day:1', 1)
+        boards.load('day:3', [('a', 3)], synced_to=3)
+
+        self.assertEqual(boards.score('day:1', 'a'), 1)
+        self.assertIsNone(boards.loaded_at('day:2'))
+        self.assertIsNone(boards.synced_to('day:2'))
+        self.assertEqual(len(boards._boards), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+# token_cache.py
+# Shared by the Django apps and the FastAPI service (src/main.py): no Django imports here.
+import asyncio
+import contextlib
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+TOKEN_CACHE_TTL_SECONDS = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of verified token claims, keyed by the token's SHA-256 digest.
+
+    Only successful verifications are cached. An entry lives until the token's
+    own ``exp`` claim or ``ttl_seconds``, whichever comes first, so an expired
+    token is always re-verified (and rejected) rather than served from cache.
+    """
+
+    def __init__(self, max_entries: int = TOKEN_CACHE_SIZE, ttl_seconds: float = TOKEN_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # digest -> (expires_at, claims)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str):
+        digest = self._digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            expires_at, claims = entry
+            if expires_at <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return claims
+
+    def put(self, token: str, claims: dict):
+        expires_at = time.time() + self.ttl_seconds
+        if isinstance(claims.get('exp'), (int, float)):
+            expires_at = min(expires_at, claims['exp'])
+        digest = self._digest(token)
+        with self._lock:
+            self._entries[digest] = (expires_at, claims)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def verify(self, token: str, verifier):
+        """Return cached claims for ``token``, or call ``verifier(token)`` and cache the result."""
+        claims = self.get(token)
+        if claims is None:
+            claims = verifier(token)
+            self.put(token, claims)
+        return claims
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+jwt_cache = VerifiedTokenCache()
+firebase_cache = VerifiedTokenCache()
+
+
+def decode_jwt(token: str, secret: str) -> dict:
+    # Raises jwt.ExpiredSignatureError / jwt.InvalidTokenError like jwt.decode
+    return jwt_cache.verify(token, lambda t: jwt.decode(t, secret, algorithms=["HS256"]))
+
+
+def verify_firebase_token(id_token: str, auth) -> dict:
+    # `auth` is firebase_admin.auth; raises its InvalidIdTokenError / ValueError like verify_id_token
+    return firebase_cache.verify(id_token, auth.verify_id_token)
+
+
+async def verify_firebase_token_async(id_token: str, auth, timer=contextlib.nullcontext) -> dict:
+    # Cache hits stay on the event loop; verify_id_token may fetch Google's public keys, so it runs on a thread.
+    # `timer` wraps only that call, e.g. to record Firebase latency without counting cache hits
+    claims = firebase_cache.get(id_token)
+    if claims is None:
+        with timer():
+            claims = await asyncio.to_thread(auth.verify_id_token, id_token)
+        firebase_cache.put(id_token, claims)
+    return claims
@@ -0,0 +1,117 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+
+class FrameShedError(Exception):
+    """Raised for a frame that was dropped before inference; ``reason`` is 'superseded' or 'stale'."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Frame {reason}")
+        self.reason = reason
+
+
+class RateLimitedError(Exception):
+    """Raised when a user sends frames faster than their token bucket allows."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("Frame rate limit exceeded")
+        self.retry_after = retry_after
+
+
+class _UserSlot:
+    __slots__ = ('tokens', 'refilled_at', 'busy', 'waiting')
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.refilled_at = time.monotonic()
+        self.busy = False
+        self.waiting = None  # Future of the one frame queued behind the running one
+
+
+class AdmissionController:
+    """Per-user admission for frames, so an overloaded user only ever waits for their newest frame.
+
+    Each user has at most one frame running and one waiting. A newer frame
+    replaces the waiting one, which is shed as 'superseded' at once; a frame
+    that waited longer than ``max_wait`` is shed as 'stale' instead of run.
+    A token bucket (``rate`` frames/s, ``burst`` deep) bounds each user's
+    frame rate. State is per process, so with several uvicorn workers the
+    limits apply per worker; session state itself stays consistent across
+    workers through the session store's per-session lock.
+    """
+
+    def __init__(self, rate: float = None, burst: float = None, max_wait: float = None, max_users: int = None):
+        self.rate = rate if rate is not None else float(os.getenv("ADMISSION_RATE", "30"))
+        self.burst = burst if burst is not None else float(os.getenv("ADMISSION_BURST", "30"))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "0.5"))
+        self.max_users = max_users or int(os.getenv("ADMISSION_MAX_USERS", "10000"))
+        self._slots = OrderedDict()  # user key -> _UserSlot; only touched from the event loop thread
+
+    def _slot(self, key: str) -> _UserSlot:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = self._slots[key] = _UserSlot(self.burst)
+            if len(self._slots) > self.max_users:
+                self._evict()
+        self._slots.move_to_end(key)
+        return slot
+
+    def _evict(self):
+        # Forget the least recently seen users that have nothing in flight
+        for key in list(self._slots):
+            if len(self._slots) <= self.max_users:
+                break
+            slot = self._slots[key]
+            if not slot.busy:
+                del self._slots[key]
+
+    def _take_token(self, slot: _UserSlot):
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        slot.tokens = min(self.burst, slot.tokens + (now - slot.refilled_at) * self.rate)
+        slot.refilled_at = now
+        if slot.tokens < 1:
+            raise RateLimitedError((1 - slot.tokens) / self.rate)
+        slot.tokens -= 1
+
+    def _release(self, slot: _UserSlot):
+        waiting, slot.waiting = slot.waiting, None
+        if waiting is not None and not waiting.done():
+            waiting.set_result(True)  # Hand the slot straight to the waiting frame; stays busy
+        else:
+            slot.busy = False
+
+    async def run(self, key: str, work):
+        """Run ``work()`` (a coroutine function) for user ``key`` once admitted and return its result.
+
+        Raises RateLimitedError or FrameShedError instead when the frame isn't run.
+        """
+        slot = self._slot(key)
+        self._take_token(slot)
+        if slot.busy:
+            if slot.waiting is not None and not slot.waiting.done():
+                slot.waiting.set_result(False)  # Latest frame wins
+            loop = asyncio.get_running_loop()
+            waiting = slot.waiting = loop.create_future()
+            arrived = loop.time()
+            try:
+                admitted = await waiting
+            except asyncio.CancelledError:
+                if waiting.done() and not waiting.cancelled() and waiting.result():
+                    self._release(slot)  # The slot was handed over just as the client went away
+                raise
+            if not admitted:
+                raise FrameShedError('superseded')
+            if loop.time() - arrived > self.max_wait:
+                self._release(slot)
+                raise FrameShedError('stale')
+        else:
+            slot.busy = True
+        try:
+            return await work()
+        finally:
+            self._release(slot)
+
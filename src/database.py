@@ -0,0 +1,34 @@
+import os
+
+# Shared with the Django backend (spentbackend/ is on sys.path, see main.py)
+from memory_mongo import AsyncInMemoryDatabase
+
+
+def create_database():
+    """Return the async database used by the FastAPI service.
+
+    ``MONGO_URI=memory://`` selects an in-process stand-in for tests and local
+    load runs; anything else is handed to PyMongo's native async client.
+    """
+    uri = os.getenv("MONGO_URI", "")
+    name = os.getenv("MONGO_DB_NAME", "pushup_counter")
+    if uri.startswith("memory://"):
+        return AsyncInMemoryDatabase(name)
+
+    from pymongo import AsyncMongoClient
+
+    client = AsyncMongoClient(
+        uri,
+        maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "100")),
+        minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "0")),
+        serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        connectTimeoutMS=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000")),
+        socketTimeoutMS=int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "10000")),
+        retryWrites=os.getenv("MONGO_RETRY_WRITES", "true").lower() == "true",
+    )
+    return client[name]
+
+
+async def close_database(db):
+    if not isinstance(db, AsyncInMemoryDatabase):
+        await db.client.close()
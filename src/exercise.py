@@ -1,84 +1,83 @@
-import cv2
+import time
+
 import numpy as np
-import mediapipe as mp
-
-def calculate_angle(a, b, c):
-    a = np.array(a)  # First point
-    b = np.array(b)  # Mid point
-    c = np.array(c)  # End point
-    
-    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
-    angle = np.abs(radians * 180.0 / np.pi)
-    
-    if angle > 180.0:
-        angle = 360 - angle
-        
-    return angle
+
+# Angle helpers live with the rule engine; re-exported for existing imports
+from rules import DEFAULT_EXERCISE, EXERCISES, calculate_angle, calculate_angles  # noqa: F401
+
+# Longest gap between two frames that still counts toward a timed hold
+MAX_HOLD_GAP_SECONDS = 1.0
+
+def format_feedback(messages) -> str:
+    return "; ".join(messages) if messages else "Good form!"
 
 class Exercise:
-    def __init__(self):
+    """Per-session state for one exercise, driven by its compiled rule plan (see rules.py)."""
+
+    def __init__(self, kind: str = DEFAULT_EXERCISE):
+        if kind not in EXERCISES:
+            raise ValueError(f"Unknown exercise: {kind}")
+        self.kind = kind
+        self.plan = EXERCISES[kind]
         self.counter = 0
-        self.stage = 'up'
+        self.stage = self.plan.definition.initial_stage
         self.feedback = []
+        self.held = 0.0  # Seconds in the hold stage, for timed exercises
+        self.last_seen = None
+
+    def to_dict(self):
+        return {'kind': self.kind, 'counter': self.counter, 'stage': self.stage, 'feedback': list(self.feedback),
+                'held': self.held, 'last_seen': self.last_seen}
+
+    @classmethod
+    def from_dict(cls, state, kind: str = None):
+        # Sessions saved before multi-exercise support are push-ups; switching exercise starts over
+        saved_kind = (state or {}).get('kind', DEFAULT_EXERCISE)
+        exercise = cls(kind or saved_kind)
+        if state and exercise.kind == saved_kind:
+            exercise.counter = state.get('counter', 0)
+            exercise.stage = state.get('stage', exercise.stage)
+            exercise.feedback = list(state.get('feedback', []))
+            exercise.held = state.get('held', 0.0)
+            exercise.last_seen = state.get('last_seen')
+        return exercise
 
     def pushups(self, image: np.ndarray, landmarks: list, reps: int):
-        mp_pose = mp.solutions.pose.PoseLandmark
-        # Define landmarks
-        r1 = [int(landmarks[mp_pose.RIGHT_SHOULDER].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_SHOULDER].y * image.shape[0])]
-        r2 = [int(landmarks[mp_pose.RIGHT_ELBOW].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_ELBOW].y * image.shape[0])]
-        r3 = [int(landmarks[mp_pose.RIGHT_WRIST].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_WRIST].y * image.shape[0])]
-        l1 = [int(landmarks[mp_pose.LEFT_SHOULDER].x * image.shape[1]), int(landmarks[mp_pose.LEFT_SHOULDER].y * image.shape[0])]
-        l2 = [int(landmarks[mp_pose.LEFT_ELBOW].x * image.shape[1]), int(landmarks[mp_pose.LEFT_ELBOW].y * image.shape[0])]
-        l3 = [int(landmarks[mp_pose.LEFT_WRIST].x * image.shape[1]), int(landmarks[mp_pose.LEFT_WRIST].y * image.shape[0])]
-        l4 = [int(landmarks[mp_pose.LEFT_HIP].x * image.shape[1]), int(landmarks[mp_pose.LEFT_HIP].y * image.shape[0])]
-        l5 = [int(landmarks[mp_pose.LEFT_KNEE].x * image.shape[1]), int(landmarks[mp_pose.LEFT_KNEE].y * image.shape[0])]
-        l6 = [int(landmarks[mp_pose.LEFT_ANKLE].x * image.shape[1]), int(landmarks[mp_pose.LEFT_ANKLE].y * image.shape[0])]
-        r4 = [int(landmarks[mp_pose.RIGHT_HIP].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_HIP].y * image.shape[0])]
-        r5 = [int(landmarks[mp_pose.RIGHT_KNEE].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_KNEE].y * image.shape[0])]
-        r6 = [int(landmarks[mp_pose.RIGHT_ANKLE].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_ANKLE].y * image.shape[0])]
-        rpalm = [int(landmarks[mp_pose.RIGHT_PINKY].x * image.shape[1]), int(landmarks[mp_pose.RIGHT_PINKY].y * image.shape[0])]
-        lpalm = [int(landmarks[mp_pose.LEFT_PINKY].x * image.shape[1]), int(landmarks[mp_pose.LEFT_PINKY].y * image.shape[0])]
-
-        # Calculate angles
-        angleR = calculate_angle(r1, r2, r3)
-        angleL = calculate_angle(l1, l2, l3)
-        back_angleR = calculate_angle(r1, r4, r5)
-        back_angleL = calculate_angle(l1, l4, l5)
-        palms_distance = np.linalg.norm(np.array(rpalm) - np.array(lpalm))
-        shoulder_diff = abs(r1[1] - l1[1])
-        hip_diff = abs(r4[1] - l4[1])
-        alignment_threshold = 50
-
-        # Flags and colors
-        has_error = False
-        if angleR <= 50 or angleL <= 50:
-            has_error = True
-        if back_angleR <= 120 or back_angleL <= 120:
-            has_error = True
-        if palms_distance < 50:
-            has_error = True
-        if shoulder_diff > alignment_threshold or hip_diff > alignment_threshold:
-            has_error = True
+        return self.evaluate(landmarks, image.shape[1], image.shape[0], reps)
+
+    def evaluate(self, landmarks, width: int, height: int, reps: int, timestamp: float = None):
+        features = self.plan.features(self.plan.gather(landmarks), width, height)
+        return self.step(features, reps, timestamp)
+
+    def step(self, features: np.ndarray, reps: int, timestamp: float = None):
+        """Apply the form checks and stage machine to one frame's features."""
+        values = features.tolist()
+        definition = self.plan.definition
 
         # Feedback
         self.feedback = []  # Reset feedback for this frame
-        if angleR <= 50 or angleL <= 50:
-            self.feedback.append("Keep your arms straight!")
-        if back_angleR <= 120 or back_angleL <= 120:
-            self.feedback.append("Keep your back straight!")
-        if palms_distance < 30:
-            self.feedback.append("Keep your palms further apart!")
-        if shoulder_diff > alignment_threshold or hip_diff > alignment_threshold:
-            self.feedback.append("Align your shoulders and hips horizontally!")
+        blocked = False
+        for message, conditions, blocks in self.plan.checks:
+            if any(op(values[column], value) for column, op, value in conditions):
+                if message:
+                    self.feedback.append(message)
+                blocked = blocked or blocks
 
         # Counter logic
-        if not has_error:
-            if angleL < 90 and angleR < 90 and self.stage == 'up':
-                self.counter += 1
-                self.stage = 'down'
-                self.feedback.append(f"Push-up count: {self.counter}")
-            if angleL > 90 and angleR > 90 and self.stage == 'down':
-                self.stage = 'up'
+        previous_stage = self.stage
+        if blocked and definition.unit == 'seconds':
+            self.stage = definition.initial_stage
+        elif not blocked:
+            for target, conditions, count in self.plan.transitions.get(self.stage, ()):
+                if all(op(values[column], value) for column, op, value in conditions):
+                    self.stage = target
+                    if count:
+                        self.counter += 1
+                        self.feedback.append(definition.count_message.format(count=self.counter))
+                    break
+
+        if definition.unit == 'seconds':
+            self._hold(previous_stage, time.time() if timestamp is None else timestamp)
 
         if self.counter >= reps:
             self.feedback.append("Exercise complete!")
@@ -86,5 +85,37 @@ class Exercise:
 
         return False
 
+    def _hold(self, previous_stage: str, now: float):
+        definition = self.plan.definition
+        if previous_stage == self.stage == definition.hold_stage and self.last_seen is not None:
+            self.held += min(max(0.0, now - self.last_seen), MAX_HOLD_GAP_SECONDS)
+        self.last_seen = now
+        if int(self.held) > self.counter:
+            self.counter = int(self.held)
+            self.feedback.append(definition.count_message.format(count=self.counter))
+
+    def evaluate_batch(self, landmarks: np.ndarray, width: int, height: int, reps: int, timestamps=None):
+        """Evaluate a whole landmark sequence shaped (N, 33, >=2).
+
+        Features for every frame are computed in one vectorized pass; only the
+        stage machine runs per frame. Returns per-frame results and the frame
+        indices at which each rep (or, for timed exercises, second) was counted.
+        """
+        features = self.plan.features(self.plan.gather(np.asarray(landmarks)), width, height)
+        frames = []
+        rep_timeline = []
+        for index, row in enumerate(features):
+            previous = self.counter
+            completed = self.step(row, reps, None if timestamps is None else timestamps[index])
+            if self.counter != previous:
+                rep_timeline.append({'frame': index, 'count': self.counter})
+            frames.append({
+                'feedback': self.get_feedback(),
+                'count': self.counter,
+                'stage': self.stage,
+                'completed': completed,
+            })
+        return {'frames': frames, 'reps': rep_timeline}
+
     def get_feedback(self):
-        return "; ".join(self.feedback) if self.feedback else "Good form!"
\ No newline at end of file
+        return format_feedback(self.feedback)
@@ -1,51 +1,122 @@
 import os
-from datetime import datetime, timedelta
+import sys
+import asyncio
+import json
+import logging
+import math
+import time
+import tempfile
+import uuid
+from datetime import datetime
+from functools import lru_cache
 from typing import List, Dict, Optional
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Request, Response
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, File, Form, Header, Query, UploadFile, HTTPException, Depends, Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordBearer
-from pydantic import BaseModel, EmailStr, Field
+from starlette.requests import HTTPConnection
+from pydantic import BaseModel, Field
 from dotenv import load_dotenv
-import pymongo
-import firebase_admin
-from firebase_admin import credentials, auth
-import cv2
 import numpy as np
-import mediapipe as mp
 import jwt
 
 # Load environment variables
 load_dotenv()
 
-# Initialize the exercise class
-from exercise import Exercise
-exercise = Exercise()
-
-# Initialize Mediapipe Pose model
-mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
-
-# Initialize MongoDB client
-mongo_uri = os.getenv("MONGO_URI")
-client = pymongo.MongoClient(mongo_uri)
-db = client["pushup_counter"]
-collection = db["profile"]
-
-# Initialize Firebase Admin SDK
-firebase_credentials = credentials.Certificate({
-    "type": "service_account",
-    "project_id": os.getenv("FIREBASE_PROJECT_ID"),
-    "private_key_id": os.getenv("FIREBASE_PRIVATE_KEY_ID"),
-    "private_key": os.getenv("FIREBASE_PRIVATE_KEY").replace("\\n", "\n"),
-    "client_email": os.getenv("FIREBASE_CLIENT_EMAIL"),
-    "client_id": os.getenv("FIREBASE_CLIENT_ID"),
-    "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-    "token_uri": "https://oauth2.googleapis.com/token",
-    "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-    "client_x509_cert_url": os.getenv("FIREBASE_CLIENT_X509_CERT_URL")
-})
-firebase_admin.initialize_app(firebase_credentials)
+logger = logging.getLogger(__name__)
+
+# Verified-token cache shared with the Django backend
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spentbackend"))
+from token_cache import decode_jwt, verify_firebase_token_async
+# One Firebase app per process, initialized on first use under a lock (also used by the Django backend)
+from firebase_app import get_firebase_auth
+from indexes import ensure_indexes_async
+from leaderboard import create_leaderboard
+
+# Prometheus metrics exposed on /metrics
+from metrics import (
+    EXTERNAL_CALL_SECONDS, FRAMES_TOTAL, POSE_QUEUE_DEPTH, REGISTRY, REPS_TOTAL,
+    REQUEST_SECONDS, REQUESTS_IN_FLIGHT, STAGE_SECONDS,
+)
+
+# Initialize the per-session exercise state store
+from exercise import Exercise, format_feedback
+from rules import DEFAULT_EXERCISE, EXERCISES
+from session_store import SessionBusyError, create_session_store
+session_store = create_session_store()
+
+# Clients that don't send a session id get the "default" one in their namespace (see resolve_session_id)
+DEFAULT_SESSION_ID = "default"
+
+# MongoDB access (async client, or an in-memory stand-in with MONGO_URI=memory://)
+from database import close_database, create_database
+
+# Roles served by this instance: "auth" (login/profile) and/or "inference" (frames, video).
+# Auth-only instances never start pose workers or load MediaPipe.
+SERVICE_ROLES = {role.strip() for role in os.getenv("SERVICE_ROLES", "auth,inference").split(",")}
+INFERENCE_ENABLED = "inference" in SERVICE_ROLES
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "true").lower() == "true"
+MONGO_ENSURE_INDEXES = os.getenv("MONGO_ENSURE_INDEXES", "false").lower() == "true"
+
+# Pose-estimation worker pool (each worker owns a Mediapipe Pose model); cheap to import,
+# cv2 and mediapipe are only loaded inside the worker processes
+from pose_pool import ENABLED_TIERS, MOTION_MAX_SKIPS, MOTION_THRESHOLD, PoolBusyError, PosePool
+
+# Compact binary responses (application/x-pushup-frame)
+import wire
+
+# Per-user latest-frame-wins admission and rate limits for /process
+from admission import AdmissionController, FrameShedError, RateLimitedError
+
+VIDEO_MAX_BYTES = int(os.getenv("VIDEO_MAX_BYTES", str(500 * 1024 * 1024)))
+
+# Response modes for /process: 'hex' keeps the annotated JPEG as a hex string in the JSON,
+# 'binary' returns it as a raw image/jpeg part, 'landmarks' skips drawing and encoding
+RESPONSE_MODES = {'hex': 'hex', 'binary': 'jpeg', 'landmarks': 'none'}
+DEFAULT_RESPONSE_MODE = os.getenv("RESPONSE_MODE", "hex")
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "95"))
+JPEG_MAX_WIDTH = int(os.getenv("JPEG_MAX_WIDTH", "0"))
+# Smallest width the annotated JPEG may be downscaled to; 0 keeps the original size
+MIN_JPEG_WIDTH = 64
+
+# Heavy subsystems are created on first use (or by the startup warm-up), not at import time
+@lru_cache(maxsize=None)
+def get_db():
+    # Async MongoDB client so database round-trips never block the event loop
+    return create_database()
+
+@lru_cache(maxsize=None)
+def get_pose_pool() -> PosePool:
+    if not INFERENCE_ENABLED:
+        raise HTTPException(status_code=503, detail="Inference is not enabled on this instance")
+    return PosePool()
+
+@lru_cache(maxsize=None)
+def get_admission() -> AdmissionController:
+    return AdmissionController()
+
+@lru_cache(maxsize=None)
+def get_video_jobs():
+    if not INFERENCE_ENABLED:
+        raise HTTPException(status_code=503, detail="Inference is not enabled on this instance")
+    from video import VideoJobManager
+    return VideoJobManager()
+
+@lru_cache(maxsize=None)
+def get_workout_recorder():
+    # Buffered write-behind of workout history; first called from a request, so the flush task has a loop
+    from workouts import WorkoutRecorder
+    # Memory leaderboards live in the Django process and are rebuilt there from user_stats;
+    # only a shared (Redis) board is worth updating from here
+    leaderboard = create_leaderboard() if os.getenv("LEADERBOARD_BACKEND", "memory").lower() == "redis" else None
+    recorder = WorkoutRecorder(get_db(), leaderboard=leaderboard)
+    recorder.start()
+    return recorder
+
+# Set once the startup warm-up has finished; /readyz reports it to the load balancer.
+# A failed warm-up is retried with backoff; `error` is the last failure and `attempts` counts tries
+readiness = {'ready': False, 'error': None, 'attempts': 0}
 
 # JWT secret key
 JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
@@ -61,6 +132,41 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Endpoints tracked individually; everything else is reported as "other" to bound label cardinality
+TRACKED_ENDPOINTS = {"/login", "/profile-set", "/process", "/landmarks", "/video"}
+
+class RequestMetricsMiddleware:
+    """Records latency and in-flight requests per endpoint.
+
+    Plain ASGI rather than @app.middleware("http"), which runs every response
+    through a BaseHTTPMiddleware stream and an extra task per request.
+    """
+
+    def __init__(self, app, endpoints):
+        self.app = app
+        self.endpoints = endpoints
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        endpoint = scope["path"] if scope["path"] in self.endpoints else "other"
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        with REQUESTS_IN_FLIGHT.track_inprogress(endpoint=endpoint):
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, status=status)
+
+app.add_middleware(RequestMetricsMiddleware, endpoints=TRACKED_ENDPOINTS)
 
 # OAuth2PasswordBearer instance
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
@@ -72,6 +178,15 @@ class PoseLandmarks(BaseModel):
     count: int
     image: str  # Hex string of the image
 
+class LandmarkFrame(BaseModel):
+    # 33 rows of [x, y, z, visibility] in normalized image coordinates (z and visibility optional)
+    landmarks: List[List[float]]
+    width: int = Field(gt=0)
+    height: int = Field(gt=0)
+    session_id: Optional[str] = None
+    exercise: Optional[str] = None
+    timestamp: Optional[float] = None  # Capture time in seconds, for timed exercises such as planks
+
 class Profile(BaseModel):
     gender: str
     dob: str
@@ -95,24 +210,98 @@ class User(BaseModel):
     last_login: datetime = Field(default_factory=datetime.now)
     firebase_metadata: FirebaseMetadata = Field(default_factory=FirebaseMetadata)
 
-def get_current_user(token: str = Depends(oauth2_scheme)):
+async def load_session(session_id: str, kind: Optional[str] = None):
+    state = await session_store.get(session_id) or {}
+    return Exercise.from_dict(state.get('exercise'), kind), state
+
+async def save_session(session_id: str, exercise: Exercise, state: Dict):
+    state['exercise'] = exercise.to_dict()
+    await session_store.set(session_id, state)
+
+def decode_token(token: str) -> Dict:
     try:
         # Decode the JWT token
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=["HS256"])
-        email = payload.get("email")
-        if email is None:
-            raise HTTPException(status_code=401, detail="Invalid authentication credentials")
-        return email
+        return decode_jwt(token, JWT_SECRET_KEY)
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token has expired")
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
+def get_current_user(token: str = Depends(oauth2_scheme)):
+    email = decode_token(token).get("email")
+    if email is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return email
+
+def get_current_uid(token: str = Depends(oauth2_scheme)):
+    uid = decode_token(token).get("uid")
+    if uid is None:
+        raise HTTPException(status_code=401, detail="Invalid authentication credentials")
+    return uid
+
+def optional_uid(connection: HTTPConnection) -> Optional[str]:
+    # Frame endpoints stay usable anonymously; a bearer header or the login cookie ties frames to a user
+    authorization = connection.headers.get("Authorization", "")
+    token = authorization[len("Bearer "):] if authorization.startswith("Bearer ") else connection.cookies.get("auth_token")
+    if not token:
+        return None
+    return decode_token(token).get("uid")
+
+def client_host(connection: HTTPConnection) -> str:
+    # The peer address, or the forwarded one when uvicorn runs with --proxy-headers behind a trusted proxy
+    return connection.client.host if connection.client else "unknown"
+
+def resolve_session_id(connection: HTTPConnection, session_id: Optional[str], user_id: Optional[str] = None) -> str:
+    # The session store key. A signed-in user's sessions live under their uid, so no one else can
+    # read, count into or reset them by sending the same id. Anonymous clients without a session id
+    # each get their own session instead of all sharing one count.
+    if user_id:
+        return f"user:{user_id}:{session_id or DEFAULT_SESSION_ID}"
+    return f"anon:{session_id}" if session_id else f"anon:{DEFAULT_SESSION_ID}:{client_host(connection)}"
+
+def admission_key(connection: HTTPConnection, user_id: Optional[str], session_id: str) -> str:
+    # Signed-in users share one admission slot across their sessions; anonymous frames are keyed by
+    # address and session, so one client can neither shed nor rate-limit another's frames
+    return user_id or f"{client_host(connection)}|{session_id}"
+
+def record_workout(user_id: Optional[str], session_id: str, state: Dict, previous: int, exercise: Exercise):
+    # Workout history is only kept for signed-in users; anonymous sessions just count
+    if not user_id:
+        return
+    recorder = get_workout_recorder()
+    unit = exercise.plan.definition.unit
+    if state.get('workout_id') is None or state.get('workout_exercise') != exercise.kind:
+        # A session that switches exercise starts a new workout
+        if state.get('workout_id'):
+            recorder.end_workout(state['workout_id'], user_id)
+        # History keeps the id the client sent, not the store key
+        state['workout_id'] = recorder.start_workout(user_id, session_id.removeprefix(f"user:{user_id}:"),
+                                                     exercise.kind, unit)
+        state['workout_exercise'] = exercise.kind
+        state['user_id'] = user_id
+    recorder.record_frame(state['workout_id'], user_id, previous, exercise.counter, exercise.feedback, state, unit,
+                          exercise.kind)
+
+async def end_session(session_id: str) -> bool:
+    # Waits for a frame in flight, which would otherwise save the session again after the reset.
+    # Returns whether there was a session to end.
+    async with session_store.lock(session_id):
+        state = await session_store.get(session_id)
+        if state is None:
+            return False
+        if state.get('workout_id') and state.get('user_id'):
+            get_workout_recorder().end_workout(state['workout_id'], state['user_id'])
+        await session_store.delete(session_id)
+        return True
+
 @app.post("/login")
 async def login(login_request: LoginRequest, response: Response):
+    # The first call builds the credentials and initializes the app; keep that off the event loop
+    auth = get_firebase_auth() if get_firebase_auth.cache_info().currsize else await run_in_threadpool(get_firebase_auth)
     try:
-        # Verify the Firebase ID token
-        decoded_token = auth.verify_id_token(login_request.id_token)
+        # Verify the Firebase ID token; only a cache miss calls Firebase, so only that is timed
+        decoded_token = await verify_firebase_token_async(
+            login_request.id_token, auth, timer=lambda: EXTERNAL_CALL_SECONDS.time(call="firebase_verify_id_token"))
         
         # Create User instance with data from decoded token
         user = User(
@@ -127,16 +316,16 @@ async def login(login_request: LoginRequest, response: Response):
         )
         
         # Update or insert user data in MongoDB
-        db.users.update_one(
-            {"userid": user.userid},
-            {"$set": user.dict(by_alias=True)},
-            upsert=True
-        )
+        with EXTERNAL_CALL_SECONDS.time(call="mongo_users_update"):
+            await get_db().users.update_one(
+                {"userid": user.userid},
+                {"$set": user.dict(by_alias=True)},
+                upsert=True
+            )
         
         # Create JWT token
         token_data = {"email": user.email, "uid": user.userid}
         token = jwt.encode(token_data, JWT_SECRET_KEY, algorithm="HS256")
-        print(JWT_SECRET_KEY)
         # Set token in a cookie
         response.set_cookie(key="auth_token", value=token, httponly=True, max_age=3600)
         
@@ -160,54 +349,517 @@ async def profile_set(profile: Profile, email: str = Depends(get_current_user)):
         "weight": profile.weight,
         "weight_unit": profile.weight_unit,
     }
-    db["profiles"].update_one({"email": email}, {"$set": profile_data}, upsert=True)
+    with EXTERNAL_CALL_SECONDS.time(call="mongo_profiles_update"):
+        await get_db()["profiles"].update_one({"email": email}, {"$set": profile_data}, upsert=True)
     return JSONResponse(content={"message": "Profile set successfully"})
 
+def resolve_frame_options(response_mode: Optional[str], jpeg_quality: Optional[int], max_width: Optional[int], tier: Optional[str] = None,
+                          exercise: Optional[str] = None, compact: bool = False, quantize: bool = False) -> Dict:
+    response_mode = response_mode or DEFAULT_RESPONSE_MODE
+    if response_mode not in RESPONSE_MODES:
+        raise ValueError(f"Unknown response_mode: {response_mode}")
+    quality = jpeg_quality if jpeg_quality is not None else JPEG_QUALITY
+    if not 1 <= quality <= 100:
+        raise ValueError("jpeg_quality must be between 1 and 100")
+    width = max_width if max_width is not None else JPEG_MAX_WIDTH
+    if width < 0 or 0 < width < MIN_JPEG_WIDTH:
+        raise ValueError(f"max_width must be 0 (original size) or at least {MIN_JPEG_WIDTH}")
+    # 'auto' degrades only through the enabled tiers, so with POSE_TIERS=balanced it is always 'balanced'
+    if tier not in (None, 'auto') and tier not in ENABLED_TIERS:
+        raise ValueError(f"Unknown or disabled quality tier: {tier}")
+    if exercise is not None and exercise not in EXERCISES:
+        raise ValueError(f"Unknown exercise: {exercise}")
+    image_format = RESPONSE_MODES[response_mode]
+    if compact and image_format == 'hex':
+        # The compact encoding carries the JPEG as raw bytes
+        image_format = 'jpeg'
+    return {
+        'image_format': image_format,
+        'jpeg_quality': quality,
+        'max_width': width,
+        'tier': tier,
+        'exercise': exercise,
+        'compact': compact,
+        'quantize': quantize,
+    }
+
+async def analyze_frame(contents: bytes, session_id: str, options: Dict, user_id: Optional[str] = None) -> Dict:
+    # Decode, run pose estimation on the tracked ROI and (optionally) draw and encode in a worker process.
+    # Returns the frame result; landmarks stay a (33, 3) float array (None without a pose) until
+    # the response is serialized, so the compact encoding never builds per-landmark objects.
+    # The session stays locked until its new state is saved, so concurrent frames of one
+    # session (in this process or another) never overwrite each other's count
+    async with session_store.lock(session_id):
+        exercise, state = await load_session(session_id, options['exercise'])
+        tracker = state.get('tracker') or {}
+        pose_pool = get_pose_pool()
+        tier = pose_pool.select_tier(options['tier'])
+        motion = {'motion_threshold': MOTION_THRESHOLD}
+        if tracker.get('thumbnail') and state.get('pose') and tracker.get('skips', 0) < MOTION_MAX_SKIPS:
+            # The last inferred frame had a pose: a static frame may reuse its landmarks.
+            # Capping consecutive skips bounds how stale the reused landmarks can get.
+            motion['motion_reference'] = tracker['thumbnail']
+            previous_pose = np.asarray(state['pose'], dtype=np.float32)
+            motion['previous_landmarks'] = np.column_stack((previous_pose, np.ones(len(previous_pose), np.float32)))
+        start = time.perf_counter()
+        result = await pose_pool.submit(contents, roi=tracker.get('roi'), tier=tier, image_format=options['image_format'],
+                                        jpeg_quality=options['jpeg_quality'], max_width=options['max_width'], **motion)
+        worker_seconds = sum(result['timings'].values())
+        STAGE_SECONDS.observe(max(0.0, time.perf_counter() - start - worker_seconds), stage="queue_wait")
+        for stage, seconds in result['timings'].items():
+            STAGE_SECONDS.observe(seconds, stage=stage)
+        landmarks = result['landmarks']
+        if not result['skipped']:
+            state['tracker'] = {'roi': result['roi'], 'thumbnail': result['thumbnail'] if landmarks is not None else None, 'skips': 0}
+
+        completed = False
+        if result['skipped']:
+            # Scene static since the last inferred frame: the exercise stage can't have changed
+            FRAMES_TOTAL.inc(result="motion_skipped")
+            state['tracker'] = dict(tracker, skips=tracker.get('skips', 0) + 1)
+            feedback = exercise.feedback
+        # Check if landmarks are detected
+        elif landmarks is not None:
+            # Check form and get feedback
+            previous = exercise.counter
+            with STAGE_SECONDS.time(stage="rules"):
+                completed = exercise.evaluate(landmarks, result['width'], result['height'], reps=10)
+            FRAMES_TOTAL.inc(result="detected")
+            REPS_TOTAL.inc(exercise.counter - previous, exercise=exercise.kind)
+            state['pose'] = landmarks[:, :3].tolist()
+            record_workout(user_id, session_id, state, previous, exercise)
+            feedback = exercise.feedback
+        else:
+            FRAMES_TOTAL.inc(result="no_landmarks")
+            feedback = ['No landmarks detected!']
+        await save_session(session_id, exercise, state)
+
+        return {
+            'feedback': feedback,
+            'count': exercise.counter,
+            'stage': exercise.stage,
+            'exercise': exercise.kind,
+            'landmarks': None if landmarks is None else landmarks[:, :3],
+            'tier': tier,
+            'skipped': result['skipped'],
+            'completed': completed,
+            'image': result['image'],  # Hex string in hex mode, JPEG bytes in binary mode
+        }
+
+async def shed_frame(session_id: str, options: Dict, reason: str) -> Dict:
+    # The cheap answer for a frame dropped before inference: the session's last known
+    # result, marked skipped, with no pose.process, rules or drawing
+    FRAMES_TOTAL.inc(result=reason)
+    exercise, state = await load_session(session_id, options['exercise'])
+    pose = state.get('pose')
+    return {
+        'feedback': exercise.feedback,
+        'count': exercise.counter,
+        'stage': exercise.stage,
+        'exercise': exercise.kind,
+        'landmarks': np.asarray(pose, dtype=np.float32) if pose else None,
+        'tier': None,
+        'skipped': True,
+        'shed': reason,
+        'completed': False,
+        'image': None,
+    }
+
+def frame_json(frame: Dict, image_format: str) -> Dict:
+    # The JSON payload clients have always received
+    landmarks = frame['landmarks']
+    payload = {
+        'feedback': format_feedback(frame['feedback']),
+        'count': frame['count'],
+        'landmarks': [] if landmarks is None else [{'x': x, 'y': y, 'z': z} for x, y, z in landmarks.tolist()],
+        'tier': frame['tier'],
+    }
+    if frame['skipped']:
+        payload['skipped'] = True
+    if frame.get('shed'):
+        payload['shed'] = frame['shed']
+    if image_format == 'hex':
+        payload['image'] = frame['image'] or ''  # Hex string of the annotated JPEG
+    return payload
+
+def multipart_response(payload: Dict, image: Optional[bytes]) -> Response:
+    # multipart/mixed: a JSON part followed by the annotated JPEG, if any
+    boundary = uuid.uuid4().hex
+    parts = [
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode() + json.dumps(payload).encode() + b"\r\n"
+    ]
+    if image:
+        parts.append(f"--{boundary}\r\nContent-Type: image/jpeg\r\n\r\n".encode() + image + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return Response(content=b"".join(parts), media_type=f"multipart/mixed; boundary={boundary}")
+
+def frame_response(frame: Dict, options: Dict) -> Response:
+    if options['compact']:
+        return Response(content=wire.encode_frame(frame, options['quantize']), media_type=wire.MEDIA_TYPE)
+    if options['image_format'] == 'jpeg':
+        return multipart_response(frame_json(frame, 'jpeg'), frame['image'])
+    return JSONResponse(content=frame_json(frame, options['image_format']))
+
 @app.post("/process")
-async def process_image(file: UploadFile = File(...)):
+async def process_image(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    response_mode: Optional[str] = Form(None),
+    jpeg_quality: Optional[int] = Form(None),
+    max_width: Optional[int] = Form(None),
+    tier: Optional[str] = Form(None),
+    exercise: Optional[str] = Form(None),
+    encoding: Optional[str] = Query(None),
+    quantize: bool = Query(False),
+    x_session_id: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+    user_id: Optional[str] = Depends(optional_uid),
+):
+    session_id = resolve_session_id(request, session_id or x_session_id, user_id)
+
     # Read the image file
     contents = await file.read()
-    np_img = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
-
-    # Convert image to RGB
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    result = pose.process(img_rgb)
-
-    # Check if landmarks are detected
-    if result.pose_landmarks:
-        # Define landmarks
-        landmarks = []
-        for lm in result.pose_landmarks.landmark:
-            landmarks.append({'x': lm.x, 'y': lm.y, 'z': lm.z})
-
-        # Check push-up form and get feedback
-        completed = exercise.pushups(img, result.pose_landmarks.landmark, reps=10)
-        feedback = exercise.get_feedback()
-        count = exercise.counter
-
-        # Draw landmarks and connections on the image
-        img_rgb = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2BGR)
-        mp_drawing = mp.solutions.drawing_utils
-        mp_drawing.draw_landmarks(img_rgb, result.pose_landmarks, mp_pose.POSE_CONNECTIONS)
-
-        # Convert image to bytes
-        _, img_encoded = cv2.imencode('.jpg', img_rgb)
-        img_bytes = img_encoded.tobytes()
-
-        return JSONResponse(content={
-            'feedback': feedback,
-            'count': count,
-            'landmarks': landmarks,
-            'image': img_bytes.hex()  # Convert to hex string for easier handling
-        })
+    try:
+        options = resolve_frame_options(response_mode, jpeg_quality, max_width, tier, exercise,
+                                        wire.accepts_compact(accept, encoding), quantize)
+        # At most one frame per user runs and one waits; a newer frame sheds the waiting one
+        frame = await get_admission().run(admission_key(request, user_id, session_id),
+                                          lambda: analyze_frame(contents, session_id, options, user_id))
+    except FrameShedError as e:
+        frame = await shed_frame(session_id, options, e.reason)
+    except RateLimitedError as e:
+        FRAMES_TOTAL.inc(result="rate_limited")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except (PoolBusyError, SessionBusyError) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    with STAGE_SECONDS.time(stage="serialize"):
+        return frame_response(frame, options)
+
+@app.post("/landmarks")
+async def process_landmarks(
+    request: Request,
+    frame: LandmarkFrame,
+    encoding: Optional[str] = Query(None),
+    x_session_id: Optional[str] = Header(None),
+    accept: Optional[str] = Header(None),
+    user_id: Optional[str] = Depends(optional_uid),
+):
+    # For clients that run pose detection on the device: only the exercise rules run here
+    session_id = resolve_session_id(request, frame.session_id or x_session_id, user_id)
+    try:
+        landmarks = np.asarray(frame.landmarks, dtype=np.float64)
+        compact = wire.accepts_compact(accept, encoding)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if landmarks.ndim != 2 or landmarks.shape[0] != 33 or not 2 <= landmarks.shape[1] <= 4:
+        raise HTTPException(status_code=422, detail="landmarks must be 33 rows of [x, y, z, visibility]")
+
+    if frame.exercise is not None and frame.exercise not in EXERCISES:
+        raise HTTPException(status_code=422, detail=f"Unknown exercise: {frame.exercise}")
+
+    async def evaluate():
+        async with session_store.lock(session_id):
+            exercise, state = await load_session(session_id, frame.exercise)
+            previous = exercise.counter
+            with STAGE_SECONDS.time(stage="rules"):
+                completed = exercise.evaluate(landmarks, frame.width, frame.height, reps=10, timestamp=frame.timestamp)
+            FRAMES_TOTAL.inc(result="client_landmarks")
+            REPS_TOTAL.inc(exercise.counter - previous, exercise=exercise.kind)
+            record_workout(user_id, session_id, state, previous, exercise)
+            await save_session(session_id, exercise, state)
+            return exercise, completed
+
+    shed = None
+    try:
+        # Same per-user limits as /process: one frame runs, the newest one waits
+        exercise, completed = await get_admission().run(admission_key(request, user_id, session_id), evaluate)
+    except FrameShedError as e:
+        # Answer with the session's last result, like a shed /process frame
+        FRAMES_TOTAL.inc(result=e.reason)
+        shed = e.reason
+        exercise, _ = await load_session(session_id, frame.exercise)
+        completed = False
+    except RateLimitedError as e:
+        FRAMES_TOTAL.inc(result="rate_limited")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))})
+    except SessionBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if compact:
+        result = {'feedback': exercise.feedback, 'count': exercise.counter, 'stage': exercise.stage,
+                  'exercise': exercise.kind, 'landmarks': None, 'tier': None, 'completed': completed,
+                  'skipped': shed is not None, 'shed': shed}
+        return Response(content=wire.encode_frame(result), media_type=wire.MEDIA_TYPE)
+    result = {'feedback': exercise.get_feedback(), 'count': exercise.counter, 'stage': exercise.stage}
+    if shed:
+        result['shed'] = shed
+    return result
+
+@app.get("/wire-format")
+async def wire_format():
+    # Code tables for decoding application/x-pushup-frame responses
+    return wire.code_tables()
+
+@app.websocket("/ws/process")
+async def process_stream(
+    websocket: WebSocket,
+    session_id: Optional[str] = None,
+    response_mode: Optional[str] = None,
+    jpeg_quality: Optional[int] = None,
+    max_width: Optional[int] = None,
+    tier: Optional[str] = None,
+    exercise: Optional[str] = None,
+    encoding: Optional[str] = None,
+    quantize: bool = False,
+):
+    # One connection per workout: binary messages are JPEG/PNG frames,
+    # the text message "reset" clears the session's count.
+    # In binary mode each JSON result is followed by a binary message with the JPEG;
+    # with encoding=compact every result is a single binary message (see wire.py).
+    # Frames go through the same admission control as /process: the socket keeps being read while
+    # a frame runs, so a client sending faster than inference gets older frames answered as shed
+    # instead of a growing backlog of stale results.
+    await websocket.accept()
+    if not INFERENCE_ENABLED:
+        # An auth-only instance: 1013 tells the client to try again later (on another instance)
+        await websocket.close(code=1013, reason="Inference is not enabled on this instance")
+        return
+    try:
+        options = resolve_frame_options(response_mode, jpeg_quality, max_width, tier, exercise,
+                                        wire.accepts_compact(websocket.headers.get("accept"), encoding), quantize)
+        user_id = optional_uid(websocket)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+    session_id = resolve_session_id(websocket, session_id, user_id)
+    key = admission_key(websocket, user_id, session_id)
+    sending = asyncio.Lock()  # A JSON result and its JPEG must not interleave with another frame's
+    in_flight = set()
+
+    async def send_frame(frame: Dict):
+        async with sending:
+            if options['compact']:
+                await websocket.send_bytes(wire.encode_frame(frame, options['quantize']))
+                return
+            await websocket.send_json(frame_json(frame, options['image_format']))
+            if options['image_format'] == 'jpeg' and frame['image']:
+                await websocket.send_bytes(frame['image'])
+
+    async def send_error(error: str, detail: str, **extra):
+        async with sending:
+            await websocket.send_json({'error': error, 'detail': detail, **extra})
+
+    async def handle(contents: bytes):
+        try:
+            try:
+                frame = await get_admission().run(key, lambda: analyze_frame(contents, session_id, options, user_id))
+            except FrameShedError as e:
+                frame = await shed_frame(session_id, options, e.reason)
+            except RateLimitedError as e:
+                FRAMES_TOTAL.inc(result="rate_limited")
+                await send_error('rate_limited', str(e), retry_after=e.retry_after)
+                return
+            except (PoolBusyError, SessionBusyError) as e:
+                await send_error('busy', str(e))
+                return
+            except ValueError as e:
+                await send_error('invalid_frame', str(e))
+                return
+            except HTTPException as e:
+                # The pose pool or session store can't serve this instance's frames at all
+                async with sending:
+                    await websocket.close(code=1013, reason=str(e.detail))
+                return
+            await send_frame(frame)
+        except (WebSocketDisconnect, RuntimeError):
+            pass  # The client went away while its frame was running
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                task = asyncio.create_task(handle(message["bytes"]))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            elif message.get("text") == "reset":
+                try:
+                    await end_session(session_id)
+                except SessionBusyError as e:
+                    await send_error('busy', str(e))
+                    continue
+                async with sending:
+                    await websocket.send_json({'feedback': 'Session reset', 'count': 0, 'landmarks': []})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+def save_upload(file: UploadFile) -> str:
+    # Copy the upload to disk in chunks so the video is never held in memory
+    suffix = os.path.splitext(file.filename or "")[1] or ".mp4"
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        try:
+            copied = 0
+            while chunk := file.file.read(1024 * 1024):
+                copied += len(chunk)
+                if copied > VIDEO_MAX_BYTES:
+                    raise ValueError("Video is too large")
+                tmp.write(chunk)
+        except Exception:
+            os.unlink(tmp.name)
+            raise
+    return tmp.name
+
+@app.post("/video", status_code=202)
+async def upload_video(
+    file: UploadFile = File(...),
+    sample_fps: float = Form(10),
+    reps: int = Form(10),
+    exercise: str = Form(DEFAULT_EXERCISE),
+):
+    if sample_fps < 0:
+        raise HTTPException(status_code=400, detail="sample_fps must not be negative")
+    if exercise not in EXERCISES:
+        raise HTTPException(status_code=400, detail=f"Unknown exercise: {exercise}")
+    # Before saving the upload, so an instance without inference never writes the file
+    video_jobs = get_video_jobs()
+    try:
+        path = await run_in_threadpool(save_upload, file)
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    submitted = False
+    try:
+        job = video_jobs.submit(path, sample_fps, reps, exercise)
+        submitted = True
+    finally:
+        # Once submitted, the job owns the file and deletes it when it finishes
+        if not submitted:
+            os.unlink(path)
+    return JSONResponse(status_code=202, content=job)
+
+@app.get("/video/{job_id}")
+async def video_status(job_id: str):
+    job = get_video_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Video job not found")
+    job.pop('finished_at', None)
+    return JSONResponse(content=job)
+
+@app.delete("/session")
+@app.delete("/session/{session_id}")
+async def reset_session(request: Request, session_id: Optional[str] = None,
+                        user_id: Optional[str] = Depends(optional_uid)):
+    # Without an id, resets the caller's own default session. An id is looked up in the caller's
+    # namespace, so a signed-in user's session can only be reset with their token.
+    key = resolve_session_id(request, session_id, user_id)
+    try:
+        ended = await end_session(key)
+    except SessionBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    if session_id and not ended:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return JSONResponse(content={"message": "Session reset"})
+
+@app.get("/workouts")
+async def list_workouts(limit: int = 20, before: Optional[datetime] = None, user_id: str = Depends(get_current_uid)):
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    with EXTERNAL_CALL_SECONDS.time(call="mongo_workouts_find"):
+        workouts = await get_workout_recorder().list_workouts(user_id, limit, before)
+    return {"workouts": workouts}
+
+@app.get("/workouts/{workout_id}")
+async def get_workout(workout_id: str, user_id: str = Depends(get_current_uid)):
+    with EXTERNAL_CALL_SECONDS.time(call="mongo_workouts_find"):
+        workout = await get_workout_recorder().get_workout(user_id, workout_id)
+    if workout is None:
+        raise HTTPException(status_code=404, detail="Workout not found")
+    return workout
+
+@app.get("/metrics")
+async def metrics():
+    if get_pose_pool.cache_info().currsize:
+        POSE_QUEUE_DEPTH.set(get_pose_pool().pending)
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def liveness():
+    # The process is up and serving the event loop
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness_check():
+    # Only route traffic here once the models for this instance's roles are warm
+    if not readiness['ready']:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "error": readiness['error'],
+                                                      "attempts": readiness['attempts']})
+    if get_pose_pool.cache_info().currsize and not get_pose_pool().healthy:
+        # A pose worker died; ready again once the rebuilt pool has warmed up
+        return JSONResponse(status_code=503, content={"status": "pose_pool_restarting", "error": None})
+    return {"status": "ready", "roles": sorted(SERVICE_ROLES)}
+
+async def warm_up_once():
+    if "auth" in SERVICE_ROLES:
+        await run_in_threadpool(get_firebase_auth)
+        if MONGO_ENSURE_INDEXES:
+            # Idempotent; creates the users/profiles indexes declared in spentbackend/indexes.py
+            await ensure_indexes_async(get_db())
+        else:
+            get_db()
+    if INFERENCE_ENABLED:
+        # Spawns every pose worker, which loads and runs a dummy inference on each tier's model
+        await get_pose_pool().warm_up()
+
+async def warm_up(max_delay: float = 60.0):
+    # Retried until it succeeds, like PosePool._recover: a transient Mongo or Firebase outage at boot
+    # must not leave the instance alive but never ready
+    delay = 1.0
+    while True:
+        readiness['attempts'] += 1
+        try:
+            await warm_up_once()
+        except Exception as e:
+            readiness['error'] = str(e)
+            logger.exception("Warm-up failed; retrying in %.0f s", delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_delay)
+            continue
+        readiness['ready'] = True
+        readiness['error'] = None
+        return
+
+@app.on_event("startup")
+async def start_warm_up():
+    if WARMUP_ON_STARTUP:
+        # Run in the background so /healthz answers while models load
+        app.state.warm_up_task = asyncio.create_task(warm_up())
     else:
-        return JSONResponse(content={
-            'feedback': 'No landmarks detected!',
-            'count': exercise.counter,
-            'landmarks': [],
-            'image': ''
-        })
+        readiness['ready'] = True
+
+@app.on_event("shutdown")
+async def shutdown_subsystems():
+    warm_up_task = getattr(app.state, 'warm_up_task', None)
+    if warm_up_task is not None:
+        warm_up_task.cancel()
+    if get_workout_recorder.cache_info().currsize:
+        # Flush buffered workout history before the database connection goes away
+        await get_workout_recorder().close()
+    if get_db.cache_info().currsize:
+        await close_database(get_db())
+    if get_pose_pool.cache_info().currsize:
+        get_pose_pool().shutdown()
+    if get_video_jobs.cache_info().currsize:
+        get_video_jobs().shutdown()
+    await session_store.close()
 
 if __name__ == "__main__":
     import uvicorn
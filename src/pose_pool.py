@@ -0,0 +1,377 @@
+import asyncio
+import base64
+import functools
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+# cv2 and mediapipe are imported by the worker processes only (see _init_worker),
+# so the API process never loads them
+cv2 = None
+mp = None
+
+logger = logging.getLogger(__name__)
+
+# Picklable stand-in for MediaPipe's landmark proto
+Landmark = namedtuple('Landmark', ['x', 'y', 'z', 'visibility'])
+
+# Quality tiers, cheapest first; each maps to mp_pose.Pose() settings.
+# A worker's Pose graphs serve every session's frames in turn, so they run in static image
+# mode: MediaPipe's tracking state would carry one user's pose into another user's frame.
+# Per-session tracking is the ROI kept in the session state instead (see _detect).
+QUALITY_TIERS = {
+    'fast': {'static_image_mode': True, 'model_complexity': 0, 'min_detection_confidence': 0.5},
+    'balanced': {'static_image_mode': True, 'model_complexity': 1, 'min_detection_confidence': 0.5},
+    'accurate': {'static_image_mode': True, 'model_complexity': 2, 'min_detection_confidence': 0.5},
+}
+
+
+def _enabled_tiers(value: str) -> list:
+    """Parse POSE_TIERS into enabled tier names, cheapest first; raises ValueError on unknown names."""
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in QUALITY_TIERS]
+    if unknown or not names:
+        raise ValueError(f"POSE_TIERS has unknown quality tiers: {', '.join(unknown) or '(none given)'}; "
+                         f"choose from {', '.join(QUALITY_TIERS)}")
+    return [name for name in QUALITY_TIERS if name in names]
+
+
+# Only 'balanced' ships with the mediapipe wheel; the lite ('fast') and heavy ('accurate')
+# models are downloaded when a worker first loads them, so those tiers are opt-in.
+# A typo fails at import rather than on every frame.
+ENABLED_TIERS = _enabled_tiers(os.getenv("POSE_TIERS", "balanced"))
+DEFAULT_TIER = os.getenv("POSE_DEFAULT_TIER", "balanced")
+if DEFAULT_TIER not in QUALITY_TIERS:
+    raise ValueError(f"POSE_DEFAULT_TIER is not a quality tier: {DEFAULT_TIER}; choose from {', '.join(QUALITY_TIERS)}")
+
+# Queue fill ratio at which 'auto' steps down one tier, and two tiers
+AUTO_TIER_THRESHOLDS = (0.4, 0.75)
+
+# Each worker process owns one pre-warmed Pose graph per enabled tier
+_poses = {}
+
+# Input preparation: longest side fed to pose.process, and margin added around the tracked ROI
+POSE_INPUT_MAX_SIDE = int(os.getenv("POSE_INPUT_MAX_SIDE", "640"))
+ROI_MARGIN = float(os.getenv("ROI_MARGIN", "0.25"))
+ROI_MIN_VISIBILITY = 0.5
+
+# Motion gate: a grayscale thumbnail (longest side MOTION_THUMB_SIDE) is compared with the one
+# from the last frame that ran inference; if fewer than MOTION_THRESHOLD of the pixels in the
+# tracked ROI changed by more than MOTION_PIXEL_DELTA gray levels, pose.process is skipped.
+# MOTION_THRESHOLD=0 disables the gate.
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", "0.01"))
+MOTION_MAX_SKIPS = int(os.getenv("MOTION_MAX_SKIPS", "5"))
+MOTION_THUMB_SIDE = 64
+MOTION_PIXEL_DELTA = 12
+
+
+class PoolBusyError(Exception):
+    """Raised when the pose-estimation queue is full."""
+
+
+class PoolRestartingError(PoolBusyError):
+    """Raised for frames lost when a worker died; the pool is being rebuilt."""
+
+
+def _init_worker():
+    global cv2, mp
+    import cv2
+    import mediapipe as mp
+
+    # Build every tier's graph and run one dummy frame through it so the
+    # first real request doesn't pay model loading
+    blank = np.zeros((256, 256, 3), np.uint8)
+    for tier in ENABLED_TIERS:
+        _poses[tier] = mp.solutions.pose.Pose(**QUALITY_TIERS[tier])
+        _poses[tier].process(blank)
+
+
+def roi_from_landmarks(landmarks, margin: float = ROI_MARGIN):
+    # Normalized (x0, y0, x1, y1) box around the visible landmarks, padded by `margin`
+    points = [(lm.x, lm.y) for lm in landmarks if lm.visibility >= ROI_MIN_VISIBILITY]
+    if len(points) < 4:
+        return None
+    xs, ys = zip(*points)
+    pad_x = (max(xs) - min(xs)) * margin
+    pad_y = (max(ys) - min(ys)) * margin
+    x0, y0 = max(0.0, min(xs) - pad_x), max(0.0, min(ys) - pad_y)
+    x1, y1 = min(1.0, max(xs) + pad_x), min(1.0, max(ys) + pad_y)
+    if x1 - x0 < 0.05 or y1 - y0 < 0.05:
+        return None
+    return (x0, y0, x1, y1)
+
+def motion_thumbnail(contents: bytes) -> np.ndarray:
+    # JPEG decodes at 1/8 scale for a fraction of the full decode cost
+    thumb = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if thumb is None:
+        raise ValueError("Could not decode image")
+    scale = MOTION_THUMB_SIDE / max(thumb.shape)
+    if scale < 1:
+        thumb = cv2.resize(thumb, (max(1, round(thumb.shape[1] * scale)), max(1, round(thumb.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    return thumb
+
+def motion_score(thumb: np.ndarray, reference: np.ndarray, roi=None) -> float:
+    """Fraction of pixels (inside ``roi`` if given) that changed noticeably; 1.0 if not comparable."""
+    if reference is None or reference.shape != thumb.shape:
+        return 1.0
+    if roi is not None:
+        height, width = thumb.shape
+        x0, y0, x1, y1 = roi
+        window = (slice(int(y0 * height), max(int(y0 * height) + 1, int(np.ceil(y1 * height)))),
+                  slice(int(x0 * width), max(int(x0 * width) + 1, int(np.ceil(x1 * width)))))
+        thumb, reference = thumb[window], reference[window]
+    return float(np.count_nonzero(cv2.absdiff(thumb, reference) > MOTION_PIXEL_DELTA)) / thumb.size
+
+def encode_thumbnail(thumb: np.ndarray) -> dict:
+    # JSON-safe, so it can live in the (possibly Redis-backed) session state
+    return {'shape': list(thumb.shape), 'pixels': base64.b64encode(thumb.tobytes()).decode()}
+
+def decode_thumbnail(encoded) -> np.ndarray:
+    if not encoded:
+        return None
+    return np.frombuffer(base64.b64decode(encoded['pixels']), np.uint8).reshape(encoded['shape'])
+
+def _landmark_list(landmarks):
+    from mediapipe.framework.formats import landmark_pb2
+    return landmark_pb2.NormalizedLandmarkList(landmark=[
+        landmark_pb2.NormalizedLandmark(x=x, y=y, z=z, visibility=visibility) for x, y, z, visibility in np.asarray(landmarks).tolist()
+    ])
+
+def _detect(img: np.ndarray, tier: str, timings: dict, roi=None):
+    # Crop to the ROI (a view, no copy), downscale so the longest side is at most
+    # POSE_INPUT_MAX_SIDE, then map landmarks back to full-image normalized coordinates
+    height, width = img.shape[:2]
+    x0, y0, x1, y1 = roi or (0.0, 0.0, 1.0, 1.0)
+    left, top = int(x0 * width), int(y0 * height)
+    right, bottom = max(left + 1, int(x1 * width)), max(top + 1, int(y1 * height))
+    start = time.perf_counter()
+    crop = img[top:bottom, left:right]
+
+    scale = POSE_INPUT_MAX_SIDE / max(crop.shape[:2])
+    if scale < 1:
+        crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+
+    timings['prepare'] = timings.get('prepare', 0.0) + time.perf_counter() - start
+
+    # Convert image to RGB
+    start = time.perf_counter()
+    crop = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+    timings['convert'] = timings.get('convert', 0.0) + time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = _poses[tier].process(crop)
+    timings['pose'] = timings.get('pose', 0.0) + time.perf_counter() - start
+    if not result.pose_landmarks:
+        return None
+
+    crop_width, crop_height = (right - left) / width, (bottom - top) / height
+    for lm in result.pose_landmarks.landmark:
+        lm.x = left / width + lm.x * crop_width
+        lm.y = top / height + lm.y * crop_height
+    return result.pose_landmarks
+
+def _estimate(contents: bytes, tier: str = DEFAULT_TIER, image_format: str = 'hex', jpeg_quality: int = 95, max_width: int = 0, roi=None,
+              motion_threshold: float = 0.0, motion_reference=None, previous_landmarks=None):
+    # image_format: 'hex' (hex string), 'jpeg' (raw bytes) or 'none' (skip drawing and encoding).
+    # roi: normalized box tracked from the previous frame; None runs detection on the full frame.
+    # motion_reference: encoded thumbnail of the last inferred frame; when the scene hasn't moved
+    # since, inference is skipped and `previous_landmarks` are returned (and drawn) instead.
+    # Returns per-stage timings (seconds) alongside the result for the metrics endpoint.
+    timings = {}
+    thumb = None
+    if motion_threshold > 0:
+        start = time.perf_counter()
+        thumb = motion_thumbnail(contents)
+        static = (motion_reference is not None and previous_landmarks is not None
+                  and motion_score(thumb, decode_thumbnail(motion_reference), roi) < motion_threshold)
+        timings['motion'] = time.perf_counter() - start
+        if static:
+            result = {'landmarks': previous_landmarks, 'width': None, 'height': None, 'image': None, 'roi': roi,
+                      'thumbnail': None, 'skipped': True, 'timings': timings}
+            if image_format != 'none':
+                result['image'] = _render(_decode(contents, timings), _landmark_list(previous_landmarks),
+                                          image_format, jpeg_quality, max_width, timings)
+            return result
+
+    img = _decode(contents, timings)
+    pose_landmarks = _detect(img, tier, timings, roi)
+    if pose_landmarks is None and roi is not None:
+        # Tracking lost: re-detect on the full frame
+        pose_landmarks = _detect(img, tier, timings)
+
+    height, width = img.shape[:2]
+    result = {'landmarks': None, 'width': width, 'height': height, 'image': None, 'roi': None,
+              'thumbnail': encode_thumbnail(thumb) if thumb is not None else None, 'skipped': False, 'timings': timings}
+    if pose_landmarks is None:
+        return result
+
+    # One (33, 4) float32 array pickles far smaller and faster than 33 tuples
+    result['landmarks'] = np.array([(lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark], dtype=np.float32)
+    result['roi'] = roi_from_landmarks(pose_landmarks.landmark)
+    if image_format == 'none':
+        return result
+    result['image'] = _render(img, pose_landmarks, image_format, jpeg_quality, max_width, timings)
+    return result
+
+
+def _decode(contents: bytes, timings: dict) -> np.ndarray:
+    # Decode the image bytes
+    start = time.perf_counter()
+    np_img = np.frombuffer(contents, np.uint8)
+    img = cv2.imdecode(np_img, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError("Could not decode image")
+    timings['decode'] = time.perf_counter() - start
+    return img
+
+
+def _render(img: np.ndarray, pose_landmarks, image_format: str, jpeg_quality: int, max_width: int, timings: dict):
+    height, width = img.shape[:2]
+    # Draw landmarks and connections on the original BGR image
+    start = time.perf_counter()
+    mp.solutions.drawing_utils.draw_landmarks(img, pose_landmarks, mp.solutions.pose.POSE_CONNECTIONS)
+    if max_width and width > max_width:
+        img = cv2.resize(img, (max_width, max(1, round(height * max_width / width))), interpolation=cv2.INTER_AREA)
+    timings['draw'] = time.perf_counter() - start
+
+    # Convert image to bytes
+    start = time.perf_counter()
+    _, img_encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality])
+    image = img_encoded.tobytes()
+    timings['encode'] = time.perf_counter() - start
+    if image_format == 'hex':
+        start = time.perf_counter()
+        image = image.hex()
+        timings['hex'] = time.perf_counter() - start
+    return image
+
+
+def _ping():
+    return os.getpid()
+
+
+class PosePool:
+    """Runs MediaPipe pose estimation in worker processes off the event loop.
+
+    At most ``workers`` frames are processed concurrently and ``queue_size``
+    more may wait; beyond that ``submit`` raises ``PoolBusyError`` so callers
+    can shed load instead of queueing indefinitely.
+
+    If a worker dies (a crash, the OOM killer, a failed model load) the
+    executor is broken for good, so it is replaced with a fresh one and the
+    frames that were in flight fail with ``PoolRestartingError``. ``healthy``
+    stays False until the new workers have been warmed up in the background
+    (retried with backoff if they fail to start too).
+    """
+
+    def __init__(self, workers: int = None, queue_size: int = None):
+        self.workers = workers or int(os.getenv("POSE_WORKERS", os.cpu_count() or 1))
+        self.queue_size = queue_size if queue_size is not None else int(os.getenv("POSE_QUEUE_SIZE", self.workers * 2))
+        self._pending = 0
+        self.healthy = True
+        self.restarts = 0
+        self._recovery = None
+        self._executor = self._create_executor()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        # Spawn rather than fork: MediaPipe's graph threads don't survive a fork
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+        )
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # Every frame in flight on the broken executor fails at once; only the first rebuilds it
+        self.healthy = False
+        if broken is not self._executor:
+            return
+        self.restarts += 1
+        broken.shutdown(wait=False, cancel_futures=True)
+        self._executor = self._create_executor()
+
+    async def _recover(self):
+        # Warm the rebuilt workers without waiting for traffic, which /readyz keeps away meanwhile
+        delay = 1.0
+        while not self.healthy:
+            try:
+                await self.warm_up()
+            except Exception:
+                logger.exception("Pose pool restart failed; retrying in %.0f s", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    @property
+    def load(self) -> float:
+        return self._pending / (self.workers + self.queue_size)
+
+    def select_tier(self, requested: str = None) -> str:
+        """Resolve a requested tier name, or pick one from queue depth for 'auto'/None.
+
+        'auto' can only step down to cheaper tiers that are enabled; with the
+        default POSE_TIERS=balanced it always picks 'balanced'.
+        """
+        if requested and requested != 'auto':
+            if requested not in ENABLED_TIERS:
+                raise ValueError(f"Unknown or disabled quality tier: {requested}")
+            return requested
+        preferred = DEFAULT_TIER if DEFAULT_TIER in ENABLED_TIERS else ENABLED_TIERS[-1]
+        steps_down = sum(self.load >= threshold for threshold in AUTO_TIER_THRESHOLDS)
+        # Step down through the cheaper enabled tiers as the queue fills
+        index = max(0, ENABLED_TIERS.index(preferred) - steps_down)
+        return ENABLED_TIERS[index]
+
+    async def warm_up(self, timeout: float = 300):
+        """Start every worker process and wait until each has loaded and warmed its models."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        ready = set()
+        # A worker only runs tasks after its initializer finished, so keep pinging
+        # until every worker process has answered at least once
+        while len(ready) < self.workers:
+            if loop.time() > deadline:
+                raise TimeoutError(f"Only {len(ready)} of {self.workers} pose workers warmed up")
+            executor = self._executor
+            try:
+                pids = await asyncio.gather(*(loop.run_in_executor(executor, _ping) for _ in range(self.workers)))
+            except BrokenProcessPool:
+                # A worker failed to start (e.g. its model could not be loaded); leave a fresh pool behind
+                self._restart(executor)
+                raise
+            ready.update(pids)
+            if len(ready) < self.workers:
+                await asyncio.sleep(0.1)
+        self.healthy = True
+
+    async def submit(self, contents: bytes, **options):
+        # Only touched from the event loop thread, so a plain counter is enough
+        if self._pending >= self.workers + self.queue_size:
+            raise PoolBusyError("Pose estimation queue is full")
+        self._pending += 1
+        executor = self._executor
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(executor, functools.partial(_estimate, contents, **options))
+        except BrokenProcessPool:
+            self._restart(executor)
+            if self._recovery is None or self._recovery.done():
+                self._recovery = asyncio.get_running_loop().create_task(self._recover())
+            raise PoolRestartingError("A pose worker exited unexpectedly; the pool is restarting")
+        finally:
+            self._pending -= 1
+        return result
+
+    def shutdown(self):
+        if self._recovery is not None:
+            self._recovery.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,213 @@
+import operator
+from collections import namedtuple
+
+import numpy as np
+
+def calculate_angle(a, b, c):
+    a = np.array(a)  # First point
+    b = np.array(b)  # Mid point
+    c = np.array(c)  # End point
+
+    radians = np.arctan2(c[1] - b[1], c[0] - b[0]) - np.arctan2(a[1] - b[1], a[0] - b[0])
+    angle = np.abs(radians * 180.0 / np.pi)
+
+    if angle > 180.0:
+        angle = 360 - angle
+
+    return angle
+
+def calculate_angles(a: np.ndarray, b: np.ndarray, c: np.ndarray) -> np.ndarray:
+    # Vectorized calculate_angle over arrays of points shaped (..., 2)
+    radians = np.arctan2(c[..., 1] - b[..., 1], c[..., 0] - b[..., 0]) - np.arctan2(a[..., 1] - b[..., 1], a[..., 0] - b[..., 0])
+    angle = np.abs(np.degrees(radians))
+    return np.where(angle > 180.0, 360 - angle, angle)
+
+# Mediapipe Pose landmark indices
+LEFT_SHOULDER, RIGHT_SHOULDER = 11, 12
+LEFT_ELBOW, RIGHT_ELBOW = 13, 14
+LEFT_WRIST, RIGHT_WRIST = 15, 16
+LEFT_PINKY, RIGHT_PINKY = 17, 18
+LEFT_HIP, RIGHT_HIP = 23, 24
+LEFT_KNEE, RIGHT_KNEE = 25, 26
+LEFT_ANKLE, RIGHT_ANKLE = 27, 28
+
+# Features, computed on pixel coordinates: the angle at joint b (degrees),
+# the distance between two joints, and the vertical gap between two joints
+Angle = namedtuple('Angle', ['name', 'a', 'b', 'c'])
+Distance = namedtuple('Distance', ['name', 'a', 'b'])
+VerticalGap = namedtuple('VerticalGap', ['name', 'a', 'b'])
+
+# A condition is (feature name, operator, value)
+OPERATORS = {'<': operator.lt, '<=': operator.le, '>': operator.gt, '>=': operator.ge}
+
+# A check fires when any of its conditions holds. `message` (if any) is added to the
+# frame's feedback; a blocking check stops that frame from moving the stage machine.
+Check = namedtuple('Check', ['message', 'any_of', 'blocks'], defaults=(True,))
+
+# Taken when the exercise is in `source`, no blocking check fired and all conditions hold
+Transition = namedtuple('Transition', ['source', 'target', 'all_of', 'count'], defaults=(False,))
+
+# unit 'reps' counts transitions marked `count`; unit 'seconds' counts time spent in
+# `hold_stage`, and any blocking check drops the exercise back to `initial_stage`
+ExerciseDefinition = namedtuple('ExerciseDefinition', [
+    'name', 'features', 'checks', 'transitions', 'initial_stage', 'count_message', 'unit', 'hold_stage',
+], defaults=('reps', None))
+
+
+class CompiledExercise:
+    """An ExerciseDefinition turned into index arrays for a single vectorized pass.
+
+    Only the joints the definition references are gathered, and every angle,
+    distance and gap feature is computed with one NumPy expression per feature
+    kind, for one frame or a whole (N, 33, >=2) sequence alike.
+    """
+
+    def __init__(self, definition: ExerciseDefinition):
+        self.definition = definition
+        self.name = definition.name
+        joints = sorted({joint for feature in definition.features for joint in feature[1:]})
+        self.joints = np.array(joints)
+        position = {joint: i for i, joint in enumerate(joints)}
+        self.columns = {feature.name: i for i, feature in enumerate(definition.features)}
+
+        def plan(kind):
+            selected = [(i, feature) for i, feature in enumerate(definition.features) if isinstance(feature, kind)]
+            if not selected:
+                return None
+            columns = np.array([i for i, _ in selected])
+            points = [np.array([position[feature[k]] for _, feature in selected]) for k in range(1, len(kind._fields))]
+            return columns, points
+
+        self._angles = plan(Angle)
+        self._distances = plan(Distance)
+        self._gaps = plan(VerticalGap)
+
+        def conditions(pairs):
+            return [(self.columns[name], OPERATORS[op], value) for name, op, value in pairs]
+
+        self.checks = [(check.message, conditions(check.any_of), check.blocks) for check in definition.checks]
+        self.transitions = {}
+        for transition in definition.transitions:
+            self.transitions.setdefault(transition.source, []).append(
+                (transition.target, conditions(transition.all_of), transition.count))
+        self.messages = tuple(check.message for check in definition.checks if check.message)
+
+    def gather(self, landmarks) -> np.ndarray:
+        """Return the referenced joints as a float array shaped (..., J, 2).
+
+        ``landmarks`` is either a sequence of 33 landmark objects with ``x``/``y``
+        attributes, or an array shaped (..., 33, >=2) of normalized coordinates.
+        """
+        if isinstance(landmarks, np.ndarray):
+            return landmarks[..., self.joints, :2].astype(np.float64)
+        return np.array([(landmarks[i].x, landmarks[i].y) for i in self.joints], dtype=np.float64)
+
+    def features(self, joints: np.ndarray, width: int, height: int) -> np.ndarray:
+        """Compute every feature for joints from ``gather``; shaped (..., F) in declaration order."""
+        # Pixel coordinates, truncated like the original per-landmark int() casts
+        pts = np.trunc(joints * np.array([width, height], dtype=np.float64))
+        features = np.empty(pts.shape[:-2] + (len(self.columns),))
+        if self._angles:
+            columns, (a, b, c) = self._angles
+            features[..., columns] = calculate_angles(pts[..., a, :], pts[..., b, :], pts[..., c, :])
+        if self._distances:
+            columns, (a, b) = self._distances
+            features[..., columns] = np.linalg.norm(pts[..., a, :] - pts[..., b, :], axis=-1)
+        if self._gaps:
+            columns, (a, b) = self._gaps
+            features[..., columns] = np.abs(pts[..., a, 1] - pts[..., b, 1])
+        return features
+
+
+PUSHUPS = ExerciseDefinition(
+    name='pushups',
+    features=[
+        Angle('angle_r', RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST),
+        Angle('angle_l', LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST),
+        Angle('back_angle_r', RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        Angle('back_angle_l', LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        Distance('palms_distance', RIGHT_PINKY, LEFT_PINKY),
+        VerticalGap('shoulder_diff', RIGHT_SHOULDER, LEFT_SHOULDER),
+        VerticalGap('hip_diff', RIGHT_HIP, LEFT_HIP),
+    ],
+    checks=[
+        Check("Keep your arms straight!", [('angle_r', '<=', 50), ('angle_l', '<=', 50)]),
+        Check("Keep your back straight!", [('back_angle_r', '<=', 120), ('back_angle_l', '<=', 120)]),
+        Check("Keep your palms further apart!", [('palms_distance', '<', 30)], blocks=False),
+        Check(None, [('palms_distance', '<', 50)]),
+        Check("Align your shoulders and hips horizontally!", [('shoulder_diff', '>', 50), ('hip_diff', '>', 50)]),
+    ],
+    transitions=[
+        Transition('up', 'down', [('angle_l', '<', 90), ('angle_r', '<', 90)], count=True),
+        Transition('down', 'up', [('angle_l', '>', 90), ('angle_r', '>', 90)]),
+    ],
+    initial_stage='up',
+    count_message="Push-up count: {count}",
+)
+
+SQUATS = ExerciseDefinition(
+    name='squats',
+    features=[
+        Angle('knee_r', RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        Angle('knee_l', LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        Angle('hip_r', RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        Angle('hip_l', LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        VerticalGap('hip_diff', RIGHT_HIP, LEFT_HIP),
+    ],
+    checks=[
+        Check("Keep your chest up!", [('hip_r', '<', 45), ('hip_l', '<', 45)]),
+        Check("Keep your hips level!", [('hip_diff', '>', 50)]),
+    ],
+    transitions=[
+        Transition('up', 'down', [('knee_r', '<', 100), ('knee_l', '<', 100)]),
+        Transition('down', 'up', [('knee_r', '>', 160), ('knee_l', '>', 160)], count=True),
+    ],
+    initial_stage='up',
+    count_message="Squat count: {count}",
+)
+
+SITUPS = ExerciseDefinition(
+    name='situps',
+    features=[
+        Angle('hip_r', RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+        Angle('hip_l', LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE),
+        Angle('knee_r', RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        Angle('knee_l', LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+    ],
+    checks=[
+        Check("Keep your knees bent!", [('knee_r', '>', 130), ('knee_l', '>', 130)]),
+    ],
+    transitions=[
+        Transition('down', 'up', [('hip_r', '<', 70), ('hip_l', '<', 70)], count=True),
+        Transition('up', 'down', [('hip_r', '>', 120), ('hip_l', '>', 120)]),
+    ],
+    initial_stage='down',
+    count_message="Sit-up count: {count}",
+)
+
+PLANKS = ExerciseDefinition(
+    name='planks',
+    features=[
+        Angle('body_r', RIGHT_SHOULDER, RIGHT_HIP, RIGHT_ANKLE),
+        Angle('body_l', LEFT_SHOULDER, LEFT_HIP, LEFT_ANKLE),
+        VerticalGap('shoulder_diff', RIGHT_SHOULDER, LEFT_SHOULDER),
+    ],
+    checks=[
+        Check("Keep your hips in line with your shoulders!", [('body_r', '<', 160), ('body_l', '<', 160)]),
+        Check("Align your shoulders horizontally!", [('shoulder_diff', '>', 50)]),
+    ],
+    transitions=[
+        Transition('rest', 'hold', [('body_r', '>=', 160), ('body_l', '>=', 160)]),
+    ],
+    initial_stage='rest',
+    count_message="Plank time: {count}s",
+    unit='seconds',
+    hold_stage='hold',
+)
+
+# Compiled once at import; Exercise looks definitions up by name
+EXERCISES = {definition.name: CompiledExercise(definition) for definition in (PUSHUPS, SQUATS, SITUPS, PLANKS)}
+DEFAULT_EXERCISE = 'pushups'
+
+# Every form-error message any exercise can produce
+FORM_ERRORS = tuple(dict.fromkeys(message for compiled in EXERCISES.values() for message in compiled.messages))
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+
+class SessionBusyError(Exception):
+    """Raised when a session stayed locked by another request for longer than the lock wait."""
+
+
+def _local_lock(locks: weakref.WeakValueDictionary, session_id: str) -> asyncio.Lock:
+    # Kept only while some request holds or waits for it
+    lock = locks.get(session_id)
+    if lock is None:
+        lock = locks[session_id] = asyncio.Lock()
+    return lock
+
+
+class InMemorySessionStore:
+    """Per-process session store with LRU eviction and an idle TTL."""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()  # session_id -> (expires_at, state)
+        self._lock = threading.Lock()
+        self._session_locks = weakref.WeakValueDictionary()  # session_id -> asyncio.Lock
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Hold the session across a read, the awaits in between and the write back."""
+        async with _local_lock(self._session_locks, session_id):
+            yield
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            expires_at, state = entry
+            if expires_at < time.monotonic():
+                del self._sessions[session_id]
+                return None
+            self._sessions.move_to_end(session_id)
+            return state
+
+    async def set(self, session_id: str, state: Dict):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic() + self.ttl_seconds, state)
+            self._sessions.move_to_end(session_id)
+            self._evict()
+
+    async def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    async def close(self):
+        pass
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict(self):
+        # Drop expired sessions from the cold end, then enforce the size cap
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (expires_at, _) = next(iter(self._sessions.items()))
+            if expires_at >= now and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+
+
+# Deletes the lock only if this holder still owns it, so an expired lease never frees someone else's lock,
+# and tells waiting workers (subscribed to ARGV[2]) that the session is free
+_RELEASE_LOCK = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    redis.call('del', KEYS[1])
+    redis.call('publish', ARGV[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+
+class RedisSessionStore:
+    """Shared session store so every worker and node sees the same rep count.
+
+    Idle sessions expire through the key TTL; size-based eviction is left to
+    the server's ``maxmemory-policy`` (``allkeys-lru`` or ``volatile-lru``).
+    A frame holds its session's lock (a Redis lease of ``lock_timeout``
+    seconds) from reading the state to writing it back, so frames of one
+    session handled by different processes or nodes never overwrite each
+    other's count. Uses the asyncio client, so no call blocks the event loop.
+    """
+
+    def __init__(self, url: str, ttl_seconds: float = 1800, prefix: str = "pushup:session:",
+                 lock_timeout: float = 30, lock_wait: float = 5, client=None):
+        if client is None:
+            import redis.asyncio  # Optional dependency, only needed for the shared backend
+            client = redis.asyncio.Redis.from_url(url)
+
+        self.ttl_seconds = int(ttl_seconds)
+        self.prefix = prefix
+        self.lock_prefix = prefix.rstrip(":") + "-lock:"
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self._client = client
+        self._release = client.register_script(_RELEASE_LOCK)
+        self._session_locks = weakref.WeakValueDictionary()  # session_id -> asyncio.Lock
+
+    @asynccontextmanager
+    async def lock(self, session_id: str):
+        """Hold the session across a read, the awaits in between and the write back.
+
+        Requests in this process queue on a local lock first, so only one of
+        them waits on Redis for the lease. Raises SessionBusyError after
+        ``lock_wait`` seconds.
+        """
+        async with _local_lock(self._session_locks, session_id):
+            key = self.lock_prefix + session_id
+            token = uuid.uuid4().hex
+            if not await self._acquire(key, token):
+                await self._wait_for_release(key, token, session_id)
+            try:
+                yield
+            finally:
+                await self._release(keys=[key], args=[token, key])
+
+    async def _acquire(self, key: str, token: str) -> bool:
+        return bool(await self._client.set(key, token, nx=True, px=int(self.lock_timeout * 1000)))
+
+    async def _wait_for_release(self, key: str, token: str, session_id: str):
+        # Sleeps until the holder publishes its release on the lock's channel, or its lease runs out
+        # if it died mid-frame. Subscribing before retrying the SET means a release in between isn't missed.
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_wait
+        pubsub = self._client.pubsub()
+        try:
+            await pubsub.subscribe(key)
+            while not await self._acquire(key, token):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise SessionBusyError(f"Session {session_id} is busy")
+                lease_ms = await self._client.pttl(key)
+                if lease_ms == -2:
+                    continue  # Released between the SET and the PTTL
+                # A lease always has a TTL; without one, only lock_wait bounds the wait
+                timeout = remaining if lease_ms < 0 else min(remaining, lease_ms / 1000)
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        finally:
+            await pubsub.unsubscribe(key)
+            await pubsub.aclose()
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        raw = await self._client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        return json.loads(raw)
+
+    async def set(self, session_id: str, state: Dict):
+        await self._client.setex(self.prefix + session_id, self.ttl_seconds, json.dumps(state))
+
+    async def delete(self, session_id: str):
+        await self._client.delete(self.prefix + session_id)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_session_store():
+    # SESSION_BACKEND=memory keeps state in this process; redis shares it across workers
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", "1800"))
+    if backend == "redis":
+        return RedisSessionStore(
+            os.getenv("REDIS_URL", "redis://localhost:6379/0"),
+            ttl_seconds=ttl_seconds,
+            lock_timeout=float(os.getenv("SESSION_LOCK_TIMEOUT_SECONDS", "30")),
+            lock_wait=float(os.getenv("SESSION_LOCK_WAIT_SECONDS", "5")),
+        )
+    if backend == "memory":
+        return InMemorySessionStore(
+            max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")),
+            ttl_seconds=ttl_seconds,
+        )
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
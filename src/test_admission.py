@@ -0,0 +1,61 @@
+import asyncio
+import unittest
+
+from admission import AdmissionController, FrameShedError, RateLimitedError
+
+
+async def frames(controller, key, delays, gap=0.01):
+    """Send frames ``gap`` seconds apart, each taking its delay; return each one's result or exception."""
+    async def work(index, delay):
+        await asyncio.sleep(delay)
+        return index
+
+    tasks = []
+    for index, delay in enumerate(delays):
+        tasks.append(asyncio.ensure_future(controller.run(key, lambda i=index, d=delay: work(i, d))))
+        await asyncio.sleep(gap)
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+
+class AdmissionControllerTest(unittest.TestCase):
+    def controller(self, **options):
+        settings = {'rate': 0, 'burst': 10, 'max_wait': 1.0, 'max_users': 100}
+        settings.update(options)
+        return AdmissionController(**settings)
+
+    def test_newest_waiting_frame_supersedes_older_ones(self):
+        results = asyncio.run(frames(self.controller(), 'u1', [0.1, 0, 0, 0]))
+        self.assertEqual(results[0], 0)
+        self.assertEqual([r.reason for r in results[1:3]], ['superseded', 'superseded'])
+        self.assertEqual(results[3], 3)
+
+    def test_frame_that_waited_too_long_is_stale(self):
+        results = asyncio.run(frames(self.controller(max_wait=0.05), 'u1', [0.2, 0]))
+        self.assertEqual(results[0], 0)
+        self.assertIsInstance(results[1], FrameShedError)
+        self.assertEqual(results[1].reason, 'stale')
+
+    def test_users_do_not_wait_for_each_other(self):
+        controller = self.controller()
+
+        async def run():
+            return await asyncio.gather(frames(controller, 'u1', [0.1, 0]), frames(controller, 'u2', [0.1, 0]))
+
+        self.assertEqual(asyncio.run(run()), [[0, 1], [0, 1]])
+
+    def test_token_bucket_limits_frame_rate(self):
+        controller = self.controller(rate=1, burst=2)
+        results = asyncio.run(frames(controller, 'u1', [0, 0, 0], gap=0.05))
+        self.assertEqual(results[:2], [0, 1])
+        self.assertIsInstance(results[2], RateLimitedError)
+        self.assertGreater(results[2].retry_after, 0)
+
+    def test_forgets_idle_users_beyond_max_users(self):
+        controller = self.controller(max_users=2)
+        for key in ('u1', 'u2', 'u3'):
+            asyncio.run(frames(controller, key, [0]))
+        self.assertEqual(list(controller._slots), ['u2', 'u3'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import unittest
+from functools import lru_cache
+from types import SimpleNamespace
+from unittest import mock
+
+os.environ.setdefault("WARMUP_ON_STARTUP", "false")
+os.environ.setdefault("MONGO_URI", "memory://")
+os.environ.setdefault("JWT_SECRET_KEY", "test-secret")
+
+import jwt  # noqa: E402
+import numpy as np  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from starlette.websockets import WebSocketDisconnect  # noqa: E402
+
+import main  # noqa: E402
+import token_cache  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from metrics import EXTERNAL_CALL_SECONDS, REPS_TOTAL, REQUEST_SECONDS  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures", "pushup_landmarks.npy")
+
+
+class ResolveFrameOptionsTest(unittest.TestCase):
+    def test_defaults(self):
+        options = main.resolve_frame_options(None, None, None)
+        self.assertEqual(options['image_format'], 'hex')
+        self.assertEqual(options['max_width'], main.JPEG_MAX_WIDTH)
+
+    def test_rejects_bad_max_width(self):
+        for max_width in (-1, 1, main.MIN_JPEG_WIDTH - 1):
+            with self.assertRaises(ValueError):
+                main.resolve_frame_options('binary', None, max_width)
+        self.assertEqual(main.resolve_frame_options('binary', None, 0)['max_width'], 0)
+        self.assertEqual(main.resolve_frame_options('binary', None, main.MIN_JPEG_WIDTH)['max_width'], main.MIN_JPEG_WIDTH)
+
+    def test_rejects_bad_quality_and_mode(self):
+        with self.assertRaises(ValueError):
+            main.resolve_frame_options('hex', 0, None)
+        with self.assertRaises(ValueError):
+            main.resolve_frame_options('png', None, None)
+
+
+class ProcessValidationTest(unittest.TestCase):
+    def test_bad_max_width_is_a_client_error(self):
+        with TestClient(main.app) as client:
+            response = client.post("/process", files={'file': ('frame.jpg', b'not-a-jpeg', 'image/jpeg')},
+                                   data={'max_width': '-5', 'session_id': 'validation'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("max_width", response.json()['detail'])
+
+
+class AnonymousSessionTest(unittest.TestCase):
+    def send(self, client, frames):
+        response = None
+        for frame in frames:
+            response = client.post("/landmarks", json={'landmarks': frame.tolist(), 'width': 640, 'height': 480})
+            self.assertEqual(response.status_code, 200)
+        return response.json()['count']
+
+    def test_clients_without_a_session_id_do_not_share_one(self):
+        frames = np.load(FIXTURE)[:60]
+        first = TestClient(main.app, client=("203.0.113.1", 50000))
+        second = TestClient(main.app, client=("203.0.113.2", 50000))
+        # Replays the fixture far faster than the default rate limit allows
+        admission = AdmissionController(rate=0)
+        with mock.patch.object(main, 'get_admission', lambda: admission), first, second:
+            self.assertGreater(self.send(first, frames), 0)
+            self.assertEqual(self.send(second, frames[:1]), 0)
+            # DELETE /session without an id resets only the caller's own session
+            self.assertEqual(first.delete("/session").status_code, 200)
+            self.assertEqual(self.send(first, frames[:1]), 0)
+
+    def test_anonymous_admission_is_keyed_by_address_and_session(self):
+        def connection(host):
+            return SimpleNamespace(client=SimpleNamespace(host=host))
+
+        self.assertEqual(main.resolve_session_id(connection("203.0.113.1"), None), "anon:default:203.0.113.1")
+        self.assertEqual(main.resolve_session_id(connection("203.0.113.1"), "s1"), "anon:s1")
+        self.assertEqual(main.resolve_session_id(connection("203.0.113.1"), "s1", "u1"), "user:u1:s1")
+        self.assertEqual(main.resolve_session_id(connection("203.0.113.1"), None, "u1"), "user:u1:default")
+        self.assertNotEqual(main.admission_key(connection("203.0.113.1"), None, "s1"),
+                            main.admission_key(connection("203.0.113.2"), None, "s1"))
+        self.assertEqual(main.admission_key(connection("203.0.113.1"), "u1", "s1"), "u1")
+
+
+def bearer(uid):
+    return {'Authorization': 'Bearer ' + jwt.encode({'uid': uid, 'email': f'{uid}@example.com'}, main.JWT_SECRET_KEY)}
+
+
+class SessionOwnershipTest(unittest.TestCase):
+    def test_signed_in_sessions_are_only_reachable_with_their_token(self):
+        frames = np.load(FIXTURE)[:60]
+        admission = AdmissionController(rate=0)
+        # Signed-in frames would otherwise start workout history in the test database
+        with mock.patch.object(main, 'get_admission', lambda: admission), \
+                mock.patch.object(main, 'record_workout', mock.Mock()), \
+                TestClient(main.app, client=("203.0.113.20", 50000)) as client:
+            def send(frames, headers=None):
+                response = None
+                for frame in frames:
+                    response = client.post("/landmarks", headers=headers or {},
+                                           json={'landmarks': frame.tolist(), 'width': 640, 'height': 480, 'session_id': 'shared'})
+                return response.json()['count']
+
+            owned = send(frames, bearer('owner'))
+            self.assertGreater(owned, 0)
+            # The same id from someone else, signed in or not, is a different session
+            self.assertEqual(send(frames[:1], bearer('intruder')), 0)
+            self.assertEqual(send(frames[:1]), 0)
+            self.assertEqual(client.delete("/session/shared", headers=bearer('nobody')).status_code, 404)
+            self.assertEqual(send(frames[-1:], bearer('owner')), owned)
+
+            self.assertEqual(client.delete("/session/shared", headers=bearer('owner')).status_code, 200)
+            self.assertEqual(client.delete("/session/shared", headers=bearer('owner')).status_code, 404)
+
+
+class StreamAdmissionTest(unittest.TestCase):
+    def test_frames_queued_on_the_socket_are_shed_not_run_in_turn(self):
+        ran = []
+
+        async def slow_analyze(contents, session_id, options, user_id=None):
+            ran.append(contents)
+            await asyncio.sleep(0.3)
+            return dict(await main.shed_frame(session_id, options, 'test'), skipped=False, shed=None)
+
+        admission = AdmissionController(rate=0, max_wait=5)
+        with mock.patch.object(main, 'analyze_frame', slow_analyze), mock.patch.object(main, 'get_admission', lambda: admission), \
+                TestClient(main.app, client=("203.0.113.9", 50000)) as client, \
+                client.websocket_connect("/ws/process?response_mode=landmarks&session_id=stream") as websocket:
+            for index in range(4):
+                websocket.send_bytes(b"frame-%d" % index)
+            results = [websocket.receive_json() for _ in range(4)]
+        # The first frame runs, the newest waits and runs next, the ones in between are shed at once
+        self.assertEqual(ran, [b"frame-0", b"frame-3"])
+        self.assertEqual(sorted(result.get('shed') or 'ran' for result in results), ['ran', 'ran', 'superseded', 'superseded'])
+
+    def test_landmarks_share_the_rate_limit(self):
+        frames = np.load(FIXTURE)[:3]
+        admission = AdmissionController(rate=1, burst=2)
+        with mock.patch.object(main, 'get_admission', lambda: admission), \
+                TestClient(main.app, client=("203.0.113.10", 50000)) as client:
+            statuses = [client.post("/landmarks", json={'landmarks': frame.tolist(), 'width': 640, 'height': 480}).status_code
+                        for frame in frames]
+        self.assertEqual(statuses, [200, 200, 429])
+
+
+class StreamUnavailableTest(unittest.TestCase):
+    def assert_try_again_later(self, websocket):
+        with self.assertRaises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+        self.assertEqual(closed.exception.code, 1013)
+
+    def test_auth_only_instance_closes_with_try_again_later(self):
+        with mock.patch.object(main, 'INFERENCE_ENABLED', False), TestClient(main.app) as client, \
+                client.websocket_connect("/ws/process") as websocket:
+            self.assert_try_again_later(websocket)
+
+    def test_unavailable_pool_closes_instead_of_erroring(self):
+        async def unavailable(*args, **kwargs):
+            raise HTTPException(status_code=503, detail="Inference is not enabled on this instance")
+
+        with mock.patch.object(main, 'analyze_frame', unavailable), TestClient(main.app) as client, \
+                client.websocket_connect("/ws/process?session_id=unavailable") as websocket:
+            websocket.send_bytes(b"frame")
+            self.assert_try_again_later(websocket)
+
+
+def observations(histogram, **labels):
+    series = histogram._values.get(histogram._key(labels))
+    return sum(series[0]) if series else 0
+
+
+class MetricsTest(unittest.TestCase):
+    def test_requests_are_recorded_by_endpoint_and_status(self):
+        before = observations(REQUEST_SECONDS, endpoint="/process", status=400)
+        with TestClient(main.app) as client:
+            client.post("/process", files={'file': ('frame.jpg', b'not-a-jpeg', 'image/jpeg')},
+                        data={'max_width': '-5', 'session_id': 'metrics'})
+        self.assertEqual(observations(REQUEST_SECONDS, endpoint="/process", status=400), before + 1)
+
+    def test_reps_are_counted_per_exercise(self):
+        frames = np.load(FIXTURE)[:60]
+        admission = AdmissionController(rate=0)
+        before = dict(REPS_TOTAL._values)
+        with mock.patch.object(main, 'get_admission', lambda: admission), \
+                TestClient(main.app, client=("203.0.113.11", 50000)) as client:
+            for frame in frames:
+                client.post("/landmarks", json={'landmarks': frame.tolist(), 'width': 640, 'height': 480})
+        counted = {key: value - before.get(key, 0) for key, value in REPS_TOTAL._values.items()}
+        self.assertGreater(counted.get(('pushups',), 0), 0)
+        self.assertEqual(set(key for key, value in counted.items() if value), {('pushups',)})
+
+    def test_cached_logins_are_not_timed_as_firebase_calls(self):
+        auth = SimpleNamespace(verify_id_token=mock.Mock(return_value={'uid': 'u-metrics', 'email': 'a@example.com'}),
+                               InvalidIdTokenError=ValueError)
+        before = observations(EXTERNAL_CALL_SECONDS, call="firebase_verify_id_token")
+        with mock.patch.object(main, 'get_firebase_auth', lru_cache()(lambda: auth)), TestClient(main.app) as client:
+            for _ in range(3):
+                self.assertEqual(client.post("/login", json={'id_token': 'metrics-token'}).status_code, 200)
+        token_cache.firebase_cache.clear()
+        self.assertEqual(auth.verify_id_token.call_count, 1)
+        self.assertEqual(observations(EXTERNAL_CALL_SECONDS, call="firebase_verify_id_token"), before + 1)
+
+
+class WarmUpTest(unittest.TestCase):
+    def test_failed_warm_up_is_retried_until_ready(self):
+        calls = []
+
+        async def flaky_warm_up():
+            calls.append(1)
+            if len(calls) < 3:
+                raise ConnectionError("mongo unreachable")
+
+        state = {'ready': False, 'error': None, 'attempts': 0}
+        with mock.patch.object(main, 'warm_up_once', flaky_warm_up), mock.patch.dict(main.readiness, state), \
+                mock.patch.object(main.asyncio, 'sleep', mock.AsyncMock()) as sleep:
+            asyncio.run(main.warm_up())
+            self.assertEqual(dict(main.readiness), {'ready': True, 'error': None, 'attempts': 3})
+        self.assertEqual([call.args[0] for call in sleep.await_args_list], [1.0, 2.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
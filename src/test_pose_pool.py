@@ -0,0 +1,111 @@
+import asyncio
+import os
+import time
+import unittest
+from unittest import mock
+
+import pose_pool
+from pose_pool import PoolBusyError, PoolRestartingError, PosePool
+
+
+def _no_models():
+    # Stands in for _init_worker so the tests don't load MediaPipe
+    pass
+
+
+def _fake_estimate(contents, **options):
+    if contents == b"crash":
+        os._exit(1)  # Dies like a worker killed by the OOM killer
+    if contents == b"slow":
+        time.sleep(0.5)
+    return {'contents': contents, 'pid': os.getpid()}
+
+
+class PosePoolTest(unittest.TestCase):
+    def setUp(self):
+        patches = [mock.patch.object(pose_pool, '_init_worker', _no_models),
+                   mock.patch.object(pose_pool, '_estimate', _fake_estimate)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_rebuilds_the_executor_after_a_worker_dies(self):
+        async def run():
+            pool = PosePool(workers=1, queue_size=2)
+            try:
+                self.assertEqual((await pool.submit(b"before"))['contents'], b"before")
+                with self.assertRaises(PoolRestartingError):
+                    await pool.submit(b"crash")
+                self.assertFalse(pool.healthy)
+                self.assertEqual(pool.restarts, 1)
+
+                # The rebuilt workers are warmed in the background until the pool reports healthy again
+                deadline = time.monotonic() + 60
+                while not pool.healthy and time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                self.assertTrue(pool.healthy)
+                self.assertEqual((await pool.submit(b"after"))['contents'], b"after")
+                self.assertEqual(pool.pending, 0)
+            finally:
+                pool.shutdown()
+
+        asyncio.run(run())
+
+    def test_frames_in_flight_on_a_broken_pool_restart_it_once(self):
+        async def run():
+            pool = PosePool(workers=2, queue_size=2)
+            try:
+                await pool.warm_up()
+                results = await asyncio.gather(pool.submit(b"slow"), pool.submit(b"crash"), return_exceptions=True)
+                self.assertTrue(all(isinstance(result, PoolRestartingError) for result in results))
+                self.assertEqual(pool.restarts, 1)
+            finally:
+                pool.shutdown()
+
+        asyncio.run(run())
+
+    def test_sheds_frames_beyond_the_queue(self):
+        async def run():
+            pool = PosePool(workers=1, queue_size=1)
+            try:
+                await pool.warm_up()
+                results = await asyncio.gather(*(pool.submit(b"slow") for _ in range(3)), return_exceptions=True)
+                self.assertEqual(sum(isinstance(result, PoolBusyError) for result in results), 1)
+            finally:
+                pool.shutdown()
+
+        asyncio.run(run())
+
+
+class QualityTierTest(unittest.TestCase):
+    def test_pooled_models_keep_no_tracking_state(self):
+        # One Pose per tier serves every session's frames
+        for tier, settings in pose_pool.QUALITY_TIERS.items():
+            self.assertTrue(settings['static_image_mode'], tier)
+
+    def test_pose_tiers_are_validated_and_ordered_cheapest_first(self):
+        self.assertEqual(pose_pool._enabled_tiers("accurate, fast"), ['fast', 'accurate'])
+        for value in ("lite", "balanced,heavy", " , "):
+            with self.assertRaises(ValueError):
+                pose_pool._enabled_tiers(value)
+
+    def test_auto_steps_down_as_the_queue_fills(self):
+        with mock.patch.object(pose_pool, 'ENABLED_TIERS', ['fast', 'balanced', 'accurate']), \
+                mock.patch.object(pose_pool, 'DEFAULT_TIER', 'accurate'), \
+                mock.patch.object(pose_pool, '_init_worker', _no_models):
+            pool = PosePool(workers=1, queue_size=3)
+            try:
+                self.assertEqual(pool.select_tier('auto'), 'accurate')
+                pool._pending = 2
+                self.assertEqual(pool.select_tier(None), 'balanced')
+                pool._pending = 4
+                self.assertEqual(pool.select_tier('auto'), 'fast')
+                self.assertEqual(pool.select_tier('accurate'), 'accurate')
+                with self.assertRaises(ValueError):
+                    pool.select_tier('unknown')
+            finally:
+                pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+import os
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from exercise import Exercise
+from rules import EXERCISES, calculate_angle
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "fixtures", "pushup_landmarks.npy")
+WIDTH, HEIGHT = 640, 480
+
+
+class BaselinePushups:
+    """The hand-written push-up counter the rule engine replaced, kept verbatim apart from the landmark lookup."""
+
+    # mp.solutions.pose.PoseLandmark values
+    RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST, LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST = 12, 14, 16, 11, 13, 15
+    LEFT_HIP, LEFT_KNEE, RIGHT_HIP, RIGHT_KNEE, RIGHT_PINKY, LEFT_PINKY = 23, 25, 24, 26, 18, 17
+
+    def __init__(self):
+        self.counter = 0
+        self.stage = 'up'
+        self.feedback = []
+
+    def pushups(self, image, landmarks, reps):
+        def point(index):
+            return [int(landmarks[index].x * image.shape[1]), int(landmarks[index].y * image.shape[0])]
+
+        r1, r2, r3 = point(self.RIGHT_SHOULDER), point(self.RIGHT_ELBOW), point(self.RIGHT_WRIST)
+        l1, l2, l3 = point(self.LEFT_SHOULDER), point(self.LEFT_ELBOW), point(self.LEFT_WRIST)
+        l4, l5, r4, r5 = point(self.LEFT_HIP), point(self.LEFT_KNEE), point(self.RIGHT_HIP), point(self.RIGHT_KNEE)
+        rpalm, lpalm = point(self.RIGHT_PINKY), point(self.LEFT_PINKY)
+
+        angleR = calculate_angle(r1, r2, r3)
+        angleL = calculate_angle(l1, l2, l3)
+        back_angleR = calculate_angle(r1, r4, r5)
+        back_angleL = calculate_angle(l1, l4, l5)
+        palms_distance = np.linalg.norm(np.array(rpalm) - np.array(lpalm))
+        shoulder_diff = abs(r1[1] - l1[1])
+        hip_diff = abs(r4[1] - l4[1])
+        alignment_threshold = 50
+
+        has_error = False
+        if angleR <= 50 or angleL <= 50:
+            has_error = True
+        if back_angleR <= 120 or back_angleL <= 120:
+            has_error = True
+        if palms_distance < 50:
+            has_error = True
+        if shoulder_diff > alignment_threshold or hip_diff > alignment_threshold:
+            has_error = True
+
+        self.feedback = []
+        if angleR <= 50 or angleL <= 50:
+            self.feedback.append("Keep your arms straight!")
+        if back_angleR <= 120 or back_angleL <= 120:
+            self.feedback.append("Keep your back straight!")
+        if palms_distance < 30:
+            self.feedback.append("Keep your palms further apart!")
+        if shoulder_diff > alignment_threshold or hip_diff > alignment_threshold:
+            self.feedback.append("Align your shoulders and hips horizontally!")
+
+        if not has_error:
+            if angleL < 90 and angleR < 90 and self.stage == 'up':
+                self.counter += 1
+                self.stage = 'down'
+                self.feedback.append(f"Push-up count: {self.counter}")
+            if angleL > 90 and angleR > 90 and self.stage == 'down':
+                self.stage = 'up'
+
+        if self.counter >= reps:
+            self.feedback.append("Exercise complete!")
+            return True
+        return False
+
+    def get_feedback(self):
+        return "; ".join(self.feedback) if self.feedback else "Good form!"
+
+
+def as_landmarks(frame):
+    return [SimpleNamespace(x=float(x), y=float(y)) for x, y in frame[:, :2]]
+
+
+def sequences():
+    clean = np.load(FIXTURE)
+    # Jitter wide enough to trip every form check and the palms warning along the way
+    noisy = clean.copy()
+    noisy[..., :2] += np.random.default_rng(3).normal(0, 0.06, noisy[..., :2].shape).astype(noisy.dtype)
+    return {'clean': clean, 'noisy': noisy}
+
+
+class CompiledPushupsTest(unittest.TestCase):
+    def baseline(self, frames, reps):
+        counter, image = BaselinePushups(), np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        results = []
+        for frame in frames:
+            completed = counter.pushups(image, as_landmarks(frame), reps)
+            results.append((counter.get_feedback(), counter.counter, counter.stage, completed))
+        return results
+
+    def test_matches_the_baseline_counter_frame_by_frame(self):
+        for name, frames in sequences().items():
+            for reps in (3, 1000):
+                with self.subTest(sequence=name, reps=reps):
+                    expected = self.baseline(frames, reps)
+                    exercise = Exercise('pushups')
+                    actual = []
+                    for frame in frames:
+                        completed = exercise.evaluate(as_landmarks(frame), WIDTH, HEIGHT, reps)
+                        actual.append((exercise.get_feedback(), exercise.counter, exercise.stage, completed))
+                    self.assertEqual(actual, expected)
+
+    def test_batch_matches_the_baseline_counter(self):
+        for name, frames in sequences().items():
+            with self.subTest(sequence=name):
+                expected = self.baseline(frames, 1000)
+                batch = Exercise('pushups').evaluate_batch(frames, WIDTH, HEIGHT, 1000)['frames']
+                self.assertEqual([(f['feedback'], f['count'], f['stage'], f['completed']) for f in batch], expected)
+
+    def test_sequences_exercise_every_branch(self):
+        # Guards the comparison above against a fixture that never errs or never counts
+        feedback = " ".join(result[0] for frames in sequences().values() for result in self.baseline(frames, 1000))
+        for message in EXERCISES['pushups'].messages + ("Push-up count",):
+            self.assertIn(message, feedback)
+
+
+def features(kind, **values):
+    plan = EXERCISES[kind]
+    row = np.zeros(len(plan.columns))
+    for name, value in values.items():
+        row[plan.columns[name]] = value
+    return row
+
+
+class RuleEngineTest(unittest.TestCase):
+    def test_compiled_features_match_the_scalar_helpers(self):
+        frames = np.load(FIXTURE)[:20]
+        plan = EXERCISES['squats']
+        batch = plan.features(plan.gather(frames), WIDTH, HEIGHT)
+        for frame, row in zip(frames, batch):
+            pts = np.trunc(frame[:, :2] * [WIDTH, HEIGHT])
+            self.assertAlmostEqual(row[plan.columns['knee_r']], calculate_angle(pts[24], pts[26], pts[28]))
+            self.assertEqual(row[plan.columns['hip_diff']], abs(pts[24][1] - pts[23][1]))
+
+    def test_squat_counts_on_the_way_up(self):
+        exercise = Exercise('squats')
+        exercise.step(features('squats', knee_r=90, knee_l=90, hip_r=80, hip_l=80), 10)
+        self.assertEqual((exercise.stage, exercise.counter), ('down', 0))
+        exercise.step(features('squats', knee_r=170, knee_l=170, hip_r=170, hip_l=170), 10)
+        self.assertEqual((exercise.stage, exercise.counter), ('up', 1))
+        self.assertEqual(exercise.get_feedback(), "Squat count: 1")
+
+    def test_blocking_check_holds_the_stage(self):
+        exercise = Exercise('squats')
+        exercise.step(features('squats', knee_r=90, knee_l=90, hip_r=30, hip_l=80), 10)
+        self.assertEqual(exercise.stage, 'up')
+        self.assertEqual(exercise.feedback, ["Keep your chest up!"])
+
+    def test_plank_counts_seconds_held_with_gaps_capped(self):
+        exercise = Exercise('planks')
+        straight = features('planks', body_r=175, body_l=175)
+        for timestamp in (0.0, 0.5, 1.0, 1.5, 10.0):
+            exercise.step(straight, 60, timestamp)
+        # 1.5 s of frames plus one gap capped at MAX_HOLD_GAP_SECONDS
+        self.assertEqual(exercise.counter, 2)
+        exercise.step(features('planks', body_r=120, body_l=175), 60, 10.5)
+        self.assertEqual(exercise.stage, 'rest')
+        self.assertEqual(exercise.counter, 2)
+
+    def test_state_round_trips_and_switching_exercise_starts_over(self):
+        exercise = Exercise('situps')
+        exercise.step(features('situps', hip_r=60, hip_l=60, knee_r=90, knee_l=90), 10)
+        restored = Exercise.from_dict(exercise.to_dict())
+        self.assertEqual((restored.kind, restored.counter, restored.stage), ('situps', 1, 'up'))
+        switched = Exercise.from_dict(exercise.to_dict(), 'squats')
+        self.assertEqual((switched.kind, switched.counter), ('squats', 0))
+        self.assertEqual(Exercise.from_dict({'counter': 4, 'stage': 'down'}).kind, 'pushups')
+        with self.assertRaises(ValueError):
+            Exercise('burpees')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import asyncio
+import time
+import unittest
+from unittest import mock
+
+from session_store import InMemorySessionStore, RedisSessionStore, SessionBusyError
+
+
+class FakeRedis:
+    """The few Redis commands RedisSessionStore uses, kept in a dict; share one between stores to act as one server.
+
+    Leases never expire on their own; ``pttl`` reports them as held for ``lease_ms``.
+    """
+
+    def __init__(self, lease_ms=30000):
+        self.data = {}
+        self.lease_ms = lease_ms
+        self.channels = {}  # channel -> set of subscribed queues
+        self.commands = []
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def setex(self, key, seconds, value):
+        self.data[key] = value
+
+    async def set(self, key, value, nx=False, px=None):
+        self.commands.append('set')
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+    async def pttl(self, key):
+        return self.lease_ms if key in self.data else -2
+
+    async def aclose(self):
+        pass
+
+    def pubsub(self):
+        return FakePubSub(self)
+
+    def register_script(self, script):
+        async def release(keys, args):
+            if self.data.get(keys[0]) == args[0]:
+                del self.data[keys[0]]
+                for queue in self.channels.get(args[1], ()):
+                    queue.put_nowait(args[0])
+                return 1
+            return 0
+        return release
+
+
+class FakePubSub:
+    def __init__(self, server):
+        self.server = server
+        self.queue = asyncio.Queue()
+
+    async def subscribe(self, channel):
+        self.server.channels.setdefault(channel, set()).add(self.queue)
+
+    async def unsubscribe(self, channel):
+        self.server.channels[channel].discard(self.queue)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=0.0):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def aclose(self):
+        pass
+
+
+async def increment(store, session_id, delay=0.01):
+    # Read-modify-write with an await in between, like a frame waiting for pose inference
+    async with store.lock(session_id):
+        state = await store.get(session_id) or {'count': 0}
+        await asyncio.sleep(delay)
+        await store.set(session_id, {'count': state['count'] + 1})
+
+
+class InMemorySessionStoreTest(unittest.TestCase):
+    def test_get_set_delete(self):
+        async def run():
+            store = InMemorySessionStore()
+            self.assertIsNone(await store.get('a'))
+            await store.set('a', {'count': 3})
+            self.assertEqual(await store.get('a'), {'count': 3})
+            await store.delete('a')
+            self.assertIsNone(await store.get('a'))
+
+        asyncio.run(run())
+
+    def test_evicts_least_recently_used(self):
+        async def run():
+            store = InMemorySessionStore(max_sessions=2)
+            await store.set('a', {})
+            await store.set('b', {})
+            await store.get('a')
+            await store.set('c', {})
+            self.assertIsNone(await store.get('b'))
+            self.assertEqual(len(store), 2)
+
+        asyncio.run(run())
+
+    def test_idle_sessions_expire(self):
+        async def run():
+            store = InMemorySessionStore(ttl_seconds=10)
+            await store.set('a', {'count': 1})
+            with mock.patch('session_store.time.monotonic', return_value=time.monotonic() + 11):
+                self.assertIsNone(await store.get('a'))
+
+        asyncio.run(run())
+
+    def test_lock_serializes_concurrent_frames(self):
+        store = InMemorySessionStore()
+
+        async def run():
+            await asyncio.gather(*(increment(store, 'a') for _ in range(5)))
+            self.assertEqual(await store.get('a'), {'count': 5})
+
+        asyncio.run(run())
+
+
+class RedisSessionStoreTest(unittest.TestCase):
+    def test_round_trips_state_as_json(self):
+        async def run():
+            store = RedisSessionStore("redis://unused", client=FakeRedis())
+            await store.set('a', {'count': 2, 'stage': 'up'})
+            self.assertEqual(await store.get('a'), {'count': 2, 'stage': 'up'})
+            await store.delete('a')
+            self.assertIsNone(await store.get('a'))
+
+        asyncio.run(run())
+
+    def test_lock_serializes_frames_across_processes(self):
+        # Two stores on one server stand in for two worker processes
+        server = FakeRedis()
+        stores = [RedisSessionStore("redis://unused", client=server) for _ in range(2)]
+
+        async def run():
+            await asyncio.gather(*(increment(stores[i % 2], 'a') for i in range(6)))
+            self.assertEqual(await stores[0].get('a'), {'count': 6})
+
+        asyncio.run(run())
+        self.assertFalse([key for key in server.data if 'lock' in key])
+        self.assertFalse([queue for queues in server.channels.values() for queue in queues])
+
+    def test_waiter_wakes_on_release_instead_of_polling(self):
+        server = FakeRedis()
+        holder = RedisSessionStore("redis://unused", client=server)
+        waiter = RedisSessionStore("redis://unused", client=server)
+
+        async def run():
+            await asyncio.gather(increment(holder, 'a', delay=0.3), increment(waiter, 'a'))
+
+        asyncio.run(run())
+        # The holder's SET, the waiter's first try, one retry after subscribing and one after the release
+        self.assertEqual(len(server.commands), 4)
+
+    def test_waiter_retries_when_the_lease_runs_out(self):
+        # A holder that died never publishes; the waiter retries once the lease's TTL has passed
+        server = FakeRedis(lease_ms=50)
+        waiter = RedisSessionStore("redis://unused", client=server)
+        server.data[waiter.lock_prefix + 'a'] = 'dead-holder'
+
+        async def run():
+            asyncio.get_running_loop().call_later(0.1, server.data.pop, waiter.lock_prefix + 'a')
+            async with waiter.lock('a'):
+                pass
+
+        asyncio.run(run())
+        self.assertLess(len(server.commands), 10)
+
+    def test_gives_up_after_lock_wait(self):
+        server = FakeRedis()
+        holder = RedisSessionStore("redis://unused", client=server)
+        waiter = RedisSessionStore("redis://unused", client=server, lock_wait=0.05)
+
+        async def run():
+            async with holder.lock('a'):
+                with self.assertRaises(SessionBusyError):
+                    async with waiter.lock('a'):
+                        pass
+
+        asyncio.run(run())
+
+    def test_expired_lease_is_not_released_by_its_old_holder(self):
+        server = FakeRedis()
+        store = RedisSessionStore("redis://unused", client=server)
+
+        async def run():
+            async with store.lock('a'):
+                # The lease expired and another worker took the lock
+                server.data[store.lock_prefix + 'a'] = 'other-holder'
+
+        asyncio.run(run())
+        self.assertEqual(server.data[store.lock_prefix + 'a'], 'other-holder')
+
+
+if __name__ == '__main__':
+    unittest.main()
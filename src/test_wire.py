@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+import wire
+
+
+def frame(**overrides):
+    result = {
+        'feedback': ["Keep your back straight!", "Push-up count: 7", "Exercise complete!"],
+        'count': 7,
+        'stage': 'down',
+        'exercise': 'pushups',
+        'tier': 'balanced',
+        'landmarks': np.random.default_rng(0).uniform(-1, 1.5, (33, 4)).astype(np.float32),
+        'skipped': False,
+        'completed': True,
+        'shed': False,
+        'image': None,
+    }
+    result.update(overrides)
+    return result
+
+
+class WireFormatTest(unittest.TestCase):
+    def test_float_round_trip(self):
+        original = frame(image=b"\xff\xd8jpeg")
+        decoded = wire.decode_frame(wire.encode_frame(original))
+        np.testing.assert_array_equal(decoded['landmarks'], original['landmarks'][:, :3])
+        for field in ('feedback', 'count', 'stage', 'exercise', 'tier', 'skipped', 'completed', 'shed', 'image'):
+            self.assertEqual(decoded[field], original[field], field)
+
+    def test_quantized_round_trip(self):
+        original = frame()
+        data = wire.encode_frame(original, quantize=True)
+        self.assertEqual(len(data), len(wire.encode_frame(original)) - 33 * 3 * 2)
+        decoded = wire.decode_frame(data)
+        np.testing.assert_allclose(decoded['landmarks'], original['landmarks'][:, :3], atol=0.5 / wire.QUANT_SCALE)
+
+    def test_flags_and_empty_pose(self):
+        original = frame(landmarks=None, feedback=["No landmarks detected!"], tier=None, skipped=True,
+                         completed=False, shed=True, exercise='planks', stage='hold', count=12)
+        data = wire.encode_frame(original, quantize=True)
+        self.assertEqual(len(data), wire.HEADER.size + 1 + 4)
+        decoded = wire.decode_frame(data)
+        self.assertIsNone(decoded['landmarks'])
+        self.assertIsNone(decoded['image'])
+        for field in ('feedback', 'count', 'stage', 'exercise', 'tier', 'skipped', 'completed', 'shed'):
+            self.assertEqual(decoded[field], original[field], field)
+
+    def test_count_message_follows_the_exercise(self):
+        decoded = wire.decode_frame(wire.encode_frame(frame(exercise='squats', stage='up', count=3,
+                                                            feedback=["Squat count: 3"])))
+        self.assertEqual(decoded['feedback'], ["Squat count: 3"])
+
+    def test_rejects_other_payloads(self):
+        with self.assertRaises(ValueError):
+            wire.decode_frame(b"XX" + wire.encode_frame(frame())[2:])
+
+    def test_negotiation(self):
+        self.assertTrue(wire.accepts_compact(f"{wire.MEDIA_TYPE}, application/json"))
+        self.assertFalse(wire.accepts_compact("application/json"))
+        self.assertFalse(wire.accepts_compact(None))
+        self.assertFalse(wire.accepts_compact(wire.MEDIA_TYPE, 'json'))
+        self.assertTrue(wire.accepts_compact(None, 'compact'))
+        with self.assertRaises(ValueError):
+            wire.accepts_compact(None, 'msgpack')
+
+    def test_code_tables_cover_every_message(self):
+        tables = wire.code_tables()
+        self.assertEqual(tables['version'], wire.WIRE_VERSION)
+        self.assertEqual(set(tables['exercises']), set(wire.EXERCISE_CODES))
+        self.assertLess(len(tables['feedback']), 256)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,206 @@
+import asyncio
+import os
+import sys
+import unittest
+from types import SimpleNamespace
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "spentbackend"))
+import leaderboard  # noqa: E402
+from memory_mongo import AsyncInMemoryDatabase  # noqa: E402
+from pymongo.errors import AutoReconnect, BulkWriteError  # noqa: E402
+
+from rules import EXERCISES  # noqa: E402
+from workouts import WorkoutRecorder  # noqa: E402
+
+
+class FlakyCollection:
+    """Wraps an in-memory collection; each write pops the next planned outcome.
+
+    None succeeds, 'down' fails before anything is written, 'lost_ack' writes
+    everything but raises as if the reply was lost, and a set of indexes
+    fails those requests and applies the rest.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.plan = []
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+    async def _run(self, method, items, ordered):
+        outcome = self.plan.pop(0) if self.plan else None
+        if outcome == 'down':
+            raise AutoReconnect("connection refused")
+        failing = outcome if isinstance(outcome, set) else set()
+        applied = [item for index, item in enumerate(items) if index not in failing]
+        if applied:
+            await getattr(self.collection, method)(applied, ordered=ordered)
+        if outcome == 'lost_ack':
+            raise AutoReconnect("connection reset")
+        if failing:
+            raise BulkWriteError({'writeErrors': [{'index': index, 'code': 121, 'errmsg': 'failed'} for index in sorted(failing)]})
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._run('bulk_write', requests, ordered)
+
+    async def insert_many(self, documents, ordered=True):
+        await self._run('insert_many', documents, ordered)
+
+
+def flaky_db():
+    db = AsyncInMemoryDatabase('test')
+    return SimpleNamespace(workouts=FlakyCollection(db['workouts']), user_stats=FlakyCollection(db['user_stats']),
+                           workout_events=FlakyCollection(db['workout_events']))
+
+
+def recorder_for(db):
+    # Large flush_size: only the explicit flush() calls write
+    return WorkoutRecorder(db, flush_size=10 ** 6, flush_interval=3600)
+
+
+def reps(db):
+    return sorted(event['rep'] for event in db.workout_events.documents if event['type'] == 'rep')
+
+
+class WorkoutRecorderTest(unittest.TestCase):
+    def test_flush_writes_summary_events_and_counters(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1', 'pushups')
+            state = {}
+            recorder.record_frame(workout_id, 'u1', 0, 2, ['Keep your back straight!'], state)
+            recorder.end_workout(workout_id, 'u1')
+            await recorder.flush()
+            self.assertEqual(recorder.pending, 0)
+
+            workout = await recorder.get_workout('u1', workout_id)
+            self.assertEqual((workout['exercise'], workout['session_id'], workout['total_reps']), ('pushups', 's1', 2))
+            self.assertIn('started_at', workout)
+            self.assertIn('ended_at', workout)
+            self.assertEqual([event['type'] for event in workout['events']], ['form_error', 'rep', 'rep'])
+            all_time = [doc for doc in db.user_stats.documents if doc['period'] == 'all']
+            self.assertEqual([doc['reps'] for doc in all_time], [2])
+
+        asyncio.run(run())
+
+    def test_other_exercises_do_not_count_as_pushups(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            pushups = recorder.start_workout('u1', 's1', 'pushups')
+            recorder.record_frame(pushups, 'u1', 0, 2, [], {}, exercise='pushups')
+            for kind in ('squats', 'situps'):
+                workout_id = recorder.start_workout('u1', 's1', kind)
+                recorder.record_frame(workout_id, 'u1', 0, 5, [], {}, exercise=kind)
+            await recorder.flush()
+
+            all_time = {doc['exercise']: doc['reps'] for doc in db.user_stats.documents if doc['period'] == 'all'}
+            self.assertEqual(all_time, {'pushups': 2, 'squats': 5, 'situps': 5})
+
+        asyncio.run(run())
+
+    def test_counted_exercises_match_the_rules(self):
+        self.assertEqual(set(leaderboard.EXERCISES), {name for name, plan in EXERCISES.items()
+                                                      if plan.definition.unit == 'reps'})
+        self.assertIn(leaderboard.DEFAULT_EXERCISE, leaderboard.EXERCISES)
+
+    def test_partial_event_failure_retries_only_the_failed_events(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1')
+            recorder.record_frame(workout_id, 'u1', 0, 3, [], {})
+            db.workout_events.plan = [{1}]
+            with self.assertRaises(BulkWriteError):
+                await recorder.flush()
+            self.assertEqual(reps(db), [1, 3])
+            await recorder.flush()
+            self.assertEqual(reps(db), [1, 2, 3])
+            self.assertEqual(recorder.pending, 0)
+
+        asyncio.run(run())
+
+    def test_events_written_before_a_lost_reply_are_not_duplicated(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1')
+            recorder.record_frame(workout_id, 'u1', 0, 2, [], {})
+            db.workout_events.plan = ['lost_ack']
+            with self.assertRaises(AutoReconnect):
+                await recorder.flush()
+            # The retry hits duplicate keys, which count as written, so the buffer drains
+            await recorder.flush()
+            self.assertEqual(reps(db), [1, 2])
+            self.assertEqual(recorder.pending, 0)
+            self.assertEqual(len(await recorder.list_workouts('u1')), 1)
+
+        asyncio.run(run())
+
+    def test_failed_summary_is_merged_into_a_newer_one(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1', 'squats')
+            recorder.record_frame(workout_id, 'u1', 0, 1, [], {}, exercise='squats')
+            db.workouts.plan = ['down']
+            with self.assertRaises(AutoReconnect):
+                await recorder.flush()
+            # A newer summary for the same workout is queued before the retry
+            recorder.record_frame(workout_id, 'u1', 1, 4, [], {}, exercise='squats')
+            await recorder.flush()
+
+            workouts = await recorder.list_workouts('u1')
+            self.assertEqual(len(workouts), 1)
+            workout = workouts[0]
+            self.assertEqual((workout['exercise'], workout['session_id'], workout['total_reps']), ('squats', 's1', 4))
+            self.assertIn('started_at', workout)
+
+        asyncio.run(run())
+
+    def test_partial_counter_failure_does_not_double_count(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1')
+            recorder.record_frame(workout_id, 'u1', 0, 3, [], {})
+            # One of the day/week/all counters fails; the others were incremented
+            db.user_stats.plan = [{0}]
+            with self.assertRaises(BulkWriteError):
+                await recorder.flush()
+            await recorder.flush()
+            self.assertEqual(sorted(doc['reps'] for doc in db.user_stats.documents), [3, 3, 3])
+            self.assertEqual(recorder.pending, 0)
+
+        asyncio.run(run())
+
+    def test_full_buffer_flush_is_kept_until_done(self):
+        async def run():
+            db = flaky_db()
+            recorder = WorkoutRecorder(db, flush_size=3, flush_interval=3600)
+            workout_id = recorder.start_workout('u1', 's1')
+            recorder.record_frame(workout_id, 'u1', 0, 3, [], {})
+            self.assertEqual(len(recorder._flushes), 1)
+            await recorder.close()
+            self.assertEqual(recorder._flushes, set())
+            self.assertEqual(reps(db), [1, 2, 3])
+
+        asyncio.run(run())
+
+    def test_reads_still_work_while_a_flush_fails(self):
+        async def run():
+            db = flaky_db()
+            recorder = recorder_for(db)
+            workout_id = recorder.start_workout('u1', 's1')
+            recorder.record_frame(workout_id, 'u1', 0, 1, [], {})
+            db.workouts.plan = ['down']
+            self.assertEqual(await recorder.list_workouts('u1'), [])
+            self.assertGreater(recorder.pending, 0)
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
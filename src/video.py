@@ -0,0 +1,239 @@
+import contextlib
+import functools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from exercise import Exercise
+from rules import DEFAULT_EXERCISE, FORM_ERRORS
+
+# Marks the end of the decoded frame stream
+_END = object()
+
+# Set in each video worker process: (job_id, progress) messages for the API process
+_progress = None
+
+
+def _read_frames(capture, step: int, frames: queue.Queue, stop: threading.Event):
+    # Decode every `step`-th frame; skipped frames are only grabbed, not retrieved
+    index = 0
+    try:
+        while not stop.is_set():
+            if index % step:
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                frames.put((index, frame))
+            index += 1
+    finally:
+        frames.put(_END)
+
+
+def analyze_video(path: str, sample_fps: float = 10, reps: int = 10, progress: Optional[Callable[[float], None]] = None,
+                  kind: str = DEFAULT_EXERCISE) -> Dict:
+    """Count reps (or hold time) of one exercise in a video file and return a per-rep timeline.
+
+    Frames are decoded on a reader thread and handed to pose estimation
+    through a small bounded queue, so decoding overlaps with inference and
+    only a few frames are ever held in memory.
+    """
+    # Loaded here so only the video worker processes pay for them
+    import cv2
+    import mediapipe as mp
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError("Could not open video")
+
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or 0
+    step = max(1, round(fps / sample_fps)) if sample_fps else 1
+
+    frames = queue.Queue(maxsize=4)
+    stop = threading.Event()
+    reader = threading.Thread(target=_read_frames, args=(capture, step, frames, stop), daemon=True)
+    reader.start()
+
+    exercise = Exercise(kind)
+    rep_timeline = []
+    form_errors = set()
+    analyzed = 0
+    without_landmarks = 0
+    completed = False
+    try:
+        with mp.solutions.pose.Pose() as pose:
+            while True:
+                item = frames.get()
+                if item is _END:
+                    break
+                index, frame = item
+                analyzed += 1
+
+                result = pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                if result.pose_landmarks:
+                    landmarks = np.array([(lm.x, lm.y) for lm in result.pose_landmarks.landmark])
+                    previous = exercise.counter
+                    completed = exercise.evaluate(landmarks, frame.shape[1], frame.shape[0], reps, timestamp=index / fps)
+                    form_errors.update(f for f in exercise.feedback if f in FORM_ERRORS)
+                    if exercise.counter != previous:
+                        rep_timeline.append({
+                            'rep': exercise.counter,
+                            'frame': index,
+                            'time': round(index / fps, 3),
+                            'form_errors': sorted(form_errors),
+                        })
+                        form_errors = set()
+                else:
+                    without_landmarks += 1
+
+                if progress and total_frames:
+                    progress(min(1.0, (index + 1) / total_frames))
+    finally:
+        stop.set()
+        # Unblock the reader if it is waiting on a full queue
+        while reader.is_alive():
+            try:
+                frames.get_nowait()
+            except queue.Empty:
+                reader.join(timeout=0.1)
+        capture.release()
+
+    return {
+        'count': exercise.counter,
+        'completed': completed,
+        'duration': round(total_frames / fps, 3) if total_frames else None,
+        'frames_analyzed': analyzed,
+        'frames_without_landmarks': without_landmarks,
+        'reps': rep_timeline,
+    }
+
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+
+
+def _run_job(job_id: str, path: str, sample_fps: float, reps: int, kind: str) -> Dict:
+    reported = [0.0]
+
+    def report(progress: float):
+        # Whole percents are plenty for polling clients and keep the queue quiet
+        progress = round(progress, 2)
+        if progress > reported[0]:
+            reported[0] = progress
+            _progress.put((job_id, progress))
+
+    _progress.put((job_id, 0.0))
+    return analyze_video(path, sample_fps, reps, progress=report, kind=kind)
+
+
+class VideoJobManager:
+    """Runs video analyses in background worker processes and keeps their status for polling.
+
+    The workers are separate from the pose pool, so long videos never hold
+    up live frames, and cv2/MediaPipe are only loaded in them, never in the
+    API process. Progress comes back over a queue read by a listener thread.
+    """
+
+    def __init__(self, workers: int = None, ttl_seconds: float = None):
+        self.workers = workers or int(os.getenv("VIDEO_WORKERS", "1"))
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else float(os.getenv("VIDEO_JOB_TTL_SECONDS", "3600"))
+        self._context = multiprocessing.get_context("spawn")
+        self._progress = self._context.Queue()
+        self._executor = self._create_executor()
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._context,
+                                   initializer=_init_worker, initargs=(self._progress,))
+
+    def submit(self, path: str, sample_fps: float, reps: int, kind: str = DEFAULT_EXERCISE) -> Dict:
+        """Queue an analysis of the video at ``path``; the job deletes the file when it finishes."""
+        self._expire()
+        job_id = uuid.uuid4().hex
+        job = {'job_id': job_id, 'status': 'queued', 'progress': 0.0, 'result': None, 'error': None, 'finished_at': None}
+        with self._lock:
+            self._jobs[job_id] = job
+            executor = self._executor
+        try:
+            future = executor.submit(_run_job, job_id, path, sample_fps, reps, kind)
+        except BrokenProcessPool:
+            executor = self._restart(executor)
+            future = executor.submit(_run_job, job_id, path, sample_fps, reps, kind)
+        except Exception:
+            with self._lock:
+                del self._jobs[job_id]
+            raise
+        future.add_done_callback(functools.partial(self._finish, job, path, executor))
+        return dict(job)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        # A worker that died (e.g. OOM on a huge video) breaks the executor for good
+        with self._lock:
+            if self._executor is broken:
+                broken.shutdown(wait=False, cancel_futures=True)
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _listen(self):
+        while True:
+            message = self._progress.get()
+            if message is None:
+                return
+            job_id, progress = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # Progress can arrive after the job finished; never move a finished job back
+                if job is not None and job['finished_at'] is None:
+                    job['status'] = 'running'
+                    job['progress'] = progress
+
+    def _finish(self, job: Dict, path: str, executor: ProcessPoolExecutor, future):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        if future.cancelled():
+            error, result = "Cancelled", None
+        else:
+            error = future.exception()
+            result = None if error else future.result()
+        if isinstance(error, BrokenProcessPool):
+            self._restart(executor)
+            error = "Video worker exited unexpectedly"
+        with self._lock:
+            if error:
+                job['error'] = str(error)
+                job['status'] = 'failed'
+            else:
+                job['result'] = result
+                job['progress'] = 1.0
+                job['status'] = 'done'
+            job['finished_at'] = time.monotonic()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        with self._lock:
+            for job_id in [j for j, job in self._jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]:
+                del self._jobs[job_id]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._progress.put(None)
@@ -0,0 +1,137 @@
+"""Compact binary encoding of frame results (``application/x-pushup-frame``).
+
+Every message is little-endian and laid out as::
+
+    offset  size      field
+    0       2         magic b"PF"
+    2       1         version (WIRE_VERSION)
+    3       1         flags: 1 landmarks quantized, 2 skipped by the motion gate,
+                      4 exercise completed, 8 shed by admission control (with 2)
+    4       4         count (uint32; seconds held for timed exercises)
+    8       1         exercise code (index into EXERCISE_CODES)
+    9       1         stage code (index into STAGE_CODES)
+    10      1         tier code (index into TIER_CODES, 255 if none)
+    11      1         F, number of feedback codes
+    12      1         N, number of landmarks (33, or 0 when no pose was found)
+    13      3         reserved
+    16      N*3*4     landmarks as float32 x, y, z rows, or
+            N*3*2     int16 rows of round(value * QUANT_SCALE) when quantized
+    ...     F         feedback codes (index into FEEDBACK_CODES; COUNT_CODE is the
+                      exercise's count message, formatted with the count)
+    ...     4         image length L (uint32, 0 if none)
+    ...     L         annotated JPEG
+
+The code tables are served by ``GET /wire-format`` so clients never hard-code them.
+"""
+import struct
+
+import numpy as np
+
+from pose_pool import QUALITY_TIERS
+from rules import EXERCISES, FORM_ERRORS
+
+MEDIA_TYPE = "application/x-pushup-frame"
+WIRE_VERSION = 1
+MAGIC = b"PF"
+HEADER = struct.Struct("<2sBBIBBBBB3x")
+
+FLAG_QUANTIZED, FLAG_SKIPPED, FLAG_COMPLETED, FLAG_SHED = 1, 2, 4, 8
+
+# int16 quantization covers [-2, 2) in normalized coordinates at ~6e-5 resolution
+QUANT_SCALE = 16384
+
+EXERCISE_CODES = tuple(EXERCISES)
+STAGE_CODES = tuple(dict.fromkeys(
+    stage
+    for compiled in EXERCISES.values()
+    for transition in compiled.definition.transitions
+    for stage in (transition.source, transition.target)
+))
+TIER_CODES = tuple(QUALITY_TIERS)
+NO_TIER = 255
+COUNT_CODE = 0
+FEEDBACK_CODES = ("{count}", "Exercise complete!", "No landmarks detected!") + FORM_ERRORS
+_FEEDBACK_INDEX = {message: code for code, message in enumerate(FEEDBACK_CODES)}
+
+
+def code_tables() -> dict:
+    return {
+        'media_type': MEDIA_TYPE,
+        'version': WIRE_VERSION,
+        'quant_scale': QUANT_SCALE,
+        'exercises': {name: {'code': code, 'count_message': EXERCISES[name].definition.count_message,
+                             'unit': EXERCISES[name].definition.unit}
+                      for code, name in enumerate(EXERCISE_CODES)},
+        'stages': list(STAGE_CODES),
+        'tiers': list(TIER_CODES),
+        'feedback': list(FEEDBACK_CODES),
+    }
+
+
+def accepts_compact(accept: str = None, encoding: str = None) -> bool:
+    """True if the client asked for the compact encoding by query flag or Accept header."""
+    if encoding is not None:
+        if encoding not in ('json', 'compact'):
+            raise ValueError(f"Unknown encoding: {encoding}")
+        return encoding == 'compact'
+    return bool(accept) and MEDIA_TYPE in accept
+
+
+def encode_frame(frame: dict, quantize: bool = False) -> bytes:
+    """Pack a frame result from ``analyze_frame`` without building per-landmark objects."""
+    landmarks = frame['landmarks']
+    if landmarks is None:
+        body = b""
+        count_landmarks = 0
+    elif quantize:
+        body = np.clip(np.rint(landmarks[:, :3] * QUANT_SCALE), -32768, 32767).astype('<i2').tobytes()
+        count_landmarks = len(landmarks)
+    else:
+        body = np.ascontiguousarray(landmarks[:, :3], dtype='<f4').tobytes()
+        count_landmarks = len(landmarks)
+
+    # Only the count message varies between frames, so anything unknown is the count message
+    feedback = bytes(_FEEDBACK_INDEX.get(message, COUNT_CODE) for message in frame['feedback'])
+    flags = ((FLAG_QUANTIZED if quantize and landmarks is not None else 0)
+             | (FLAG_SKIPPED if frame.get('skipped') else 0)
+             | (FLAG_COMPLETED if frame.get('completed') else 0)
+             | (FLAG_SHED if frame.get('shed') else 0))
+    tier = TIER_CODES.index(frame['tier']) if frame.get('tier') in TIER_CODES else NO_TIER
+    image = frame.get('image') or b""
+    header = HEADER.pack(MAGIC, WIRE_VERSION, flags, frame['count'], EXERCISE_CODES.index(frame['exercise']),
+                         STAGE_CODES.index(frame['stage']), tier, len(feedback), count_landmarks)
+    return b"".join((header, body, feedback, struct.pack("<I", len(image)), image))
+
+
+def decode_frame(data: bytes) -> dict:
+    """Inverse of ``encode_frame``; used by the Python load-test client and benchmarks."""
+    magic, version, flags, count, exercise, stage, tier, count_feedback, count_landmarks = HEADER.unpack_from(data)
+    if magic != MAGIC or version != WIRE_VERSION:
+        raise ValueError("Not a compact frame message")
+    offset = HEADER.size
+    landmarks = None
+    if count_landmarks:
+        if flags & FLAG_QUANTIZED:
+            landmarks = np.frombuffer(data, '<i2', count_landmarks * 3, offset).reshape(-1, 3) / QUANT_SCALE
+            offset += count_landmarks * 6
+        else:
+            landmarks = np.frombuffer(data, '<f4', count_landmarks * 3, offset).reshape(-1, 3)
+            offset += count_landmarks * 12
+    codes = data[offset:offset + count_feedback]
+    offset += count_feedback
+    (image_length,) = struct.unpack_from("<I", data, offset)
+    offset += 4
+    name = EXERCISE_CODES[exercise]
+    count_message = EXERCISES[name].definition.count_message
+    return {
+        'feedback': [count_message.format(count=count) if code == COUNT_CODE else FEEDBACK_CODES[code] for code in codes],
+        'count': count,
+        'stage': STAGE_CODES[stage],
+        'exercise': name,
+        'tier': None if tier == NO_TIER else TIER_CODES[tier],
+        'landmarks': landmarks,
+        'skipped': bool(flags & FLAG_SKIPPED),
+        'completed': bool(flags & FLAG_COMPLETED),
+        'shed': bool(flags & FLAG_SHED),
+        'image': data[offset:offset + image_length] or None,
+    }
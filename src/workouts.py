@@ -0,0 +1,244 @@
+import asyncio
+import logging
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from leaderboard import PERIODS, board_name, period_key
+from rules import DEFAULT_EXERCISE, FORM_ERRORS
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_KEY = 11000
+
+
+class WorkoutRecorder:
+    """Buffers workout sessions, reps and form-error events and writes them in batches.
+
+    Nothing is written per frame: events accumulate in memory and are flushed
+    with one ``insert_many`` for events and one ``bulk_write`` of workout
+    summaries whenever ``flush_size`` events are pending or every
+    ``flush_interval`` seconds, and once more on shutdown. Summary updates use
+    ``$max``/``$min`` so flushes from several workers for the same workout
+    converge on the same document.
+
+    A failed flush re-queues only the writes the server reported as not
+    applied, so a counter ``$inc`` that landed is not applied again. Only
+    when a batch got no reply at all (e.g. the connection dropped) is all of
+    it retried. Events carry their ``_id`` from the moment they are buffered,
+    so a retried insert of an event that did land is a duplicate-key error
+    and is dropped. A failed summary is merged into any newer one for the
+    same workout.
+
+    Reps also feed per-user, per-exercise day/week/all-time counters in
+    ``user_stats`` (one ``$inc`` per user, exercise and period per flush)
+    and, when a shared ``leaderboard`` is given, its sorted boards.
+    """
+
+    def __init__(self, db, flush_size: int = None, flush_interval: float = None, max_buffer: int = None, leaderboard=None):
+        self.db = db
+        self.leaderboard = leaderboard
+        self.flush_size = flush_size or int(os.getenv("WORKOUT_FLUSH_SIZE", "500"))
+        self.flush_interval = flush_interval or float(os.getenv("WORKOUT_FLUSH_INTERVAL", "5"))
+        self.max_buffer = max_buffer or int(os.getenv("WORKOUT_MAX_BUFFER", "50000"))
+        self._events = []
+        self._summaries = {}  # workout_id -> update document
+        self._stats = Counter()  # (user_id, exercise, period, key) -> reps
+        self._flush_lock = asyncio.Lock()
+        self._task = None
+        self._flushes = set()  # Size-triggered flushes in flight; the loop only keeps weak references to tasks
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final workout flush failed; %d buffered writes lost", self.pending)
+
+    @property
+    def pending(self) -> int:
+        return len(self._events) + len(self._summaries) + len(self._stats)
+
+    def start_workout(self, user_id: str, session_id: str, exercise: str = DEFAULT_EXERCISE, unit: str = 'reps') -> str:
+        workout_id = uuid.uuid4().hex
+        now = datetime.now(timezone.utc)
+        self._summaries[workout_id] = {
+            '$setOnInsert': {'user_id': user_id, 'session_id': session_id, 'exercise': exercise, 'unit': unit},
+            '$min': {'started_at': now},
+            '$max': {'last_activity_at': now, 'total_reps': 0},
+        }
+        return workout_id
+
+    def record_frame(self, workout_id: str, user_id: str, previous_count: int, count: int, feedback: list, state: dict,
+                     unit: str = 'reps', exercise: str = DEFAULT_EXERCISE):
+        """Record the events produced by one evaluated frame.
+
+        ``state`` is the session state dict; it carries the form errors seen
+        since the last rep and the previous frame's errors between frames.
+        Timed exercises (``unit='seconds'``) only update the workout summary.
+        """
+        now = datetime.now(timezone.utc)
+        errors = sorted(message for message in feedback if message in FORM_ERRORS)
+        if errors and errors != state.get('last_form_errors'):
+            # Only transitions are recorded, not every frame that shows the same error
+            self._add_event({'workout_id': workout_id, 'user_id': user_id, 'type': 'form_error', 'errors': errors, 'at': now})
+        state['last_form_errors'] = errors
+        state['form_errors'] = sorted(set(state.get('form_errors', [])) | set(errors))
+
+        for rep in range(previous_count + 1, count + 1) if unit == 'reps' else ():
+            self._add_event({'workout_id': workout_id, 'user_id': user_id, 'type': 'rep', 'rep': rep,
+                             'form_errors': state['form_errors'], 'at': now})
+            state['form_errors'] = []
+        if unit == 'reps' and count > previous_count:
+            for period in PERIODS:
+                self._stats[(user_id, exercise, period, period_key(period, now))] += count - previous_count
+
+        summary = self._summaries.setdefault(workout_id, {'$setOnInsert': {'user_id': user_id}})
+        summary.setdefault('$max', {}).update({'last_activity_at': now, 'total_reps': count})
+
+    def end_workout(self, workout_id: str, user_id: str):
+        summary = self._summaries.setdefault(workout_id, {'$setOnInsert': {'user_id': user_id}})
+        summary.setdefault('$max', {})['ended_at'] = datetime.now(timezone.utc)
+        self._schedule_flush_if_full()
+
+    def _add_event(self, event):
+        # Assigned here, not by the driver, so a retried insert can't write the event twice
+        event['_id'] = ObjectId()
+        if len(self._events) >= self.max_buffer:
+            # Mongo has been unreachable for a while; drop the oldest events rather than grow without bound
+            del self._events[: len(self._events) - self.max_buffer + 1]
+            logger.warning("Workout event buffer full, dropping oldest events")
+        self._events.append(event)
+        self._schedule_flush_if_full()
+
+    def _schedule_flush_if_full(self):
+        if self.pending >= self.flush_size and not self._flushes and not self._flush_lock.locked():
+            task = asyncio.get_running_loop().create_task(self._flush_logged())
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self._flush_logged()
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Workout flush failed; will retry")
+
+    async def flush(self):
+        async with self._flush_lock:
+            events, self._events = self._events, []
+            summaries, self._summaries = self._summaries, {}
+            stats, self._stats = self._stats, Counter()
+            errors = []
+            if summaries:
+                failed = await self._bulk_write(self.db.workouts, list(summaries), [
+                    UpdateOne({'workout_id': workout_id}, update, upsert=True) for workout_id, update in summaries.items()
+                ], errors)
+                for workout_id in failed:
+                    self._requeue_summary(workout_id, summaries[workout_id])
+            if stats:
+                now = datetime.now(timezone.utc)
+                failed = await self._bulk_write(self.db.user_stats, list(stats), [
+                    UpdateOne({'user_id': user_id, 'exercise': exercise, 'period': period, 'key': key},
+                              {'$inc': {'reps': reps}, '$set': {'updated_at': now}}, upsert=True)
+                    for (user_id, exercise, period, key), reps in stats.items()
+                ], errors)
+                # Counters that were incremented must not be incremented again by the retry
+                retry = Counter({key: stats[key] for key in failed})
+                self._stats.update(retry)
+                await self._update_leaderboard(stats - retry)
+            if events:
+                failed = await self._insert_events(events, errors)
+                # Retried events go back in front of the ones buffered meanwhile
+                self._events[:0] = failed
+            if errors:
+                raise errors[0]
+
+    @staticmethod
+    async def _bulk_write(collection, keys: list, requests: list, errors: list) -> list:
+        """Run an unordered bulk write; return the keys of the requests that did not apply."""
+        try:
+            await collection.bulk_write(requests, ordered=False)
+            return []
+        except BulkWriteError as e:
+            errors.append(e)
+            return [keys[error['index']] for error in e.details.get('writeErrors', [])]
+        except Exception as e:
+            # Nothing is known about what reached the server; retry everything
+            errors.append(e)
+            return keys
+
+    async def _insert_events(self, events: list, errors: list) -> list:
+        """Insert buffered events; return the ones to retry."""
+        try:
+            await self.db.workout_events.insert_many(events, ordered=False)
+            return []
+        except BulkWriteError as e:
+            # A duplicate key means an earlier, seemingly failed attempt did insert the event
+            failed = [error['index'] for error in e.details.get('writeErrors', []) if error.get('code') != DUPLICATE_KEY]
+            if failed:
+                errors.append(e)
+            return [events[index] for index in failed]
+        except Exception as e:
+            errors.append(e)
+            return events
+
+    def _requeue_summary(self, workout_id: str, update: dict):
+        # A summary queued since the failed flush must not replace the failed one: merge them
+        pending = self._summaries.get(workout_id)
+        if pending is None:
+            self._summaries[workout_id] = update
+            return
+        for field, value in update.get('$setOnInsert', {}).items():
+            pending.setdefault('$setOnInsert', {}).setdefault(field, value)
+        for operator, pick in (('$min', min), ('$max', max)):
+            target = pending.setdefault(operator, {})
+            for field, value in update.get(operator, {}).items():
+                target[field] = pick(target[field], value) if field in target else value
+
+    async def _update_leaderboard(self, stats):
+        if self.leaderboard is None:
+            return
+        increments = [(board_name(exercise, period, key), user_id, reps)
+                      for (user_id, exercise, period, key), reps in stats.items()]
+        try:
+            # The Redis client is synchronous; keep its round-trip off the event loop
+            await asyncio.to_thread(self.leaderboard.incr_many, increments)
+        except Exception:
+            # user_stats is the durable copy; boards can be rebuilt from it, so don't re-queue
+            logger.exception("Leaderboard update failed")
+
+    async def list_workouts(self, user_id: str, limit: int = 20, before: datetime = None):
+        # Read your own writes when possible; a failed flush is retried later and must not fail the read
+        await self._flush_logged()
+        query = {'user_id': user_id}
+        if before is not None:
+            query['started_at'] = {'$lt': before}
+        cursor = self.db.workouts.find(query, {'_id': 0}).sort('started_at', -1).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    async def get_workout(self, user_id: str, workout_id: str):
+        await self._flush_logged()
+        workout = await self.db.workouts.find_one({'workout_id': workout_id, 'user_id': user_id}, {'_id': 0})
+        if workout is None:
+            return None
+        cursor = self.db.workout_events.find({'workout_id': workout_id}, {'_id': 0, 'workout_id': 0, 'user_id': 0}).sort('at', 1)
+        workout['events'] = await cursor.to_list(length=None)
+        return workout